@@ -1,4 +1,15 @@
 from __future__ import annotations
 
+from typing import Any
+
 __version__ = "0.0.0"
 __hash__ = ""
+
+
+def __getattr__(name: str) -> Any:
+    # lazy, so importing pytest_tdd stays cheap
+    if name == "run_module":
+        from pytest_tdd.aio import run_module
+
+        return run_module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,182 @@
+"""
+Asyncio API to run the tests of a module (without blocking the event loop).
+
+Example:
+    >>> import pytest_tdd
+    >>> result = await pytest_tdd.run_module(Path("src/package/module.py"))
+    >>> result.returncode
+    0
+
+    # or, streaming the per test events
+    >>> async for event in pytest_tdd.aio.iter_module(Path("src/package/module.py")):
+    ...     print(event.nodeid, event.outcome)
+    tests/test_module.py::test_one PASSED
+    tests/test_module.py::test_two FAILED
+
+Concurrent runs can share an asyncio.Semaphore to limit the number of
+children (see `run_modules`); cancelling a run kills its child process.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import dataclasses as dc
+import re
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, Callable, Sequence
+
+from pytest_tdd import runner, tdd
+
+# pytest -vv reports a line per test as "<nodeid> <OUTCOME> [ nn%]"
+OUTCOME = re.compile(r"^(?P<nodeid>\S+::.+?) (?P<outcome>PASSED|FAILED|ERROR|SKIPPED|XFAIL|XPASS)\b")
+
+
+@dc.dataclass
+class Event:
+    kind: str  # "test" for each test outcome, "done" at the end of the run
+    nodeid: str = ""
+    outcome: str = ""
+    result: runner.Result | None = None
+
+
+class AsyncEngine(runner.SubprocessEngine):
+    """runs pytest using asyncio.create_subprocess_exec"""
+
+    async def aexecute(self, unit: runner.Unit, on_event: Callable[[Event], None] | None = None) -> runner.Result:
+        xmlout = unit.workdir / "xmlout.xml"
+        coverage = unit.workdir / "coverage.json"
+
+        cmd = self.command(unit)
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=None if unit.cwd is None else str(unit.cwd),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=self.environ(unit),
+        )
+
+        async def stdout() -> str:
+            assert proc.stdout
+            lines = []
+            async for raw in proc.stdout:
+                line = raw.decode("utf-8", errors="replace")
+                lines.append(line)
+                if on_event and (match := OUTCOME.search(line)):
+                    on_event(Event("test", match.group("nodeid"), match.group("outcome")))
+            return "".join(lines)
+
+        async def stderr() -> str:
+            assert proc.stderr
+            return (await proc.stderr.read()).decode("utf-8", errors="replace")
+
+        try:
+            out, err, _ = await asyncio.gather(stdout(), stderr(), proc.wait())
+        except asyncio.CancelledError:
+            with contextlib.suppress(ProcessLookupError):
+                proc.kill()
+            await proc.wait()
+            raise
+
+        (unit.workdir / "stdout.txt").write_text(out)
+        (unit.workdir / "stderr.txt").write_text(err)
+        assert proc.returncode is not None
+        return runner.Result(
+            unit,
+            proc.returncode,
+            cmd,
+            out,
+            err,
+            xmlout.read_text() if xmlout.exists() else None,
+            coverage.read_text() if coverage.exists() else None,
+            datafile=self.datafile(unit),
+            outcomes=self.outcomes(unit),
+            collected=self.collected(unit),
+            # asyncio doesn't expose the child rusage
+            memory=self.memory_usage(unit, None),
+            limit=self.limit(proc.returncode, out + err),
+        )
+
+
+async def run_module(
+    source: Path,
+    sources_dirs: Sequence[Path] = (Path("src"),),
+    tests_dirs: Sequence[Path] = (Path("tests"),),
+    workdir: Path | None = None,
+    semaphore: asyncio.Semaphore | None = None,
+    on_event: Callable[[Event], None] | None = None,
+    engine: AsyncEngine | None = None,
+) -> runner.Result:
+    """
+    Runs the tests for source (a module or a test file).
+
+    Args:
+        source: the module (or the test) to run tests for.
+        sources_dirs: the sources roots.
+        tests_dirs: the tests roots.
+        workdir: where to store the run outputs (a temporary directory if None).
+        semaphore: to limit the concurrent runs.
+        on_event: called with an Event for each test outcome.
+        engine: the AsyncEngine to use.
+
+    Returns:
+        The runner.Result.
+
+    """
+    resolver = tdd.Resolver(
+        [Path(p).absolute() for p in sources_dirs], [Path(p).absolute() for p in tests_dirs]
+    )
+    engine = engine or AsyncEngine()
+    async with semaphore or contextlib.AsyncExitStack():
+        # the temporary directory goes away on errors and cancellation too (keeping the error as is)
+        with contextlib.ExitStack() as stack:
+            tmpdir = (workdir or Path(stack.enter_context(tempfile.TemporaryDirectory()))).absolute()
+            unit = runner.Runner(resolver).plan([Path(source)], tmpdir)[0]
+            result = await engine.aexecute(unit, on_event)
+    if on_event:
+        on_event(Event("done", result=result))
+    return result
+
+
+async def iter_module(source: Path, **kwargs: object) -> AsyncIterator[Event]:
+    """
+    Runs the tests for source, yielding an Event per test outcome.
+
+    The last event is a "done" one, carrying the run result. The keyword
+    arguments are the same as `run_module`.
+    """
+    queue: asyncio.Queue[Event] = asyncio.Queue()
+    task = asyncio.ensure_future(run_module(source, on_event=queue.put_nowait, **kwargs))  # type: ignore[arg-type]
+    try:
+        while True:
+            if task.done() and queue.empty():
+                # the run failed before sending the "done" event
+                task.result()
+                break
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait([getter, task], return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done:
+                getter.cancel()
+                continue
+            event = getter.result()
+            yield event
+            if event.kind == "done":
+                break
+    finally:
+        if not task.done():
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+
+async def run_modules(sources: Sequence[Path], concurrency: int = 4, **kwargs: object) -> list[runner.Result]:
+    """
+    Runs the tests for many sources, at most concurrency at the time.
+
+    The keyword arguments are the same as `run_module`.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    return list(
+        await asyncio.gather(*(run_module(source, semaphore=semaphore, **kwargs) for source in sources))  # type: ignore[arg-type]
+    )
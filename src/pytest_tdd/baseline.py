@@ -0,0 +1,237 @@
+"""
+Per module baselines (coverage, memory) and the gates.
+
+The baselines are the last accepted values of a metric (eg. the coverage
+percent) for each module, stored in a small sqlite database (under the cache
+directory). They are read and written in bulk: a batch run over thousands of
+modules costs a handful of queries, not one per module.
+
+The `Gate` is a runner sink collecting the coverage of each run source;
+once the run is over `Gate.check` returns the sources failing the gate:
+
+    - below the (global) threshold
+    - in no regression mode, below their own baseline
+
+The `MemoryGate` does the same with the peak memory (going above the
+baseline, with some tolerance, is a regression).
+
+Example:
+    >>> with Baselines(Path(".pytest-tdd/baselines.sqlite")) as baselines:
+    ...     gate = Gate(threshold=50.0, baselines=baselines)
+    ...     runner.Runner(resolver, sinks=[gate]).run(sources, workdir)
+    ...     gate.check()
+    [Failure(key='src/package/module.py', percent=40.0, expected=50.0, reason='threshold')]
+"""
+
+from __future__ import annotations
+
+import dataclasses as dc
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Mapping
+
+from pytest_tdd import index
+
+if TYPE_CHECKING:
+    import types
+
+    from pytest_tdd import runner
+
+log = logging.getLogger(__name__)
+
+# sqlite default SQLITE_MAX_VARIABLE_NUMBER (in older versions)
+BATCH = 999
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+    metric TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value REAL NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (metric, key)
+)
+"""
+
+
+class Baselines:
+    """the per module baselines of a metric, in a sqlite database"""
+
+    def __init__(self, path: Path, metric: str = "coverage") -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.metric = metric
+        self.db = sqlite3.connect(str(path))
+        self.db.execute(SCHEMA)
+        self.db.commit()
+
+    def get(self, keys: Iterable[str]) -> dict[str, float]:
+        """returns the baselines for keys (missing keys are left out)"""
+        keys = list(keys)
+        result: dict[str, float] = {}
+        for start in range(0, len(keys), BATCH - 1):
+            chunk = keys[start : start + BATCH - 1]
+            marks = ",".join("?" * len(chunk))
+            query = f"SELECT key, value FROM metrics WHERE metric = ? AND key IN ({marks})"  # noqa: S608
+            result.update(self.db.execute(query, [self.metric, *chunk]).fetchall())
+        return result
+
+    def update(self, values: Mapping[str, float]) -> None:
+        """sets the baselines for all the keys in values (in a single transaction)"""
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO metrics (metric, key, value, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(metric, key) DO UPDATE SET value = excluded.value, updated = excluded.updated",
+                [(self.metric, key, value, now) for key, value in values.items()],
+            )
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self) -> Baselines:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: types.TracebackType | None,
+    ) -> None:
+        self.close()
+
+
+@dc.dataclass
+class Failure:
+    key: str
+    percent: float  # the measured value
+    expected: float
+    reason: str  # "threshold" or "regression"
+
+
+class Gate:
+    """
+    A runner sink failing the sources with a low coverage.
+
+    Args:
+        threshold: the minimum coverage percent (if any).
+        baselines: the coverage baselines (needed for no_regression).
+        no_regression: fail the sources whose coverage dropped below their baseline.
+        rootdir: the baselines keys are the sources paths relative to it.
+
+    """
+
+    metric = "coverage"
+    unit = "%"
+
+    def __init__(
+        self,
+        threshold: float | None = None,
+        baselines: Baselines | None = None,
+        no_regression: bool = False,
+        rootdir: Path | None = None,
+    ) -> None:
+        if no_regression and baselines is None:
+            raise ValueError("no regression mode needs the baselines")
+        self.threshold = threshold
+        self.baselines = baselines
+        self.no_regression = no_regression
+        self.rootdir = (rootdir or Path.cwd()).absolute()
+        self.seen: dict[str, float] = {}
+
+    def value(self, summary: runner.Summary) -> float | None:
+        """the gated value from summary"""
+        return summary.coverage["percent"] if summary.coverage else None
+
+    def worse(self, value: float, expected: float) -> bool:
+        """True if value is worse than expected"""
+        return value < expected
+
+    def better(self, value: float, expected: float) -> bool:
+        """True if value is better than expected (and becomes the new baseline)"""
+        return value > expected
+
+    def __call__(self, result: runner.Result, summary: runner.Summary) -> None:
+        if (value := self.value(summary)) is not None:
+            self.seen[index.relpath(result.unit.source, self.rootdir)] = value
+
+    def check(self) -> list[Failure]:
+        """returns the failing sources, recording the new baselines for the others"""
+        failures: list[Failure] = []
+        if self.threshold is not None:
+            failures.extend(
+                Failure(key, value, self.threshold, "threshold")
+                for key, value in self.seen.items()
+                if self.worse(value, self.threshold)
+            )
+
+        regressed: dict[str, Failure] = {}
+        if self.baselines is not None:
+            previous = self.baselines.get(self.seen)
+            regressed = {
+                key: Failure(key, value, previous[key], "regression")
+                for key, value in self.seen.items()
+                if key in previous and self.worse(value, previous[key])
+            }
+            # the baselines only improve: a value within the tolerance doesn't move them
+            self.baselines.update(
+                {
+                    key: value
+                    for key, value in self.seen.items()
+                    if key not in previous or self.better(value, previous[key])
+                }
+            )
+            if self.no_regression:
+                failures.extend(regressed.values())
+
+        for failure in [*failures, *([] if self.no_regression else regressed.values())]:
+            log.warning(
+                "%s %s %s%s is worse than the %s (%s%s)",
+                failure.key,
+                self.metric,
+                failure.percent,
+                self.unit,
+                failure.reason,
+                failure.expected,
+                self.unit,
+            )
+        return failures
+
+
+class MemoryGate(Gate):
+    """
+    A runner sink failing the sources with a growing peak memory.
+
+    Args:
+        threshold: the maximum peak memory, in bytes (if any).
+        baselines: the memory baselines (needed for no_regression).
+        no_regression: fail the sources whose peak memory grew above their baseline.
+        rootdir: the baselines keys are the sources paths relative to it.
+        tolerance: the (relative) peak memory growth accepted.
+
+    """
+
+    metric = "memory"
+    unit = " bytes"
+
+    def __init__(
+        self,
+        threshold: float | None = None,
+        baselines: Baselines | None = None,
+        no_regression: bool = False,
+        rootdir: Path | None = None,
+        tolerance: float = 0.1,
+    ) -> None:
+        super().__init__(threshold, baselines, no_regression, rootdir)
+        self.tolerance = tolerance
+
+    def value(self, summary: runner.Summary) -> float | None:
+        peak = summary.memory.get("peak_rss") if summary.memory else None
+        return None if peak is None else float(peak)
+
+    def worse(self, value: float, expected: float) -> bool:
+        return value > expected * (1 + self.tolerance)
+
+    def better(self, value: float, expected: float) -> bool:
+        return value < expected
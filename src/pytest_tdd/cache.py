@@ -0,0 +1,123 @@
+"""
+A small on disk cache, keyed by content hashes.
+
+Entries are json files stored under a namespace directory (one per
+feature, eg. "metadata") in the cache directory; the least recently used
+entries are removed by `Cache.evict` once a namespace grows beyond its
+`max_entries`.
+
+The cache directory is (in order of preference) the one passed explicitly,
+the one set in the PYTEST_TDD_CACHE_DIR environment variable or
+`.pytest-tdd` in the current directory.
+
+Example:
+    >>> cache = Cache("metadata")
+    >>> cache.put(digest(b"hello"), {"a": 1})
+    >>> cache.get(digest(b"hello"))
+    {'a': 1}
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+CACHE_DIR_ENV = "PYTEST_TDD_CACHE_DIR"
+CACHE_DIR = ".pytest-tdd"
+
+
+def cachedir(path: Path | str | None = None) -> Path:
+    """
+    Returns the cache directory.
+
+    Args:
+        path: an explicit cache directory (it takes precedence).
+
+    Returns:
+        The cache directory path (not necessarily existing).
+
+    """
+    return Path(path or os.getenv(CACHE_DIR_ENV) or CACHE_DIR)
+
+
+def digest(*parts: str | bytes) -> str:
+    """
+    Returns a sha256 hex digest of all parts.
+
+    Args:
+        parts: strings (utf-8 encoded) or bytes to hash.
+
+    Returns:
+        The hex digest.
+
+    """
+    hasher = hashlib.sha256()
+    for part in parts:
+        data = part.encode("utf-8") if isinstance(part, str) else part
+        hasher.update(len(data).to_bytes(8, "little"))
+        hasher.update(data)
+    return hasher.hexdigest()
+
+
+class Cache:
+    def __init__(self, namespace: str, root: Path | str | None = None, max_entries: int = 10_000) -> None:
+        self.path = cachedir(root) / namespace
+        self.max_entries = max_entries
+
+    def _entry(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Any:
+        """returns the value stored under key (None if missing)"""
+        entry = self._entry(key)
+        try:
+            value = json.loads(entry.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        try:
+            # mark as recently used (for the eviction)
+            os.utime(entry)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        """stores a (json serializable) value under key"""
+        entry = self._entry(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(value), encoding="utf-8")
+        tmp.replace(entry)
+
+    def evict(self, max_entries: int | None = None) -> int:
+        """
+        Removes the least recently used entries.
+
+        Args:
+            max_entries: the number of entries to keep (defaults to `max_entries`).
+
+        Returns:
+            The number of removed entries.
+
+        """
+        limit = self.max_entries if max_entries is None else max_entries
+        entries = []
+        for entry in self.path.glob("*/*.json"):
+            try:
+                entries.append((entry.stat().st_mtime, entry))
+            except OSError:
+                continue
+        if len(entries) <= limit:
+            return 0
+        entries.sort()
+        count = 0
+        for _, entry in entries[: len(entries) - limit]:
+            try:
+                entry.unlink()
+                count += 1
+            except OSError:
+                pass
+        return count
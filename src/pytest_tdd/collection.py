@@ -0,0 +1,147 @@
+"""
+Cached pytest collection results.
+
+Collecting a big (parametrized) test file can take longer than running the
+few tests of interest. The node ids (and markers) collected from each test
+file are cached (see `pytest_tdd.plugin`), keyed by the digest of:
+
+    - the test file
+    - the conftest.py files from the project root down to the test file
+    - the project configuration files (pytest.ini, pyproject.toml ...)
+    - the pytest version
+
+so any change to these invalidates the entry. A selection (a pytest marker
+expression) is then resolved against the cached node ids, and pytest is run
+with the selected node ids only: the test modules are still imported, but
+the child plugin skips making the items (parametrizing included) of the
+functions and classes not selected (see `pytest_tdd.plugin`).
+
+The marker expressions are evaluated with pytest own (private) evaluator:
+if it isn't available the selection is left to pytest (with -m).
+
+NOTE: parameters computed from other modules (eg. `@parametrize("x", mod.VALUES)`)
+are not tracked: clear the cache when these change.
+
+Example:
+    >>> collection = Collection(cache.Cache("collection"), Path.cwd())
+    >>> collection.select([Path("tests/test_module.py")], "slow and not db")
+    [Path('tests/test_module.py::test_one[1]'), Path('tests/test_module.py::test_one[2]')]
+"""
+
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+from typing import Any, Callable, Sequence
+
+from pytest_tdd import cache, index
+
+log = logging.getLogger(__name__)
+
+# these affect the collection (eg. python_functions, testpaths)
+CONFIGS = ("pytest.ini", ".pytest.ini", "pyproject.toml", "tox.ini", "setup.cfg")
+
+
+def compile_markers(expr: str) -> Callable[[Sequence[str]], bool] | None:
+    """compiles the pytest marker expression expr (None if pytest evaluator isn't available)"""
+    try:
+        from _pytest.mark.expression import Expression
+
+        compiled = Expression.compile(expr)
+    except (ImportError, AttributeError) as exc:
+        log.debug("cannot compile the marker expression %r: %s", expr, exc)
+        return None
+
+    def evaluate(markers: Sequence[str]) -> bool:
+        names = set(markers)
+
+        def matcher(name: str, /, **_: object) -> bool:
+            return name in names
+
+        return bool(compiled.evaluate(matcher))
+
+    return evaluate
+
+
+def matches(expr: str, markers: Sequence[str]) -> bool:
+    """evaluates the pytest marker expression expr against markers"""
+    if (evaluate := compile_markers(expr)) is None:
+        raise RuntimeError("the pytest marker expressions evaluator is not available")
+    return evaluate(markers)
+
+
+def configs(path: Path, rootdir: Path) -> list[Path]:
+    """returns the project configuration and the conftest.py files (root down) of the test file path"""
+    path, rootdir = path.absolute(), rootdir.absolute()
+    dirs = [d for d in reversed(path.parents) if d == rootdir or rootdir in d.parents]
+    return [*(rootdir / name for name in CONFIGS), *(d / "conftest.py" for d in dirs)]
+
+
+class Collection:
+    """
+    The collected node ids of each test file.
+
+    Args:
+        store: the cache holding the entries (they share its eviction).
+        rootdir: the project root (where conftest.py and configuration files are looked up).
+
+    """
+
+    def __init__(self, store: cache.Cache, rootdir: Path) -> None:
+        from importlib.metadata import version
+
+        self.store = store
+        self.rootdir = rootdir.absolute()
+        self.version = version("pytest")
+
+    def key(self, path: Path) -> str | None:
+        """returns the cache key for the test file path (None if missing)"""
+        path = path.absolute()
+        parts: list[str | bytes] = [self.version, str(path)]
+        for source in [*configs(path, self.rootdir), path]:
+            try:
+                parts.extend([str(source), source.read_bytes()])
+            except FileNotFoundError:
+                if source == path:
+                    return None
+            except OSError:
+                return None
+        return cache.digest(*parts)
+
+    def get(self, path: Path) -> dict[str, Any] | None:
+        """returns the collected {"nodeids": [...], "markers": {nodeid: [...]}} for path"""
+        if (key := self.key(path)) is None:
+            return None
+        result: dict[str, Any] | None = self.store.get(key)
+        return result
+
+    def put(self, path: Path, data: dict[str, Any]) -> None:
+        if (key := self.key(path)) is not None:
+            self.store.put(key, data)
+
+    def select(self, candidates: Sequence[Path], expr: str) -> list[Path] | None:
+        """
+        Returns the node ids in candidates matching the marker expression.
+
+        Args:
+            candidates: the test files (or node ids) to select from.
+            expr: a pytest marker expression (as in pytest -m).
+
+        Returns:
+            The selected node ids (as path::nodeid), None if any candidate
+            collection isn't cached (or expr cannot be evaluated).
+
+        """
+        if (evaluate := compile_markers(expr)) is None:
+            return None
+        result = []
+        for candidate in candidates:
+            filename, _, prefix = str(candidate).partition(index.SEP)
+            if (data := self.get(Path(filename))) is None:
+                return None
+            for nodeid in data["nodeids"]:
+                if prefix and nodeid != prefix and not nodeid.startswith((f"{prefix}[", f"{prefix}{index.SEP}")):
+                    continue
+                if evaluate(data["markers"].get(nodeid, [])):
+                    result.append(Path(f"{filename}{index.SEP}{nodeid}"))
+        return result
@@ -0,0 +1,500 @@
+"""
+Runs the tests for many sources across several hosts.
+
+A `Coordinator` plans the Units (see `runner.Runner.plan`) and hands them out
+to the workers connecting to it; the workers run them (see `work`) and send
+back the results, with their coverage data that the coordinator merges.
+
+The protocol is json lines over TCP, the worker asks and the coordinator
+answers (an invalid message gets an error reply)::
+
+    worker                                  coordinator
+    {"op": "hello", "worker": "host:1234",
+     "token": "secret"}                  -> {"op": "ok"}
+    {"op": "get"}                        -> {"op": "unit", "id": 3, "unit": {...}}
+                                            {"op": "wait", "seconds": 0.2}
+                                            {"op": "done"}
+    {"op": "result", "id": 3, ...}       -> {"op": "ok"}
+                                            {"op": "error", "message": "..."}
+
+Workers pull a new unit as soon as they are idle, so the faster ones run
+more units. Once the queue is empty an idle worker steals (runs again) the
+longest running unit of another worker: the first result wins, so a slow
+(or dead) worker doesn't hold up the whole run. Units of disconnected
+workers go back in the queue.
+
+All hosts must see the sources and the tests at the same paths (eg. the same
+checkout location or a shared filesystem).
+
+The coordinator hands out work and takes results (coverage data included)
+from anyone connecting with the shared token (`--token` or
+$PYTEST_TDD_TOKEN): it listens on 127.0.0.1 by default, set a token before
+listening on a reachable address.
+
+Example:
+    $> pytest-tdd-dist coordinator --port 7000 -s src -t tests src/package/*.py
+    $> pytest-tdd-dist worker --host coordinator.host --port 7000  # on each host
+"""
+
+from __future__ import annotations
+
+import base64
+import collections
+import contextlib
+import binascii
+import dataclasses as dc
+import hmac
+import json
+import logging
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Sequence
+
+import click
+
+from pytest_tdd import misc, runner, tdd
+
+log = logging.getLogger(__name__)
+
+# the shared token environment variable (see Coordinator)
+TOKEN_ENV = "PYTEST_TDD_TOKEN"
+
+
+def unit_to_dict(unit: runner.Unit) -> dict[str, Any]:
+    return {
+        "source": str(unit.source),
+        "modules": unit.modules,
+        "candidates": [str(c) for c in unit.candidates],
+        "pythonpath": [str(p) for p in unit.pythonpath],
+        "cwd": None if unit.cwd is None else str(unit.cwd),
+        "first": unit.first,
+        "quarantine": unit.quarantine,
+    }
+
+
+def unit_from_dict(data: dict[str, Any], workdir: Path) -> runner.Unit:
+    return runner.Unit(
+        Path(data["source"]),
+        data["modules"],
+        [Path(c) for c in data["candidates"]],
+        [Path(p) for p in data["pythonpath"]],
+        workdir,
+        None if data["cwd"] is None else Path(data["cwd"]),
+        data.get("first", []),
+        data.get("quarantine", []),
+    )
+
+
+def merge(datafiles: Sequence[Path], dest: Path) -> Path:
+    """merges the coverage datafiles (the run fragments) into dest"""
+    from coverage import CoverageData
+
+    merged = CoverageData(str(dest))
+    for path in datafiles:
+        fragment = CoverageData(str(path))
+        fragment.read()
+        merged.update(fragment)
+    merged.write()
+    return dest
+
+
+# the result message fields (and their types)
+RESULT: dict[str, type | tuple[type, ...]] = {
+    "returncode": int,
+    "cmd": list,
+    "stdout": str,
+    "stderr": str,
+    "tests": (str, type(None)),
+    "coverage": (str, type(None)),
+    "datafile": (str, type(None)),
+    "memory": (dict, type(None)),
+    "limit": (str, type(None)),
+}
+
+
+class ProtocolError(ValueError):
+    """an invalid message"""
+
+
+@dc.dataclass
+class Task:
+    unit: runner.Unit
+    workers: dict[str, float] = dc.field(default_factory=dict)  # worker -> start time
+
+
+class Handler(socketserver.StreamRequestHandler):
+    server: Server
+
+    def reply(self, msg: dict[str, Any]) -> None:
+        self.wfile.write(json.dumps(msg).encode("utf-8") + b"\n")
+
+    def handle(self) -> None:
+        coordinator = self.server.coordinator
+        worker = None
+        try:
+            for line in self.rfile:
+                try:
+                    msg = json.loads(line)
+                    if not isinstance(msg, dict):
+                        raise ProtocolError("not a json object")
+                    if worker is None:
+                        worker = coordinator.hello(msg, "{}:{}".format(*self.client_address[:2]))
+                        reply = {"op": "ok"}
+                    elif msg.get("op") == "get":
+                        reply = coordinator.next(worker)
+                    elif msg.get("op") == "result":
+                        coordinator.done(worker, msg)
+                        reply = {"op": "ok"}
+                    else:
+                        raise ProtocolError(f"unknown op {msg.get('op')!r}")
+                except ValueError as exc:
+                    # ProtocolError and the json errors
+                    log.warning("worker %s: %s", worker or "{}:{}".format(*self.client_address[:2]), exc)
+                    self.reply({"op": "error", "message": str(exc)})
+                    if worker is None:
+                        # no second chance to say hello
+                        return
+                    continue
+                self.reply(reply)
+        except OSError as exc:
+            log.warning("worker %s: %s", worker, exc)
+        finally:
+            if worker is not None:
+                coordinator.lost(worker)
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    coordinator: Coordinator
+
+
+class Coordinator:
+    """
+    Hands out units to the workers and collects their results.
+
+    Args:
+        units: the units to run.
+        workdir: where to store the results (and the coverage fragments).
+        address: the (host, port) to listen on (port 0 picks a free one).
+        wait: how long an idle worker waits before asking again.
+        token: the token the workers must say hello with (if any).
+
+    """
+
+    def __init__(
+        self,
+        units: Sequence[runner.Unit],
+        workdir: Path,
+        address: tuple[str, int] = ("127.0.0.1", 0),
+        wait: float = 0.2,
+        token: str | None = None,
+    ) -> None:
+        self.tasks = [Task(unit) for unit in units]
+        self.pending = collections.deque(range(len(self.tasks)))
+        self.results: dict[int, runner.Result] = {}
+        self.workdir = workdir
+        self.wait = wait
+        self.token = token
+        self.cond = threading.Condition()
+        self.server = Server(address, Handler)
+        self.server.coordinator = self
+
+    @property
+    def address(self) -> tuple[str, int]:
+        host, port = self.server.server_address[:2]
+        return str(host), int(port)
+
+    def hello(self, msg: dict[str, Any], default: str) -> str:
+        """checks a worker hello message, returns the worker name"""
+        if msg.get("op") != "hello":
+            raise ProtocolError("say hello first")
+        if self.token is not None and not hmac.compare_digest(str(msg.get("token", "")), self.token):
+            raise ProtocolError("invalid token")
+        worker = msg.get("worker", default)
+        if not isinstance(worker, str):
+            raise ProtocolError("invalid worker name")
+        return worker
+
+    def next(self, worker: str) -> dict[str, Any]:
+        """returns the next unit for worker (or tells it to wait or stop)"""
+        with self.cond:
+            if len(self.results) == len(self.tasks):
+                return {"op": "done"}
+            while self.pending:
+                number = self.pending.popleft()
+                if number not in self.results:
+                    break
+            else:
+                # steal the longest running unit, not already run by worker
+                running = [
+                    (min(task.workers.values()), number)
+                    for number, task in enumerate(self.tasks)
+                    if number not in self.results and task.workers and worker not in task.workers
+                ]
+                if not running:
+                    return {"op": "wait", "seconds": self.wait}
+                number = min(running)[1]
+                log.debug("worker %s steals unit %i", worker, number)
+            self.tasks[number].workers[worker] = time.monotonic()
+            return {"op": "unit", "id": number, "unit": unit_to_dict(self.tasks[number].unit)}
+
+    def done(self, worker: str, msg: dict[str, Any]) -> None:
+        """
+        Records the result of a unit (the first one wins).
+
+        Raises:
+            ProtocolError: msg isn't the result of a unit handed out to worker.
+
+        """
+        number = msg.get("id")
+        if not isinstance(number, int) or isinstance(number, bool) or not 0 <= number < len(self.tasks):
+            raise ProtocolError(f"invalid unit id {number!r}")
+        for name, types in RESULT.items():
+            if not isinstance(msg.get(name), types):
+                raise ProtocolError(f"invalid {name} in unit {number} result")
+        try:
+            data = base64.b64decode(msg["datafile"], validate=True) if msg["datafile"] else None
+        except binascii.Error as exc:
+            raise ProtocolError(f"invalid datafile in unit {number} result: {exc}") from exc
+        with self.cond:
+            if worker not in self.tasks[number].workers:
+                raise ProtocolError(f"unit {number} was not handed out to {worker}")
+            self.tasks[number].workers.pop(worker)
+            if number in self.results:
+                return
+            unit = dc.replace(self.tasks[number].unit, workdir=self.workdir / f"{number:05}")
+            unit.workdir.mkdir(parents=True, exist_ok=True)
+            datafile = None
+            if data:
+                datafile = unit.workdir / ".coverage"
+                datafile.write_bytes(data)
+            self.results[number] = runner.Result(
+                unit,
+                msg["returncode"],
+                msg["cmd"],
+                msg["stdout"],
+                msg["stderr"],
+                msg["tests"],
+                msg["coverage"],
+                datafile=datafile,
+                memory=msg["memory"],
+                limit=msg["limit"],
+            )
+            self.cond.notify_all()
+
+    def lost(self, worker: str) -> None:
+        """puts back in the queue the units of a disconnected worker"""
+        with self.cond:
+            for number, task in enumerate(self.tasks):
+                if task.workers.pop(worker, None) is not None and number not in self.results:
+                    if not task.workers:
+                        self.pending.appendleft(number)
+
+    def run(self, timeout: float | None = None) -> list[runner.Result]:
+        """serves the workers until all the units have a result, returns them in order"""
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            with self.cond:
+                if not self.cond.wait_for(lambda: len(self.results) == len(self.tasks), timeout):
+                    raise TimeoutError(f"{len(self.tasks) - len(self.results)} units still running")
+            # let the idle workers know it's over
+            time.sleep(self.wait)
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+            thread.join()
+        return [self.results[number] for number in range(len(self.tasks))]
+
+
+def connect(address: tuple[str, int], wait: float = 0.0) -> socket.socket:
+    """connects to address, retrying (with an exponential backoff) for up to wait seconds"""
+    deadline = time.monotonic() + wait
+    delay = 0.1
+    while True:
+        try:
+            return socket.create_connection(address)
+        except OSError as exc:
+            if time.monotonic() + delay > deadline:
+                raise
+            log.debug("cannot connect to %s:%i (%s), retrying in %.1fs", *address, exc, delay)
+            time.sleep(delay)
+            delay = min(2 * delay, 5.0)
+
+
+def work(
+    address: tuple[str, int],
+    engine: runner.Engine | None = None,
+    workdir: Path | None = None,
+    name: str | None = None,
+    wait: float = 0.0,
+    token: str | None = None,
+) -> int:
+    """
+    Runs the units handed out by the coordinator at address.
+
+    Args:
+        address: the coordinator (host, port).
+        engine: runs the units (default `runner.SubprocessEngine`, with the
+            coverage data report).
+        workdir: where to run the units (a temporary directory if None).
+        name: the worker name (default host:pid).
+        wait: how long to wait for the coordinator (in seconds), if not up yet.
+        token: the coordinator token (if any).
+
+    Returns:
+        The number of units run.
+
+    Raises:
+        ConnectionError: the coordinator is unreachable (or turns the worker down).
+
+    """
+    engine = engine or runner.SubprocessEngine(report="data")
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    count = 0
+    try:
+        sock = connect(address, wait)
+    except OSError as exc:
+        raise ConnectionError(f"cannot reach the coordinator at {address[0]}:{address[1]}: {exc}") from exc
+    with sock, sock.makefile("rwb") as stream, contextlib.ExitStack() as stack:
+        tmpdir = workdir or Path(stack.enter_context(tempfile.TemporaryDirectory()))
+
+        def send(msg: dict[str, Any]) -> dict[str, Any]:
+            stream.write(json.dumps(msg).encode("utf-8") + b"\n")
+            stream.flush()
+            if not (line := stream.readline()):
+                raise ConnectionError("coordinator went away")
+            result: dict[str, Any] = json.loads(line)
+            return result
+
+        try:
+            reply = send({"op": "hello", "worker": name, "token": token})
+        except OSError as exc:
+            raise ConnectionError(f"cannot reach the coordinator at {address[0]}:{address[1]}: {exc}") from exc
+        if reply["op"] != "ok":
+            raise ConnectionError(f"the coordinator turned {name} down: {reply.get('message')}")
+
+        while True:
+            try:
+                reply = send({"op": "get"})
+            except OSError as exc:
+                # the coordinator is gone (eg. all units done while we were running a stolen one)
+                log.debug("worker %s: %s", name, exc)
+                break
+            if reply["op"] == "done":
+                break
+            if reply["op"] == "wait":
+                time.sleep(reply["seconds"])
+                continue
+            unit = unit_from_dict(reply["unit"], tmpdir / f"{count:05}")
+            unit.workdir.mkdir(parents=True, exist_ok=True)
+            log.debug("worker %s runs %s", name, unit.source)
+            result = engine.execute(unit)
+            count += 1
+            with contextlib.suppress(OSError):
+                reply = send(
+                    {
+                        "op": "result",
+                        "id": reply["id"],
+                        "returncode": result.returncode,
+                        **result.asdict(),
+                        "datafile": base64.b64encode(result.datafile.read_bytes()).decode("ascii")
+                        if result.datafile
+                        else None,
+                    }
+                )
+                if reply["op"] == "error":
+                    log.warning("worker %s: result rejected: %s", name, reply["message"])
+    return count
+
+
+@click.group()
+@click.option("-v", "--verbose", count=True)
+def main(verbose: int) -> None:
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO)
+
+
+@main.command()
+@click.argument("sources", nargs=-1, required=True, type=click.Path(path_type=Path))
+@click.option(
+    "-t",
+    "--tests-dir",
+    "tests_dirs",
+    multiple=True,
+    default=["tests"],
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    help="tests directory (can be repeated)",
+)
+@click.option(
+    "-s",
+    "--sources-dir",
+    "sources_dirs",
+    multiple=True,
+    default=["src"],
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    help="sources directory (can be repeated)",
+)
+@click.option("--host", default="127.0.0.1", help="address to listen on")
+@click.option("--port", default=7000, type=int, help="port to listen on")
+@click.option("--token", envvar=TOKEN_ENV, help=f"the workers shared token (or ${TOKEN_ENV})")
+@click.option("--timeout", type=float, help="give up after timeout seconds")
+@click.option(
+    "--coverage-file",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="merge the coverage data of all the runs into this file",
+)
+@click.pass_context
+def coordinator(
+    ctx: click.Context,
+    sources: tuple[Path, ...],
+    sources_dirs: tuple[Path, ...],
+    tests_dirs: tuple[Path, ...],
+    host: str,
+    port: int,
+    token: str | None,
+    timeout: float | None,
+    coverage_file: Path | None,
+) -> None:
+    """hands out the sources to the workers"""
+    resolver = tdd.Resolver([p.absolute() for p in sources_dirs], [p.absolute() for p in tests_dirs])
+    pipeline = runner.Runner(resolver, sinks=[runner.LogSink(), runner.PrintSink()], cwd=Path.cwd())
+    workdir = ctx.with_resource(misc.mkdir())
+    units = pipeline.plan(sources, workdir / "plan")
+
+    if token is None and host not in {"127.0.0.1", "localhost", "::1"}:
+        log.warning("listening on %s without a token: anyone reaching it can pull work and post results", host)
+    server = Coordinator(units, workdir / "results", (host, port), token=token)
+    log.info("coordinator listening on %s:%i", *server.address)
+    retcode = 0
+    for result in server.run(timeout):
+        pipeline.report(result, pipeline.collect(result))
+        retcode = retcode or result.returncode
+
+    if coverage_file:
+        merge([r.datafile for r in server.results.values() if r.datafile], coverage_file)
+    ctx.exit(retcode)
+
+
+@main.command()
+@click.option("--host", default="127.0.0.1", help="the coordinator address")
+@click.option("--port", default=7000, type=int, help="the coordinator port")
+@click.option("--name", help="the worker name (default host:pid)")
+@click.option("--wait", default=30.0, type=float, help="wait up to seconds for the coordinator to start")
+@click.option("--token", envvar=TOKEN_ENV, help=f"the coordinator token (or ${TOKEN_ENV})")
+def worker(host: str, port: int, name: str | None, wait: float, token: str | None) -> None:
+    """runs the sources handed out by the coordinator"""
+    try:
+        count = work((host, port), name=name, wait=wait, token=token)
+    except ConnectionError as exc:
+        raise click.ClickException(str(exc)) from exc
+    log.info("run %i units", count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+The pytest fixtures shipped with pytest-tdd (a pytest11 plugin, loaded once the package is installed).
+
+`mktree` creates a directory layout under the test `tmp_path`, out of a
+`tree -aF` like text (see `pytest_tdd.tree.parse`) or a list of paths (one
+per line, directories ending with /, # for comments)::
+
+    def test_layout(mktree):
+        rootdir = mktree('''
+            src/package/__init__.py
+            src/package/module.py
+            tests/test_module.py
+        ''')
+        assert (rootdir / "src/package/module.py").exists()
+
+Each distinct layout is written once per session and then cloned (see
+`pytest_tdd.tree.Templates`), so a layout shared by many tests costs a
+clone each: set the `mktree_link` ini option to hardlink the files instead
+(faster still, but the tests must not change the files in place).
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable
+
+import pytest
+
+from pytest_tdd import cache, tree
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addini("mktree_link", "mktree hardlinks the layout files (read only use)", type="bool", default=False)
+
+
+def parse(txt: str, mode: str | None = None) -> tree.Node:
+    """parses txt as a tree -aF output (mode="tree") or a list of paths (mode="txt")"""
+    mode = mode or ("tree" if "─ " in txt else "txt")
+    if mode == "tree":
+        root = tree.parse(txt)
+        assert root
+        return root
+    root = tree.Node("", tree.Kind.DIR)
+    for line in txt.split("\n"):
+        if not (path := line.strip()) or path.startswith("#"):
+            continue
+        tree.find(root, path, create=True)
+    return root
+
+
+@pytest.fixture(scope="session")
+def mktree_templates(tmp_path_factory: pytest.TempPathFactory, pytestconfig: pytest.Config) -> tree.Templates:
+    return tree.Templates(tmp_path_factory.mktemp("mktree"), link=bool(pytestconfig.getini("mktree_link")))
+
+
+@pytest.fixture(scope="function")
+def mktree(tmp_path: Path, mktree_templates: tree.Templates) -> Callable[..., Path]:
+    def create(txt: str, mode: str | None = None, subpath: str = "") -> Path:
+        # a known layout isn't even parsed
+        key = cache.digest(mode or "", txt)
+        src = mktree_templates.lookup(key) or mktree_templates.template(parse(txt, mode), key)
+        return tree.clone(src, tmp_path / subpath, mktree_templates.link)
+
+    return create
@@ -0,0 +1,178 @@
+"""
+Per module history of the test outcomes.
+
+Each run records the outcome of every test (by pytest node id) along with
+the digest of the code it ran against (the module and its tests), so the
+next runs can:
+
+    - run the tests that failed last time first (see `History.failed`)
+    - spot the flaky tests: the ones both passing and failing on the same
+      code (see `History.flaky`)
+    - keep the flaky tests in quarantine (see `History.quarantined`): they are
+      rerun on failure and don't fail the run anymore
+    - release them once they pass again a few runs in a row (see `History.recover`)
+
+Example:
+    >>> with History(Path(".pytest-tdd/history.sqlite")) as history:
+    ...     history.record("src/package/module.py", "abc123", {"tests/test_module.py::test_one": "failed"})
+    ...     history.failed("src/package/module.py")
+    ['tests/test_module.py::test_one']
+"""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Mapping
+
+if TYPE_CHECKING:
+    import types
+
+log = logging.getLogger(__name__)
+
+# the outcomes reported by pytest_tdd.plugin
+FAILED = {"failed", "error"}
+# passed only after a rerun
+FLAKY = "flaky"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    module TEXT NOT NULL,
+    nodeid TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_module ON runs (module, nodeid);
+CREATE TABLE IF NOT EXISTS quarantine (
+    module TEXT NOT NULL,
+    nodeid TEXT NOT NULL,
+    since REAL NOT NULL,
+    PRIMARY KEY (module, nodeid)
+);
+"""
+
+
+class History:
+    """
+    The test outcomes history, in a sqlite database.
+
+    Args:
+        path: the database file.
+        keep: how many runs of each test to keep.
+
+    """
+
+    def __init__(self, path: Path, keep: int = 20) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.keep = keep
+        self.db = sqlite3.connect(str(path))
+        self.db.executescript(SCHEMA)
+
+    def record(self, module: str, digest: str, outcomes: Mapping[str, str]) -> None:
+        """records the outcomes (node id -> outcome) of a module tests run"""
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO runs (module, nodeid, digest, outcome, ts) VALUES (?, ?, ?, ?, ?)",
+                [(module, nodeid, digest, outcome, now) for nodeid, outcome in outcomes.items()],
+            )
+            # drop the older runs beyond keep
+            self.db.execute(
+                "DELETE FROM runs WHERE module = ? AND id IN ("
+                "  SELECT id FROM ("
+                "    SELECT id, ROW_NUMBER() OVER (PARTITION BY nodeid ORDER BY id DESC) AS n"
+                "    FROM runs WHERE module = ?"
+                "  ) WHERE n > ?"
+                ")",
+                (module, module, self.keep),
+            )
+
+    def last(self, module: str) -> dict[str, str]:
+        """returns the last outcome of each module test"""
+        rows = self.db.execute(
+            "SELECT nodeid, outcome FROM runs WHERE id IN (SELECT MAX(id) FROM runs WHERE module = ? GROUP BY nodeid)",
+            (module,),
+        )
+        return dict(rows.fetchall())
+
+    def failed(self, module: str) -> list[str]:
+        """returns the module tests that failed in the last run"""
+        return sorted(nodeid for nodeid, outcome in self.last(module).items() if outcome in FAILED)
+
+    def flaky(self, module: str, digest: str) -> list[str]:
+        """returns the module tests both passing and failing on the code with digest"""
+        outcomes: dict[str, set[str]] = {}
+        rows = self.db.execute("SELECT nodeid, outcome FROM runs WHERE module = ? AND digest = ?", (module, digest))
+        for nodeid, outcome in rows:
+            outcomes.setdefault(nodeid, set()).add(outcome)
+        return sorted(
+            nodeid
+            for nodeid, seen in outcomes.items()
+            if FLAKY in seen or ("passed" in seen and seen & FAILED)
+        )
+
+    def quarantine(self, module: str, nodeids: Iterable[str]) -> list[str]:
+        """puts the module tests nodeids in quarantine, returns the new ones"""
+        current = set(self.quarantined(module))
+        added = sorted(set(nodeids) - current)
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO quarantine (module, nodeid, since) VALUES (?, ?, ?)",
+                [(module, nodeid, now) for nodeid in added],
+            )
+        return added
+
+    def release(self, module: str, nodeids: Iterable[str] | None = None) -> None:
+        """releases the module tests nodeids (or all of them) from quarantine"""
+        with self.db:
+            if nodeids is None:
+                self.db.execute("DELETE FROM quarantine WHERE module = ?", (module,))
+            else:
+                self.db.executemany(
+                    "DELETE FROM quarantine WHERE module = ? AND nodeid = ?",
+                    [(module, nodeid) for nodeid in nodeids],
+                )
+
+    def recover(self, module: str, runs: int) -> list[str]:
+        """releases the module tests in quarantine that passed the last runs, returns them"""
+        recovered = []
+        for nodeid in self.quarantined(module):
+            rows = self.db.execute(
+                "SELECT outcome FROM runs WHERE module = ? AND nodeid = ? ORDER BY id DESC LIMIT ?",
+                (module, nodeid, runs),
+            ).fetchall()
+            if len(rows) == runs and all(outcome == "passed" for (outcome,) in rows):
+                recovered.append(nodeid)
+        with self.db:
+            # forget their failures too, or they'd be found flaky again on the same code
+            self.db.executemany(
+                "DELETE FROM runs WHERE module = ? AND nodeid = ? AND outcome != 'passed'",
+                [(module, nodeid) for nodeid in recovered],
+            )
+        self.release(module, recovered)
+        return recovered
+
+    def quarantined(self, module: str) -> list[str]:
+        """returns the module tests in quarantine"""
+        rows = self.db.execute("SELECT nodeid FROM quarantine WHERE module = ? ORDER BY nodeid", (module,))
+        return [nodeid for (nodeid,) in rows]
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self) -> History:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: types.TracebackType | None,
+    ) -> None:
+        self.close()
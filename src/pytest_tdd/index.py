@@ -0,0 +1,345 @@
+"""
+Declared source <-> tests mapping.
+
+When a layout doesn't follow the `test_<name>.py` convention, sources and
+tests can declare their relation with `tdd:` hints (see `metadata`), in
+the module docstring or in a comment, using paths relative to the project
+root, globs and pytest node ids::
+
+    # in src/package/module.py
+    # tdd: tests/unit/test_*.py tests/test_misc.py::test_module
+
+    # in tests/test_special.py
+    '''tdd: src/package/module.py'''
+
+All hints are compiled once into an `Index` (persisted as json), so looking up
+the declared tests for a source is a dictionary access. The Index keeps the
+hints declared by each file: a file edited since (see `Index.changed`) gets
+its hints replaced, while a file added or removed rebuilds the Index (as
+scanning a different set of sources or tests directories does).
+
+The Index also answers the reverse question (which sources a test
+exercises) using the declared hints, the sources file names and the
+test -> sources relations recorded from the coverage data of previous runs.
+
+Example:
+    >>> idx = build(Path.cwd(), [Path("src")], [Path("tests")])
+    >>> idx.save(Path(".pytest-tdd/index.json"))
+    >>> load(Path(".pytest-tdd/index.json")).lookup(Path("src/package/module.py"))
+    [Path('tests/unit/test_module.py'), Path('tests/test_misc.py::test_module')]
+"""
+
+from __future__ import annotations
+
+import dataclasses as dc
+import json
+import logging
+import os
+from pathlib import Path
+
+from pytest_tdd import cache, metadata
+
+log = logging.getLogger(__name__)
+
+# bump this when the Index layout changes
+VERSION = 4
+SEP = "::"
+
+
+def relpath(path: Path, rootdir: Path) -> str:
+    """path relative to rootdir (or absolute if not under rootdir)"""
+    path = path.absolute()
+    return (path.relative_to(rootdir) if rootdir in path.parents or path == rootdir else path).as_posix()
+
+
+def expand(hint: str, rootdir: Path) -> list[str]:
+    """
+    Expands a hint (a path, a glob or a node id) into the matching paths.
+
+    Args:
+        hint: the hint, relative to rootdir.
+        rootdir: the project root directory.
+
+    Returns:
+        The sorted matches relative to rootdir (keeping the node id part).
+
+    """
+    pattern, sep, nodeid = hint.partition(SEP)
+    if Path(pattern).is_absolute():
+        paths = [Path(pattern)]
+    else:
+        paths = list(rootdir.glob(pattern))
+    return sorted(f"{relpath(path, rootdir)}{sep}{nodeid}" for path in paths if path.is_file())
+
+
+@dc.dataclass
+class Index:
+    rootdir: Path
+    mapping: dict[str, list[str]] = dc.field(default_factory=dict)
+    dirs: dict[str, int] = dc.field(default_factory=dict)
+    basenames: dict[str, list[str]] = dc.field(default_factory=dict)
+    covers: dict[str, list[str]] = dc.field(default_factory=dict)
+    files: dict[str, int] = dc.field(default_factory=dict)
+    declared: dict[str, list[list[str]]] = dc.field(default_factory=dict)
+    # the scanned (sources, tests) directories
+    roots: list[list[str]] = dc.field(default_factory=lambda: [[], []])
+    _reverse: dict[str, list[str]] | None = dc.field(default=None, repr=False, compare=False)
+
+    def add(self, source: str, target: str) -> None:
+        targets = self.mapping.setdefault(source, [])
+        if target not in targets:
+            targets.append(target)
+            self._reverse = None
+
+    def declare(self, path: str, pairs: list[list[str]]) -> bool:
+        """replaces the (source, target) pairs declared by the file path, True if changed"""
+        if self.declared.get(path, []) == pairs:
+            return False
+        self.declared[path] = pairs
+        self.mapping = {}
+        for declared in self.declared.values():
+            for source, target in declared:
+                self.add(source, target)
+        self._reverse = None
+        return True
+
+    def lookup(self, source: Path) -> list[Path]:
+        """returns the tests declared for source (paths or node ids)"""
+        return [self.rootdir / target for target in self.mapping.get(relpath(source, self.rootdir), [])]
+
+    def record(self, test: Path, sources: list[Path]) -> bool:
+        """records the sources exercised by test (from coverage), True if changed"""
+        key = relpath(test, self.rootdir)
+        value = sorted(relpath(source, self.rootdir) for source in sources)
+        if self.covers.get(key) == value:
+            return False
+        self.covers[key] = value
+        return True
+
+    def sources(self, test: Path) -> list[Path]:
+        """returns the sources declared or recorded for test"""
+        if self._reverse is None:
+            self._reverse = {}
+            for source, targets in self.mapping.items():
+                for target in targets:
+                    sources = self._reverse.setdefault(target.partition(SEP)[0], [])
+                    if source not in sources:
+                        sources.append(source)
+        key = relpath(test, self.rootdir)
+        result = []
+        for source in [*self._reverse.get(key, []), *self.covers.get(key, [])]:
+            if (path := self.rootdir / source) not in result:
+                result.append(path)
+        return result
+
+    def named(self, name: str) -> list[Path]:
+        """returns the sources with file name"""
+        return [self.rootdir / path for path in self.basenames.get(name, [])]
+
+    def stale(self) -> bool:
+        """True if files were added/removed in the indexed dirs"""
+        for path, mtime in self.dirs.items():
+            try:
+                if (self.rootdir / path).stat().st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def changed(self) -> list[str]:
+        """returns the indexed files modified since they were indexed"""
+        result = []
+        for path, mtime in self.files.items():
+            try:
+                if (self.rootdir / path).stat().st_mtime_ns != mtime:
+                    result.append(path)
+            except OSError:
+                result.append(path)
+        return result
+
+    def refresh(self, store: cache.Cache | None = None) -> bool:
+        """replaces the hints of the changed files (see `changed`), True if any"""
+        sources_dirs, tests_dirs = ([self.rootdir / root for root in roots] for roots in self.roots)
+        paths = self.changed()
+        for path in paths:
+            filename = self.rootdir / path
+            try:
+                self.files[path] = filename.stat().st_mtime_ns
+            except OSError:
+                self.files.pop(path)
+            pairs = []
+            for is_test, topdirs in [(False, sources_dirs), (True, tests_dirs)]:
+                if any(topdir.absolute() in filename.parents for topdir in topdirs):
+                    pairs.extend(hints(filename, is_test, self.rootdir, store))
+            self.declare(path, pairs)
+        return bool(paths)
+
+    def save(self, path: Path) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": VERSION,
+            "rootdir": str(self.rootdir),
+            "mapping": self.mapping,
+            "dirs": self.dirs,
+            "basenames": self.basenames,
+            "covers": self.covers,
+            "files": self.files,
+            "declared": self.declared,
+            "roots": self.roots,
+        }
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(data, indent=1), encoding="utf-8")
+        tmp.replace(path)
+        return path
+
+
+def load(path: Path) -> Index | None:
+    """
+    Loads an index saved with `Index.save`.
+
+    Args:
+        path: the index file.
+
+    Returns:
+        The Index or None if path is missing/invalid.
+
+    """
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != VERSION:
+        return None
+    return Index(
+        Path(data["rootdir"]),
+        data["mapping"],
+        data["dirs"],
+        data["basenames"],
+        data["covers"],
+        data["files"],
+        data["declared"],
+        data["roots"],
+    )
+
+
+def roots(rootdir: Path, sources_dirs: list[Path], tests_dirs: list[Path]) -> list[list[str]]:
+    """the sorted sources and tests directories (relative to rootdir), as kept in the Index"""
+    return [sorted({relpath(path, rootdir) for path in dirs}) for dirs in (sources_dirs, tests_dirs)]
+
+
+def hints(path: Path, is_test: bool, rootdir: Path, store: cache.Cache | None = None) -> list[list[str]]:
+    """
+    Returns the (source, target) pairs declared by the `tdd:` hints in path.
+
+    Args:
+        path: the source or test file.
+        is_test: path is a test (declaring the sources it covers).
+        rootdir: the project root, hints are relative to it.
+        store: the metadata cache (see `metadata.extract`).
+
+    Returns:
+        The [source, target] pairs (empty if path cannot be parsed).
+
+    """
+    try:
+        found = metadata.extract(path, store).hints
+    except (OSError, SyntaxError, ValueError) as exc:
+        log.debug("cannot parse %s: %s", path, exc)
+        return []
+    pairs = []
+    for hint in found:
+        for match in expand(hint, rootdir):
+            if is_test:
+                # a test declaring the sources it covers
+                pairs.append([match.partition(SEP)[0], relpath(path, rootdir)])
+            else:
+                pairs.append([relpath(path, rootdir), match])
+    return pairs
+
+
+def build(
+    rootdir: Path,
+    sources_dirs: list[Path],
+    tests_dirs: list[Path],
+    store: cache.Cache | None = None,
+) -> Index:
+    """
+    Compiles the `tdd:` hints from sources and tests into an Index.
+
+    Args:
+        rootdir: the project root, hints are relative to it.
+        sources_dirs: the sources directories to scan.
+        tests_dirs: the tests directories to scan.
+        store: the metadata cache (see `metadata.extract`).
+
+    Returns:
+        The compiled Index.
+
+    """
+    rootdir = rootdir.absolute()
+    result = Index(rootdir, roots=roots(rootdir, sources_dirs, tests_dirs))
+
+    for is_test, topdirs in [(False, sources_dirs), (True, tests_dirs)]:
+        for topdir in topdirs:
+            for dirpath, dirnames, filenames in os.walk(topdir.absolute()):
+                dirnames[:] = sorted(d for d in dirnames if not d.startswith(".") and d != "__pycache__")
+                result.dirs[relpath(Path(dirpath), rootdir)] = Path(dirpath).stat().st_mtime_ns
+                for filename in sorted(filenames):
+                    if not filename.endswith(".py"):
+                        continue
+                    path = Path(dirpath) / filename
+                    key = relpath(path, rootdir)
+                    if not (is_test or filename.startswith("test_")):
+                        result.basenames.setdefault(filename, []).append(key)
+                    result.files[key] = path.stat().st_mtime_ns
+                    result.declared.setdefault(key, []).extend(hints(path, is_test, rootdir, store))
+                    for source, target in result.declared[key]:
+                        result.add(source, target)
+    return result
+
+
+def open_index(
+    path: Path,
+    rootdir: Path,
+    sources_dirs: list[Path],
+    tests_dirs: list[Path],
+    store: cache.Cache | None = None,
+    rebuild: bool = False,
+) -> Index:
+    """
+    Loads the index from path, (re)building it if missing, stale or built
+    from other sources and tests directories.
+
+    The hints of the files edited since are refreshed, the recorded coverage
+    relations are kept across rebuilds.
+
+    Args:
+        path: the index file.
+        rootdir: the project root.
+        sources_dirs: the sources directories to scan.
+        tests_dirs: the tests directories to scan.
+        store: the metadata cache (see `metadata.extract`).
+        rebuild: force a rebuild.
+
+    Returns:
+        The Index.
+
+    """
+    rootdir = rootdir.absolute()
+    idx = load(path)
+    if (
+        rebuild
+        or idx is None
+        or idx.rootdir != rootdir
+        or idx.roots != roots(rootdir, sources_dirs, tests_dirs)
+        or idx.stale()
+    ):
+        log.debug("building index %s", path)
+        covers = idx.covers if idx and idx.rootdir == rootdir else {}
+        idx = build(rootdir, sources_dirs, tests_dirs, store)
+        idx.covers = covers
+        idx.save(path)
+    elif idx.refresh(store):
+        log.debug("refreshed index %s", path)
+        idx.save(path)
+    return idx
@@ -0,0 +1,220 @@
+"""
+Resource limits for the test runs.
+
+A runaway test (eating all the memory, spinning forever, leaking files or
+processes) must not take down the other runs sharing the box: the runs child
+process is started through a small launcher setting its limits (with
+setrlimit) before exec-ing pytest::
+
+    python -m pytest_tdd.limits --memory 1073741824 --cpu 60 -- pytest ...
+
+When cgroup v2 is available (and writable), each run is placed in its own
+cgroup too (see `Cgroup`): the memory limit is then enforced on the actual
+memory use (memory.max) rather than on the address space (RLIMIT_AS), and the
+processes count on the whole run (pids.max) rather than the user (RLIMIT_NPROC).
+
+A run hitting a limit is reported as such (see `hit`), not as a failure.
+
+Example:
+    >>> limits = Limits(memory=2**30, cpu=60)
+    >>> limits.wrap(["pytest", "tests/test_module.py"])
+    ['python', '-m', 'pytest_tdd.limits', '--memory', '1073741824', '--cpu', '60', '--', 'pytest', ...]
+"""
+
+from __future__ import annotations
+
+import argparse
+import dataclasses as dc
+import errno
+import logging
+import os
+import re
+import signal
+import sys
+from pathlib import Path
+from typing import Sequence
+
+log = logging.getLogger(__name__)
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+# the exceptions telling a limit was hit (the limit name -> exception types, errnos)
+EXCEPTIONS: dict[str, tuple[set[str], set[int]]] = {
+    "memory": ({"MemoryError"}, {errno.ENOMEM}),
+    "files": (set(), {errno.EMFILE}),
+    "processes": (set(), {errno.EAGAIN}),
+}
+
+# the lines reporting a test exception: "E   ExcType: message" or "FAILED nodeid - ExcType: message"
+EXCEPTION = re.compile(r"^(?:E {3}\s*|(?:FAILED|ERROR) .+? - )(?:[\w.]+\.)?(?P<type>\w+)(?:: (?P<message>.*))?$", re.M)
+ERRNO = re.compile(r"^\[Errno (?P<errno>\d+)\]")
+
+
+@dc.dataclass
+class Limits:
+    memory: int | None = None  # bytes
+    cpu: int | None = None  # seconds
+    files: int | None = None
+    processes: int | None = None
+
+    def __bool__(self) -> bool:
+        return any(value is not None for value in dc.astuple(self))
+
+    def wrap(self, cmd: Sequence[str], cgroup: Path | None = None) -> list[str]:
+        """returns cmd run through the launcher (joining cgroup, if any)"""
+        args = [sys.executable, "-m", "pytest_tdd.limits"]
+        for field in dc.fields(self):
+            if (value := getattr(self, field.name)) is not None:
+                args.extend([f"--{field.name}", str(value)])
+        if cgroup:
+            args.extend(["--cgroup", str(cgroup)])
+        return [*args, "--", *cmd]
+
+    def apply(self, cgroup: bool = False) -> None:
+        """sets the limits on the current process (the cgroup enforces memory and processes)"""
+        import resource
+
+        def setrlimit(which: int, value: int, hard: int | None = None) -> None:
+            _, current = resource.getrlimit(which)
+            hard = value if hard is None else hard
+            if current != resource.RLIM_INFINITY:
+                hard = min(hard, current)
+            resource.setrlimit(which, (min(value, hard), hard))
+
+        if self.memory is not None and not cgroup:
+            setrlimit(resource.RLIMIT_AS, self.memory)
+        if self.cpu is not None:
+            # SIGXCPU at the soft limit, SIGKILL a second later
+            setrlimit(resource.RLIMIT_CPU, self.cpu, self.cpu + 1)
+        if self.files is not None:
+            setrlimit(resource.RLIMIT_NOFILE, self.files)
+        if self.processes is not None and not cgroup:
+            setrlimit(resource.RLIMIT_NPROC, self.processes)
+
+
+class Cgroup:
+    """
+    A cgroup v2 (under the current process one) for a single run.
+
+    Use `Cgroup.create`, it returns None if cgroup v2 isn't available or the
+    current cgroup isn't delegated to us with the memory and pids controllers
+    enabled (eg. run under `systemd-run --user --scope -p Delegate=yes`).
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    @classmethod
+    def create(cls, name: str, limits: Limits, root: Path = CGROUP_ROOT) -> Cgroup | None:
+        try:
+            # cgroup v2: a single "0::/path" line
+            line = Path("/proc/self/cgroup").read_text().strip()
+            if not line.startswith("0::") or not (root / "cgroup.controllers").exists():
+                return None
+            path = root / line[3:].lstrip("/") / name
+            path.mkdir()
+        except OSError as exc:
+            log.debug("cgroup v2 not available: %s", exc)
+            return None
+        cgroup = cls(path)
+        try:
+            if limits.memory is not None:
+                (path / "memory.max").write_text(str(limits.memory))
+                (path / "memory.swap.max").write_text("0")
+            if limits.processes is not None:
+                (path / "pids.max").write_text(str(limits.processes))
+        except OSError as exc:
+            log.debug("cannot set the cgroup %s limits: %s", path, exc)
+            cgroup.remove()
+            return None
+        return cgroup
+
+    def events(self, name: str) -> dict[str, int]:
+        """returns the counters in the cgroup name.events file (eg. memory.events)"""
+        try:
+            lines = (self.path / f"{name}.events").read_text().splitlines()
+        except OSError:
+            return {}
+        return {key: int(value) for key, _, value in (line.partition(" ") for line in lines)}
+
+    def remove(self) -> None:
+        try:
+            self.path.rmdir()
+        except OSError as exc:
+            log.debug("cannot remove cgroup %s: %s", self.path, exc)
+
+
+def hit(
+    limits: Limits, returncode: int, output: str, cgroup: Cgroup | None = None, cputime: float | None = None
+) -> str | None:
+    """
+    Returns the limit a run hit (if any).
+
+    The evidence is looked up from the strongest to the weakest: the cgroup
+    events, the signal killing the run, the exceptions the tests raised. A
+    SIGKILL is a cpu limit hit only if the run used up its cpu time (it might
+    come from the OOM killer as well). Only the exception lines of the pytest
+    report are looked at (see `EXCEPTION`), for their type or errno: a failing
+    `test_handles_MemoryError` is no memory limit hit.
+
+    Args:
+        limits: the run limits.
+        returncode: the run return code (negative for a signal).
+        output: the run output (stdout and stderr).
+        cgroup: the run cgroup (if any).
+        cputime: the run cpu time in seconds (if known).
+
+    Returns:
+        The limit name ("memory", "cpu", "files" or "processes") or None.
+
+    """
+    if not limits or returncode == 0:
+        return None
+    if cgroup and limits.memory is not None and cgroup.events("memory").get("oom_kill"):
+        return "memory"
+    if cgroup and limits.processes is not None and cgroup.events("pids").get("max"):
+        return "processes"
+    if limits.cpu is not None:
+        if returncode == -signal.SIGXCPU:
+            return "cpu"
+        if returncode == -signal.SIGKILL and cputime is not None and cputime >= limits.cpu:
+            return "cpu"
+    if returncode == -signal.SIGKILL:
+        # killed from outside, the output tells nothing
+        return None
+    for name, (types, errnos) in EXCEPTIONS.items():
+        if getattr(limits, name) is None:
+            continue
+        for match in EXCEPTION.finditer(output):
+            if match.group("type") in types:
+                return name
+            code = ERRNO.match(match.group("message") or "")
+            if code and int(code.group("errno")) in errnos:
+                return name
+    return None
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m pytest_tdd.limits", description="runs cmd with limits")
+    for field in dc.fields(Limits):
+        parser.add_argument(f"--{field.name}", type=int)
+    parser.add_argument("--cgroup", type=Path, help="join this cgroup first")
+    parser.add_argument("cmd", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    cmd = args.cmd[1:] if args.cmd[:1] == ["--"] else args.cmd
+    if not cmd:
+        parser.error("missing the command to run")
+    joined = False
+    if args.cgroup:
+        try:
+            (args.cgroup / "cgroup.procs").write_text("0")
+            joined = True
+        except OSError as exc:
+            print(f"cannot join cgroup {args.cgroup}: {exc}", file=sys.stderr)  # noqa: T201
+    Limits(**{field.name: getattr(args, field.name) for field in dc.fields(Limits)}).apply(joined)
+    os.execvp(cmd[0], cmd)  # noqa: S606
+
+
+if __name__ == "__main__":
+    main()
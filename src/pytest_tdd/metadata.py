@@ -0,0 +1,139 @@
+"""
+Extract metadata from python sources (without executing them).
+
+For each source the module is parsed once and the result is stored in a
+`cache.Cache` keyed by the content digest, so unchanged files are never
+parsed again. The metadata contains:
+
+    - the module docstring (see `misc.get_doc`)
+    - the imported modules
+    - the top level functions and classes
+    - the test hints, the `tdd:` annotations either in the module
+      docstring or in the comments, eg.::
+
+        '''my module
+
+        tdd: tests/unit/test_special.py
+        '''
+        # tdd: tests/integration/test_*.py::test_special
+
+Example:
+    >>> meta = extract(Path("src/package/module.py"))
+    >>> meta.hints
+    ['tests/unit/test_special.py', 'tests/integration/test_*.py::test_special']
+"""
+
+from __future__ import annotations
+
+import dataclasses as dc
+import re
+from pathlib import Path
+
+from pytest_tdd import cache, misc
+
+# bump this when the Metadata layout changes
+VERSION = 1
+HINT = re.compile(r"^\s*tdd:\s*(?P<hints>.+)$")
+
+
+@dc.dataclass
+class Metadata:
+    path: Path
+    digest: str
+    doc: str | None = None
+    imports: list[str] = dc.field(default_factory=list)
+    defs: list[str] = dc.field(default_factory=list)
+    hints: list[str] = dc.field(default_factory=list)
+
+    def asdict(self) -> dict[str, str | list[str] | None]:
+        return {
+            "doc": self.doc,
+            "imports": self.imports,
+            "defs": self.defs,
+            "hints": self.hints,
+        }
+
+
+def hints(txt: str) -> list[str]:
+    """
+    Returns the `tdd:` hints in a text (one or more per line).
+
+    Args:
+        txt: a docstring or a comment (with the leading # stripped).
+
+    Returns:
+        The list of hints.
+
+    Examples:
+        >>> hints("tdd: tests/test_a.py, tests/test_b.py")
+        ['tests/test_a.py', 'tests/test_b.py']
+
+    """
+    result: list[str] = []
+    for line in txt.split("\n"):
+        if match := HINT.search(line):
+            result.extend(h for h in re.split(r"[\s,]+", match.group("hints")) if h)
+    return result
+
+
+def parse(path: Path, data: bytes, digest: str | None = None) -> Metadata:
+    """
+    Parse python source code (data) into a Metadata instance.
+
+    Args:
+        path: the source file path.
+        data: the source file content.
+        digest: the data digest (computed if not passed).
+
+    Returns:
+        The extracted metadata.
+
+    """
+    import ast
+    import io
+    import tokenize
+
+    root = ast.parse(data, filename=str(path))
+    result = Metadata(path, digest or cache.digest(data), misc.get_doc(root))
+
+    for node in root.body:
+        if isinstance(node, ast.Import):
+            result.imports.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            result.imports.append("." * node.level + (node.module or ""))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            result.defs.append(node.name)
+
+    if result.doc:
+        result.hints.extend(hints(result.doc))
+    for token in tokenize.tokenize(io.BytesIO(data).readline):
+        if token.type == tokenize.COMMENT:
+            result.hints.extend(hints(token.string.lstrip("#")))
+    return result
+
+
+def extract(path: Path | str, store: cache.Cache | None = None) -> Metadata:
+    """
+    Extract the metadata from a python source file.
+
+    Args:
+        path: the source file.
+        store: the cache to lookup (and store) the metadata into, if None
+            it will parse the file every time.
+
+    Returns:
+        The extracted metadata.
+
+    """
+    path = Path(path)
+    data = path.read_bytes()
+    digest = cache.digest(data)
+    key = cache.digest(str(VERSION), digest)
+
+    if store is not None and (value := store.get(key)) is not None:
+        return Metadata(path, digest, **value)
+
+    result = parse(path, data, digest)
+    if store is not None:
+        store.put(key, result.asdict())
+    return result
@@ -2,7 +2,10 @@ from __future__ import annotations
 
 import contextlib
 from pathlib import Path
-from typing import Any, Generator
+from typing import TYPE_CHECKING, Any, Generator, Sequence
+
+if TYPE_CHECKING:
+    import ast
 
 
 def indent(txt: str, pre: str = " " * 2) -> str:
@@ -30,7 +33,7 @@ def indent(txt: str, pre: str = " " * 2) -> str:
     return result if result.strip() else result.strip()
 
 
-def list_of_paths(paths: str | Path | list[str | Path] | None) -> list[Path]:
+def list_of_paths(paths: str | Path | Sequence[str | Path] | None) -> list[Path]:
     """
 
     Make paths a list of Path objects, if needed.
@@ -164,7 +167,7 @@ def loadmod(path: Path, name: str | None = None) -> Any:
     return module
 
 
-def get_doc(src: str | Path, pre: str | None = None) -> str | None:
+def get_doc(src: str | Path | ast.Module, pre: str | None = None) -> str | None:
     """
     Extract the doc string from source code.
 
@@ -174,7 +177,8 @@ def get_doc(src: str | Path, pre: str | None = None) -> str | None:
     Args:
         src: A Path object pointing to the source file or a string
             containing the Python source code as a string. The source code
-            is parsed to extract its docstring.
+            is parsed to extract its docstring. An already parsed ast.Module
+            is used as is.
         pre: A string that will be prepended to each line of the retrieved
             docstring. If None, the original docstring is returned without
             any modification.
@@ -203,7 +207,11 @@ def get_doc(src: str | Path, pre: str | None = None) -> str | None:
             self.doc = get_docstring(node, clean=True)
             return super().generic_visit(node)
 
-    root = parse(str(src.read_text() if hasattr(src, "read_text") else src))
+    root = (
+        src
+        if isinstance(src, Module)
+        else parse(str(src.read_text() if hasattr(src, "read_text") else src))
+    )
     visitor = Visitor()
     visitor.visit(root)
     return (
@@ -0,0 +1,214 @@
+"""
+A low overhead line coverage collector, using sys.monitoring (PEP 669, python 3.12+).
+
+Tracing coverage (as coverage.py does with settrace) pays for every line
+executed by the whole run. Here instead:
+
+    - only the code objects of the files under test get LINE/BRANCH events
+      (enabled locally on their first PY_START, every other code object is
+      disabled on its first PY_START)
+    - each line (and branch) location is disabled after its first hit
+
+so the cost is roughly one callback per distinct line of the module under test.
+
+The report is compatible with the coverage.py json report (the "files"
+executed/missing lines and the "totals"), statements are counted as in
+coverage.py: one per (possibly multi line) statement, docstrings and
+`# pragma: no cover` blocks excluded.
+
+Example:
+    >>> monitor = Monitor(["/path/to/src/package/module.py"])
+    >>> monitor.start()
+    >>> import package.module
+    >>> monitor.stop()
+    >>> monitor.report()["totals"]
+    {'covered_lines': 3, 'num_statements': 4, 'percent_covered': 75.0, 'missing_lines': 1, ...}
+"""
+
+from __future__ import annotations
+
+import ast
+import bisect
+import os
+import sys
+from pathlib import Path
+from types import CodeType
+from typing import Any, Iterable
+
+EXCLUDE = "pragma: no cover"
+
+
+def statements(source: str) -> dict[int, int]:
+    """
+    Maps each line of a statement to the statement (first) line.
+
+    Compound statements (def, if, for ...) own their header lines only (each
+    decorator is a statement too), docstrings and the `# pragma: no cover` statements (with
+    their bodies) are left out.
+
+    Args:
+        source: the python source code.
+
+    Returns:
+        The line -> statement line mapping.
+
+    """
+    lines = source.splitlines()
+    result: dict[int, int] = {}
+
+    def visit(body: list[ast.stmt], docstring: bool) -> None:
+        for number, node in enumerate(body):
+            if (
+                docstring
+                and number == 0
+                and isinstance(node, ast.Expr)
+                and isinstance(node.value, ast.Constant)
+                and isinstance(node.value.value, str)
+            ):
+                continue
+            first = min([node.lineno, *(d.lineno for d in getattr(node, "decorator_list", []))])
+            children = [
+                getattr(node, name)
+                for name in ("body", "orelse", "finalbody")
+                if isinstance(getattr(node, name, None), list) and getattr(node, name)
+            ]
+            children.extend([handler.body for handler in getattr(node, "handlers", [])])
+            children.extend([case.body for case in getattr(node, "cases", [])])
+            if children:
+                last = min(child[0].lineno for child in children) - 1
+                # "if x: pass" on a single line
+                last = max(last, first)
+            else:
+                last = node.end_lineno or node.lineno
+            if any(EXCLUDE in line for line in lines[first - 1 : last]):
+                continue
+            # the decorators are statements on their own
+            for decorator in getattr(node, "decorator_list", []):
+                for line in range(decorator.lineno, (decorator.end_lineno or decorator.lineno) + 1):
+                    result.setdefault(line, decorator.lineno)
+            for line in range(node.lineno, last + 1):
+                result.setdefault(line, node.lineno)
+            is_scope = isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+            for child in children:
+                visit(child, is_scope)
+            for handler in getattr(node, "handlers", []):
+                result.setdefault(handler.lineno, handler.lineno)
+            for case in getattr(node, "cases", []):
+                result.setdefault(case.pattern.lineno, case.pattern.lineno)
+
+    visit(ast.parse(source).body, True)
+    return result
+
+
+def summary(executed: Iterable[int], mapping: dict[int, int]) -> dict[str, Any]:
+    """the coverage.py like summary for a file"""
+    stmts = set(mapping.values())
+    covered = {mapping[line] for line in executed if line in mapping}
+    return {
+        "executed_lines": sorted(covered),
+        "missing_lines": sorted(stmts - covered),
+        "summary": {
+            "covered_lines": len(covered),
+            "num_statements": len(stmts),
+            "percent_covered": 100.0 * len(covered) / len(stmts) if stmts else 100.0,
+            "missing_lines": len(stmts - covered),
+            "excluded_lines": 0,
+        },
+    }
+
+
+class Monitor:
+    """
+    Collects the lines (and branches) executed in files.
+
+    Args:
+        files: the (absolute) paths of the files to measure.
+
+    """
+
+    def __init__(self, files: Iterable[str | Path]) -> None:
+        self.files = {os.path.realpath(path) for path in files}
+        self.lines: dict[str, set[int]] = {path: set() for path in self.files}
+        self.branches: dict[str, set[tuple[int, int]]] = {path: set() for path in self.files}
+        self._realpaths: dict[str, str] = {}
+        self.tool = 0
+
+    def _target(self, code: CodeType) -> str | None:
+        filename = code.co_filename
+        if filename not in self._realpaths:
+            self._realpaths[filename] = os.path.realpath(filename)
+        path = self._realpaths[filename]
+        return path if path in self.files else None
+
+    def _on_start(self, code: CodeType, offset: int) -> Any:
+        mon = sys.monitoring
+        if self._target(code):
+            mon.set_local_events(self.tool, code, mon.events.LINE | mon.events.BRANCH)
+        return mon.DISABLE
+
+    def _on_line(self, code: CodeType, line: int) -> Any:
+        if path := self._target(code):
+            self.lines[path].add(line)
+        return sys.monitoring.DISABLE
+
+    def _on_branch(self, code: CodeType, offset: int, destination: int) -> Any:
+        if path := self._target(code):
+            starts, lines = _linetable(code)
+            source = lines[max(bisect.bisect_right(starts, offset) - 1, 0)]
+            target = lines[max(bisect.bisect_right(starts, destination) - 1, 0)]
+            if source and target:
+                self.branches[path].add((source, target))
+        return sys.monitoring.DISABLE
+
+    def start(self) -> None:
+        if sys.version_info < (3, 12):
+            raise RuntimeError("sys.monitoring needs python 3.12+")
+        mon = sys.monitoring
+        self.tool = mon.COVERAGE_ID
+        mon.use_tool_id(self.tool, "pytest-tdd")
+        mon.register_callback(self.tool, mon.events.PY_START, self._on_start)
+        mon.register_callback(self.tool, mon.events.LINE, self._on_line)
+        mon.register_callback(self.tool, mon.events.BRANCH, self._on_branch)
+        mon.set_events(self.tool, mon.events.PY_START)
+
+    def stop(self) -> None:
+        mon = sys.monitoring
+        mon.set_events(self.tool, 0)
+        for event in (mon.events.PY_START, mon.events.LINE, mon.events.BRANCH):
+            mon.register_callback(self.tool, event, None)
+        mon.free_tool_id(self.tool)
+
+    def report(self, cwd: Path | None = None) -> dict[str, Any]:
+        """returns the coverage.py json like report"""
+        cwd = (cwd or Path.cwd()).absolute()
+        files = {}
+        for path in sorted(self.files):
+            try:
+                mapping = statements(Path(path).read_text(encoding="utf-8"))
+            except (OSError, SyntaxError, ValueError):
+                continue
+            name = os.path.relpath(path, cwd) if Path(path).is_relative_to(cwd) else path
+            files[name] = summary(self.lines[path], mapping)
+            files[name]["executed_branches"] = sorted([a, b] for a, b in self.branches[path])
+
+        totals = {"covered_lines": 0, "num_statements": 0, "missing_lines": 0, "excluded_lines": 0}
+        for data in files.values():
+            for key in totals:
+                totals[key] += data["summary"][key]
+        total = totals["num_statements"]
+        return {
+            "meta": {"format": 2, "tool": "pytest-tdd monitor", "branch_coverage": False},
+            "files": files,
+            "totals": {**totals, "percent_covered": 100.0 * totals["covered_lines"] / total if total else 100.0},
+        }
+
+
+_LINETABLES: dict[CodeType, tuple[list[int], list[int | None]]] = {}
+
+
+def _linetable(code: CodeType) -> tuple[list[int], list[int | None]]:
+    """the (sorted) bytecode offsets starts and their lines"""
+    if code not in _LINETABLES:
+        entries = list(code.co_lines())
+        _LINETABLES[code] = ([start for start, _, _ in entries], [line for _, _, line in entries])
+    return _LINETABLES[code]
@@ -0,0 +1,347 @@
+"""
+Mutation testing of a single module.
+
+Coverage tells which lines the tests run, not whether they check what these
+lines do: a mutant is a copy of the module with a single small change (an
+operator swapped, a constant changed, a return value dropped ...), the tests
+"kill" it if they fail against it. The mutants the tests don't kill point at
+the missing (or too weak) assertions.
+
+Only the candidate tests of the module run against each mutant (see
+`runner.Runner.plan`), stopping at the first failure (pytest -x), and the
+mutants run `jobs` at the time. The mutated module never touches the working
+tree: `pytest_tdd.plugin` imports it from the run directory in place of the
+original one.
+
+Each mutant outcome is cached, keyed by the change and the (mutated) top
+level statement enclosing it, along with the tests: after an edit only the
+mutants of the edited statements (a function, a class ...) run again, and all
+of them if the tests changed.
+
+Lines marked with `# pragma: no mutate` (or `# pragma: no cover`) aren't
+mutated (the whole block, when marking a compound statement like a def).
+
+Example:
+    >>> (unit,) = runner.Runner(resolver, cwd=Path.cwd()).plan([Path("src/package/module.py")], workdir)
+    >>> report = mutate(unit, cache.Cache("mutants"), jobs=4)
+    >>> report.line("module.py")
+    'module.py killed 18 mutants out of 20 (90.0%, survived=2)'
+    >>> report.survived[0].description
+    'line 12: replace < with >='
+"""
+
+from __future__ import annotations
+
+import ast
+import bisect
+import copy
+import dataclasses as dc
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Iterator, Sequence
+
+from pytest_tdd import cache, index, limits, runner
+
+log = logging.getLogger(__name__)
+
+EXCLUDE = ("pragma: no mutate", "pragma: no cover")
+
+# the run directory file holding the mutated source
+MUTANT = "mutant.py"
+
+OPERATORS: dict[type[ast.AST], type[ast.AST]] = {
+    # comparisons
+    ast.Eq: ast.NotEq,
+    ast.NotEq: ast.Eq,
+    ast.Lt: ast.GtE,
+    ast.GtE: ast.Lt,
+    ast.Gt: ast.LtE,
+    ast.LtE: ast.Gt,
+    ast.Is: ast.IsNot,
+    ast.IsNot: ast.Is,
+    ast.In: ast.NotIn,
+    ast.NotIn: ast.In,
+    # arithmetic
+    ast.Add: ast.Sub,
+    ast.Sub: ast.Add,
+    ast.Mult: ast.Div,
+    ast.Div: ast.Mult,
+    ast.FloorDiv: ast.Mult,
+    ast.Mod: ast.Mult,
+    ast.Pow: ast.Mult,
+    # boolean
+    ast.And: ast.Or,
+    ast.Or: ast.And,
+}
+
+SYMBOLS = {
+    ast.Eq: "==", ast.NotEq: "!=", ast.Lt: "<", ast.GtE: ">=", ast.Gt: ">", ast.LtE: "<=",
+    ast.Is: "is", ast.IsNot: "is not", ast.In: "in", ast.NotIn: "not in",
+    ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/", ast.FloorDiv: "//", ast.Mod: "%", ast.Pow: "**",
+    ast.And: "and", ast.Or: "or",
+}  # fmt: skip
+
+
+@dc.dataclass
+class Mutant:
+    line: int
+    description: str
+    source: str
+    key: str = ""  # the change and its (mutated) top level statement, not moved by edits elsewhere
+
+
+def _replacements(node: ast.AST) -> Iterator[tuple[ast.AST, str]]:
+    """yields the mutated copies of node (along with their description)"""
+
+    def swap(op: ast.AST) -> tuple[ast.AST, str] | None:
+        if (other := OPERATORS.get(type(op))) is None:
+            return None
+        return other(), f"replace {SYMBOLS[type(op)]} with {SYMBOLS[other]}"
+
+    if isinstance(node, (ast.BinOp, ast.AugAssign, ast.BoolOp)):
+        if mutated := swap(node.op):
+            new = copy.copy(node)
+            new.op, description = mutated  # type: ignore[assignment]
+            yield new, description
+    elif isinstance(node, ast.Compare):
+        for number, op in enumerate(node.ops):
+            if mutated := swap(op):
+                compare = copy.copy(node)
+                compare.ops = [*node.ops[:number], mutated[0], *node.ops[number + 1 :]]  # type: ignore[list-item]
+                yield compare, mutated[1]
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        yield node.operand, "remove not"
+    elif isinstance(node, ast.Constant) and isinstance(node.value, bool):
+        yield ast.Constant(not node.value), f"replace {node.value} with {not node.value}"
+    elif isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        yield ast.Constant(node.value + 1), f"replace {node.value!r} with {node.value + 1!r}"
+    elif isinstance(node, ast.Return) and node.value is not None:
+        if not (isinstance(node.value, ast.Constant) and node.value.value is None):
+            yield ast.Return(ast.Constant(None)), "return None"
+    elif isinstance(node, ast.Break):
+        yield ast.Continue(), "replace break with continue"
+    elif isinstance(node, ast.Continue):
+        yield ast.Break(), "replace continue with break"
+
+
+def _skipped(tree: ast.AST, excluded: set[int]) -> set[int]:
+    """the ids of the nodes never mutated: the annotations, the __main__ block and the excluded statements"""
+    skipped: set[int] = set()
+    for node in ast.walk(tree):
+        roots: list[ast.AST | None] = []
+        if isinstance(node, ast.stmt) and node.lineno in excluded:
+            # the whole statement (eg. a function)
+            roots.append(node)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            roots.append(node.returns)
+            roots.extend(arg.annotation for arg in ast.walk(node.args) if isinstance(arg, ast.arg))
+        elif isinstance(node, ast.AnnAssign):
+            roots.append(node.annotation)
+        elif isinstance(node, ast.If) and "__main__" in ast.unparse(node.test):
+            roots.append(node)
+        for root in roots:
+            if root is not None:
+                skipped.update(id(child) for child in ast.walk(root))
+    return skipped
+
+
+def _splice(source: bytes, offsets: list[int], node: ast.AST, text: str) -> str:
+    """replaces node (its source segment) with text"""
+    start = offsets[node.lineno - 1] + node.col_offset  # type: ignore[attr-defined]
+    end = offsets[node.end_lineno - 1] + node.end_col_offset  # type: ignore[attr-defined]
+    return (source[:start] + text.encode("utf-8") + source[end:]).decode("utf-8")
+
+
+def mutants(source: str) -> Iterator[Mutant]:
+    """
+    Generates the mutants of a module.
+
+    Each mutant replaces a single node, keeping the rest of the source as is
+    (comments and formatting included).
+
+    Args:
+        source: the module source code.
+
+    Returns:
+        The mutants iterator (in source order).
+
+    Raises:
+        RuntimeError: on python 3.8 (no ast.unparse).
+
+    """
+    if sys.version_info < (3, 9):
+        raise RuntimeError("mutation testing needs python 3.9+")
+    tree = ast.parse(source)
+    lines = source.splitlines(keepends=True)
+    data = source.encode("utf-8")
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line.encode("utf-8")))
+    excluded = {number for number, line in enumerate(lines, 1) if any(marker in line for marker in EXCLUDE)}
+    skipped = _skipped(tree, excluded)
+
+    slots: list[tuple[ast.AST, ast.AST, str, int | None]] = []
+    for parent in ast.walk(tree):
+        for name, value in ast.iter_fields(parent):
+            if isinstance(value, list):
+                slots.extend((parent, child, name, n) for n, child in enumerate(value) if isinstance(child, ast.AST))
+            elif isinstance(value, ast.AST):
+                slots.append((parent, value, name, None))
+    slots.sort(key=lambda slot: (getattr(slot[1], "lineno", 0), getattr(slot[1], "col_offset", 0)))
+
+    # the first line of each top level statement (decorators included)
+    starts = [min([stmt.lineno, *(d.lineno for d in getattr(stmt, "decorator_list", []))]) for stmt in tree.body]
+
+    for parent, node, name, number in slots:
+        if id(node) in skipped or not hasattr(node, "lineno") or node.lineno in excluded:
+            continue
+        top = bisect.bisect_right(starts, node.lineno) - 1
+        for new, description in _replacements(node):
+            # the mutated tree, to check the spliced source against
+            if number is None:
+                setattr(parent, name, new)
+            else:
+                getattr(parent, name)[number] = new
+            try:
+                expected = ast.unparse(tree)
+                key = cache.digest(description, ast.unparse(tree.body[top]))
+            finally:
+                if number is None:
+                    setattr(parent, name, node)
+                else:
+                    getattr(parent, name)[number] = node
+            text = ast.unparse(new)
+            mutated = _splice(data, offsets, node, text)
+            try:
+                if ast.unparse(ast.parse(mutated)) != expected:
+                    mutated = expected
+            except SyntaxError:
+                mutated = expected
+            yield Mutant(node.lineno, f"line {node.lineno}: {description}", mutated, key)
+
+
+class MutantEngine(runner.SubprocessEngine):
+    """
+    Runs the tests against a mutant of module (the one in the run directory, if any).
+
+    The tests stop at the first failure and, as a mutant can loop forever,
+    the runs get a cpu time limit.
+    """
+
+    def __init__(self, module: str, origin: Path, cpu: int | None = None) -> None:
+        super().__init__(
+            args=["-x", "-q", "-p", "no:cacheprovider"],
+            limits=limits.Limits(cpu=cpu) if cpu else None,
+        )
+        self.module = module
+        self.origin = origin
+
+    def plan(self, unit: runner.Unit) -> dict[str, Any]:
+        plan = super().plan(unit)
+        if (path := unit.workdir / MUTANT).exists():
+            plan["mutant"] = {"module": self.module, "path": str(path), "origin": str(self.origin)}
+        return plan
+
+
+@dc.dataclass
+class Report:
+    killed: list[Mutant] = dc.field(default_factory=list)
+    survived: list[Mutant] = dc.field(default_factory=list)
+    cached: int = 0  # how many outcomes came from the cache
+    error: str | None = None  # the tests fail without any mutant
+
+    @property
+    def total(self) -> int:
+        return len(self.killed) + len(self.survived)
+
+    @property
+    def score(self) -> float:
+        return 100.0 * len(self.killed) / self.total if self.total else 100.0
+
+    def line(self, name: str) -> str:
+        if self.error:
+            return f"{name} cannot be mutated: {self.error}"
+        return (
+            f"{name} killed {len(self.killed)} mutants out of {self.total} "
+            f"({self.score:.1f}%, survived={len(self.survived)})"
+        )
+
+
+def tests_digest(unit: runner.Unit) -> str:
+    """the digest of the unit tests (a mutant outcome depends on them too)"""
+    paths = sorted({Path(str(c).partition(index.SEP)[0]) for c in unit.candidates})
+    parts: list[str | bytes] = [str(c) for c in unit.candidates]
+    for path in paths:
+        try:
+            parts.extend([str(path), path.read_bytes()])
+        except OSError:
+            continue
+    return cache.digest(*parts)
+
+
+def mutate(unit: runner.Unit, store: cache.Cache | None = None, jobs: int = 1, cpu: int | None = None) -> Report:
+    """
+    Runs the unit candidate tests against the mutants of its source.
+
+    Args:
+        unit: the unit of a (non test) source, see `runner.Runner.plan`.
+        store: the cache of the mutant outcomes.
+        jobs: how many mutants to run at once.
+        cpu: the cpu time limit (seconds) for a mutant run, defaults to ten
+            times the time taken by the unmutated run (at least 10s).
+
+    Returns:
+        The killed and survived mutants.
+
+    """
+    if not unit.candidates:
+        return Report(error="no tests")
+
+    engine = MutantEngine(unit.modules[0], unit.source)
+    baseline = dc.replace(unit, modules=[], workdir=unit.workdir / "baseline")
+    baseline.workdir.mkdir(parents=True, exist_ok=True)
+    start = time.monotonic()
+    result = engine.execute(baseline)
+    if result.returncode:
+        log.warning("the tests fail without mutations:\n%s", result.stdout + result.stderr)
+        return Report(error="the tests fail without mutations")
+    engine.limits = limits.Limits(cpu=cpu or max(10, int(10 * (time.monotonic() - start))))
+
+    tests = tests_digest(unit)
+    report = Report()
+    pending: list[tuple[Mutant, runner.Unit]] = []
+    for number, mutant in enumerate(mutants(unit.source.read_text(encoding="utf-8"))):
+        key = cache.digest(mutant.key, tests)
+        if store is not None and (outcome := store.get(key)) is not None:
+            (report.killed if outcome == "killed" else report.survived).append(mutant)
+            report.cached += 1
+            continue
+        workdir = unit.workdir / f"mutant-{number:05}"
+        workdir.mkdir(parents=True, exist_ok=True)
+        (workdir / MUTANT).write_text(mutant.source, encoding="utf-8")
+        pending.append((mutant, dc.replace(unit, modules=[], workdir=workdir)))
+    log.debug("%i mutants (%i cached)", report.total + len(pending), report.cached)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for (mutant, _), result in zip(pending, pool.map(engine.execute, [u for _, u in pending])):
+            # any failure (an error importing the mutant, a timeout ...) kills it
+            outcome = "killed" if result.returncode else "survived"
+            (report.killed if result.returncode else report.survived).append(mutant)
+            if store is not None:
+                store.put(cache.digest(mutant.key, tests), outcome)
+    return report
+
+
+def run(units: Sequence[runner.Unit], store: cache.Cache | None = None, jobs: int = 1) -> int:
+    """mutates each unit source, prints the reports and returns 1 if any mutant survived"""
+    retcode = 0
+    for unit in units:
+        report = mutate(unit, store, jobs)
+        print(report.line(unit.source.name))  # noqa: T201
+        for mutant in report.survived:
+            print(f"  survived {mutant.description}")  # noqa: T201
+        retcode = retcode or int(bool(report.survived or report.error))
+    return retcode
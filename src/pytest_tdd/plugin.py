@@ -0,0 +1,266 @@
+"""
+The pytest plugin loaded (with -p pytest_tdd.plugin) in the runs child process.
+
+It is driven by a json plan file, pointed to by the PYTEST_TDD_PLAN environment
+variable (see `runner.SubprocessEngine`)::
+
+    {
+        "first": ["tests/test_module.py::test_one"],  # run these first
+        "quarantine": ["tests/test_module.py::test_two"],  # rerun these, don't fail on them
+        "reruns": 2,
+        "outcomes": "/path/to/outcomes.json",  # where to write the outcomes
+        "collected": "/path/to/collected.json",  # where to write the collected node ids
+        "select": {"/path/to/test_module.py": ["test_one[1]", "TestClass::test_two"]},
+        "tracemalloc": {"top": 10, "include": ["/path/to/module.py"], "output": "/path/to/memory.json"},
+        "monitor": {"files": ["/path/to/module.py"], "output": "/path/to/coverage.json"},
+        "mutant": {"module": "package.module", "path": "/path/to/mutant.py", "origin": "/path/to/module.py"}
+    }
+
+Tests run in this order: the "first" ones (eg. the failed last time), then the
+ones in the most recently modified files. The quarantined tests are rerun up to
+"reruns" times on failure, and reported as xfail if they still fail. The outcome
+of each test (passed, failed, error, skipped, quarantined or flaky if passed on
+a rerun) is written to the "outcomes" file.
+
+The node ids (and markers) collected from the test files passed as a whole
+on the command line are written to the "collected" file (see `pytest_tdd.collection`).
+
+With "select" only the listed node ids are collected from each test file:
+pytest would make the items of the whole module (parametrizing every test
+function) before matching the node ids on its command line, the functions and
+classes not leading to a selected node id are skipped instead.
+
+With "tracemalloc" the allocations are traced for the whole run: the peak
+traced memory and the "top" allocation sites (in the "include" files) still
+alive at the end of the run are written to its "output" file.
+
+With "monitor" (python 3.12+) the line coverage of the "files" is collected
+with `pytest_tdd.monitor` (in place of pytest-cov), from before the conftest.py
+files are loaded, and written as a coverage.py like json report to "output".
+
+With "mutant" the "module" is imported from "path" (the mutated source, see
+`pytest_tdd.mutate`) in place of its "origin".
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import warnings
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+if TYPE_CHECKING:
+    from importlib.machinery import ModuleSpec
+
+    from _pytest.reports import TestReport
+
+PLAN_ENV = "PYTEST_TDD_PLAN"
+
+
+class Tracker:
+    """orders the tests, reruns the quarantined ones and tracks the outcomes"""
+
+    def __init__(self, plan: dict[str, Any]) -> None:
+        self.first = set(plan.get("first", []))
+        self.quarantine = set(plan.get("quarantine", []))
+        self.reruns = int(plan.get("reruns", 0))
+        self.path = plan.get("outcomes")
+        self.outcomes: dict[str, str] = {}
+        self.collected_path = plan.get("collected")
+        self.collected: dict[str, dict[str, Any]] = {}
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_collection_modifyitems(self, config: pytest.Config, items: list[pytest.Item]) -> None:
+        # the collection of whole files (before any deselection)
+        files = {
+            str((config.invocation_params.dir / arg).resolve())
+            for arg in config.args
+            if "::" not in arg and arg.endswith(".py")
+        }
+        for item in items:
+            if (path := str(item.path)) not in files:
+                continue
+            nodeid = item.nodeid.partition("::")[2]
+            data = self.collected.setdefault(path, {"nodeids": [], "markers": {}})
+            data["nodeids"].append(nodeid)
+            if markers := sorted({mark.name for mark in item.iter_markers()}):
+                data["markers"][nodeid] = markers
+
+        mtimes: dict[Path, float] = {}
+
+        def mtime(path: Path) -> float:
+            if path not in mtimes:
+                try:
+                    mtimes[path] = path.stat().st_mtime
+                except OSError:
+                    mtimes[path] = 0.0
+            return mtimes[path]
+
+        # sort is stable: the tests of a file keep their order
+        items.sort(key=lambda item: (item.nodeid not in self.first, -mtime(item.path)))
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_protocol(self, item: pytest.Item, nextitem: pytest.Item | None) -> bool | None:
+        if item.nodeid not in self.quarantine:
+            return None
+        from _pytest.runner import runtestprotocol
+
+        item.ihook.pytest_runtest_logstart(nodeid=item.nodeid, location=item.location)
+        attempts = []
+        for _ in range(self.reruns + 1):
+            reports = runtestprotocol(item, nextitem=nextitem, log=False)
+            attempts.append(any(report.failed for report in reports))
+            if not attempts[-1]:
+                break
+
+        for report in reports:
+            if report.failed:
+                # reported as xfail, so it doesn't fail the run
+                report.outcome = "skipped"
+                report.wasxfail = "quarantined"
+            item.ihook.pytest_runtest_logreport(report=report)
+        item.ihook.pytest_runtest_logfinish(nodeid=item.nodeid, location=item.location)
+
+        self.outcomes[item.nodeid] = "quarantined" if attempts[-1] else "flaky" if any(attempts) else "passed"
+        return True
+
+    def pytest_runtest_logreport(self, report: TestReport) -> None:
+        if report.nodeid in self.quarantine:
+            return
+        if report.failed:
+            self.outcomes[report.nodeid] = "failed" if report.when == "call" else "error"
+        elif report.when == "call" or (report.when == "setup" and report.skipped):
+            self.outcomes.setdefault(report.nodeid, "skipped" if report.skipped else "passed")
+
+    def pytest_sessionfinish(self) -> None:
+        if self.path:
+            Path(self.path).write_text(json.dumps(self.outcomes, indent=1), encoding="utf-8")
+        if self.collected_path:
+            Path(self.collected_path).write_text(json.dumps(self.collected), encoding="utf-8")
+
+
+class Selector:
+    """collects the selected node ids only (the items of the other functions and classes are never made)"""
+
+    def __init__(self, select: dict[str, list[str]]) -> None:
+        self.select = {str(Path(path).resolve()): nodeids for path, nodeids in select.items()}
+        self.modules: dict[str, list[str] | None] = {}
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_pycollect_makeitem(self, collector: pytest.Module | pytest.Class, name: str, obj: object) -> Any:
+        if (module := collector.getparent(pytest.Module)) is None:
+            return None
+        if module.nodeid not in self.modules:
+            self.modules[module.nodeid] = self.select.get(str(Path(module.path).resolve()))
+        if (nodeids := self.modules[module.nodeid]) is None:
+            return None
+        # the node id (past the module one) the collected item would have
+        nodeid = f"{collector.nodeid[len(module.nodeid):]}::{name}"[2:]
+        for selected in nodeids:
+            if selected == nodeid or selected.startswith((f"{nodeid}[", f"{nodeid}::")):
+                return None
+            if nodeid.startswith(f"{selected}::"):
+                return None
+        return []
+
+
+class Tracer:
+    """traces the allocations with tracemalloc"""
+
+    def __init__(self, top: int, include: list[str], output: str) -> None:
+        import tracemalloc
+
+        self.top = top
+        self.include = include
+        self.output = output
+        tracemalloc.start()
+
+    def pytest_sessionfinish(self) -> None:
+        import tracemalloc
+
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        if self.include:
+            snapshot = snapshot.filter_traces([tracemalloc.Filter(True, pattern) for pattern in self.include])
+        top = [
+            {
+                "file": stat.traceback[0].filename,
+                "line": stat.traceback[0].lineno,
+                "size": stat.size,
+                "count": stat.count,
+            }
+            for stat in snapshot.statistics("lineno")[: self.top]
+        ]
+        data = {"traced_peak": peak, "top": top}
+        Path(self.output).write_text(json.dumps(data, indent=1), encoding="utf-8")
+
+
+class Coverage:
+    """collects the coverage with sys.monitoring"""
+
+    def __init__(self, files: list[str], output: str) -> None:
+        from pytest_tdd import monitor
+
+        self.output = output
+        self.monitor = monitor.Monitor(files)
+        self.monitor.start()
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_sessionfinish(self, session: pytest.Session) -> None:
+        self.monitor.stop()
+        report = self.monitor.report(session.config.invocation_params.dir)
+        Path(self.output).write_text(json.dumps(report, indent=1), encoding="utf-8")
+
+
+class MutantFinder:
+    """imports module from path (a mutant) in place of the original"""
+
+    def __init__(self, module: str, path: str, origin: str) -> None:
+        self.module = module
+        self.path = path
+        self.origin = origin
+
+    def find_spec(self, fullname: str, path: Any = None, target: Any = None) -> ModuleSpec | None:
+        if fullname != self.module:
+            return None
+        from importlib.util import spec_from_file_location
+
+        # a package keeps its submodules
+        locations = [str(Path(self.origin).parent)] if Path(self.origin).name == "__init__.py" else None
+        return spec_from_file_location(fullname, self.path, submodule_search_locations=locations)
+
+
+def load_plan() -> dict[str, Any] | None:
+    if not (path := os.getenv(PLAN_ENV)):
+        return None
+    result: dict[str, Any] = json.loads(Path(path).read_text(encoding="utf-8"))
+    return result
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_load_initial_conftests(early_config: pytest.Config) -> None:
+    # as early as possible: the conftest.py files may import the modules under test
+    if not (plan := load_plan()):
+        return
+    if "mutant" in plan:
+        sys.meta_path.insert(0, MutantFinder(**plan["mutant"]))
+    if "monitor" in plan and sys.version_info < (3, 12):
+        warnings.warn("the monitor coverage needs python 3.12+, no coverage collected", stacklevel=1)
+    elif "monitor" in plan:
+        early_config.pluginmanager.register(Coverage(**plan["monitor"]), "pytest-tdd-coverage")
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    if not (plan := load_plan()):
+        return
+    if "outcomes" in plan:
+        config.pluginmanager.register(Tracker(plan), "pytest-tdd-tracker")
+    if "select" in plan:
+        config.pluginmanager.register(Selector(plan["select"]), "pytest-tdd-selector")
+    if "tracemalloc" in plan:
+        config.pluginmanager.register(Tracer(**plan["tracemalloc"]), "pytest-tdd-tracer")
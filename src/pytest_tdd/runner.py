@@ -0,0 +1,685 @@
+"""
+The test runner pipeline.
+
+Both the command line (`pytest_tdd.script`) and library users run tests
+through a `Runner`, made of these stages::
+
+    discover -> plan -> execute -> collect -> report
+
+    discover   finds the test candidates for a source (or the sources
+               exercised by a test)
+    plan       turns the sources into Units (what to run, with which
+               coverage modules, where)
+    execute    runs a Unit using an Engine (default `SubprocessEngine`)
+    collect    parses a run Result into a Summary (tests and coverage totals)
+    report     hands the Result and the Summary to the sinks
+
+Engines and sinks are pluggable: an Engine is anything with an
+`execute(unit) -> Result` method, a sink any callable taking
+`(result, summary)`.
+
+Example:
+    >>> resolver = tdd.Resolver([Path("src")], [Path("tests")])
+    >>> runner = Runner(resolver, sinks=[PrintSink()])
+    >>> runner.run([Path("src/package/module.py")], workdir)
+    module.py run 4 tests with 1 failures and 0 errors, covered 3 lines out of 4 (75.0%, missing=1 lines)
+    1
+"""
+
+from __future__ import annotations
+
+import dataclasses as dc
+import json
+import logging
+import os
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterator, Protocol, Sequence
+
+from pytest_tdd import index, metadata, misc, tdd
+
+if TYPE_CHECKING:
+    from pytest_tdd import cache, collection, history, limits
+
+log = logging.getLogger(__name__)
+
+
+def is_test(path: Path) -> bool:
+    return path.name.startswith("test_")
+
+
+@dc.dataclass
+class Unit:
+    source: Path
+    modules: list[str]
+    candidates: list[Path]
+    pythonpath: list[Path] = dc.field(default_factory=list)
+    workdir: Path = Path()
+    cwd: Path | None = None
+    first: list[str] = dc.field(default_factory=list)  # node ids to run first
+    quarantine: list[str] = dc.field(default_factory=list)  # node ids in quarantine
+    markers: str | None = None  # a marker expression (pytest -m)
+
+
+@dc.dataclass
+class Result:
+    unit: Unit
+    returncode: int
+    cmd: list[str] = dc.field(default_factory=list)
+    stdout: str = ""
+    stderr: str = ""
+    tests: str | None = None
+    coverage: str | None = None
+    datafile: Path | None = None
+    outcomes: dict[str, str] | None = None
+    collected: dict[str, dict[str, Any]] | None = None
+    memory: dict[str, Any] | None = None
+    limit: str | None = None  # the resource limit hit (see pytest_tdd.limits)
+
+    def asdict(self) -> dict[str, Any]:
+        return {
+            "cmd": self.cmd,
+            "stdout": self.stdout,
+            "stderr": self.stderr,
+            "tests": self.tests,
+            "coverage": self.coverage,
+            "memory": self.memory,
+            "limit": self.limit,
+        }
+
+
+@dc.dataclass
+class Summary:
+    tests: dict[str, int] | None = None
+    coverage: dict[str, Any] | None = None
+    memory: dict[str, Any] | None = None
+    limit: str | None = None
+
+    @classmethod
+    def parse(
+        cls,
+        tests: str | None = None,
+        coverage: str | None = None,
+        datafile: Path | None = None,
+        memory: dict[str, Any] | None = None,
+        limit: str | None = None,
+    ) -> Summary:
+        """parses the junit xml tests report and the json coverage report (or the coverage data file)"""
+        summary = cls(memory=memory, limit=limit)
+        totals: dict[str, Any] | None = None
+        if coverage:
+            totals = json.loads(coverage)["totals"]
+        elif datafile:
+            totals = coverage_totals(datafile)
+        if totals is not None:
+            total = totals["num_statements"]
+            summary.coverage = {
+                "covered_lines": totals["covered_lines"],
+                "num_statements": total,
+                "missing_lines": totals["missing_lines"],
+                "percent": round(100.0 * totals["covered_lines"] / total, 2) if total else 100.0,
+            }
+
+        if tests:
+            counts = {"errors": 0, "failures": 0, "skipped": 0, "tests": 0}
+            for testsuite in ET.fromstring(tests):
+                for name in counts:
+                    counts[name] += int(testsuite.attrib.get(name, 0))
+            summary.tests = counts
+        return summary
+
+    def line(self, name: str) -> str:
+        coverage = "coverage n/a"
+        if self.coverage:
+            lines, total = self.coverage["covered_lines"], self.coverage["num_statements"]
+            missing = self.coverage["missing_lines"]
+            percent = self.coverage["percent"]
+            coverage = (
+                f"covered {lines} lines out of {total} ({percent}%, {missing=} lines)"
+            )
+
+        tests = "tests n/a"
+        if self.tests:
+            tests = (
+                f"run {self.tests['tests']} tests with {self.tests['failures']} "
+                f"failures and {self.tests['errors']} errors"
+            )
+        memory = []
+        if self.memory and self.memory.get("peak_rss"):
+            memory.append(f"peak memory {self.memory['peak_rss'] / 2**20:.1f} MiB")
+        if self.memory and (top := self.memory.get("top")):
+            memory.append(f"top allocation {top[0]['file']}:{top[0]['line']} ({top[0]['size'] / 2**10:.1f} KiB)")
+        if self.limit:
+            # a distinct outcome, not just a failure
+            name = f"{name} hit the {self.limit} limit,"
+        return ", ".join([f"{name} {tests}", coverage, *memory])
+
+
+def module_path(module: str, pythonpath: Sequence[Path], cwd: Path | None = None) -> Path | None:
+    """the file of module (the directory of a package) in the first pythonpath root holding it"""
+    for root in pythonpath:
+        path = (cwd or Path.cwd()) / root / module.replace(".", os.sep)
+        if path.with_suffix(".py").exists():
+            return path.with_suffix(".py")
+        if (path / "__init__.py").exists():
+            return path
+    return None
+
+
+def modules_source(modules: Sequence[str], pythonpath: Sequence[Path], cwd: Path | None = None) -> Path:
+    """
+    The Unit source for modules: the module file (or package directory), or
+    the directory holding them all.
+
+    Raises:
+        ValueError: a module isn't found in pythonpath.
+
+    """
+    paths = []
+    for module in modules:
+        if (path := module_path(module, pythonpath, cwd)) is None:
+            raise ValueError(f"cannot find module {module} in {', '.join(str(p) for p in pythonpath)}")
+        paths.append(path)
+    if not paths:
+        raise ValueError("no modules")
+    return paths[0] if len(paths) == 1 else Path(os.path.commonpath(paths))
+
+
+class Engine(Protocol):
+    def execute(self, unit: Unit) -> Result: ...
+
+
+class SubprocessEngine:
+    """
+    Runs pytest in a child process (with pytest-cov for the coverage).
+
+    With report="json" pytest-cov writes a full json report (every file
+    executed/missing lines); with report="data" the reporting is turned off
+    and only the coverage data file is kept: the totals (and the lines, if
+    ever needed) are computed from it on demand (see `collect`); with
+    report="monitor" pytest-cov isn't used at all, the plugin collects the
+    coverage with sys.monitoring (see `pytest_tdd.monitor`, python 3.12+ only)
+    into the same json report.
+
+    With track=True the child loads `pytest_tdd.plugin`: it runs the Unit
+    first tests first, reruns (up to reruns times) the quarantined ones and
+    reports each test outcome (in Result.outcomes).
+
+    With memory=True the child peak RSS is measured (from wait4, where
+    available) and, with tracemalloc=N, the plugin reports the N top
+    allocation sites (in the module under test) still alive at the end of the
+    run (in Result.memory).
+
+    With limits (see `pytest_tdd.limits`) the child runs with resource limits
+    (in its own cgroup too with cgroup=True, if cgroup v2 is available) and
+    a limit hit is reported in Result.limit.
+    """
+
+    def __init__(
+        self,
+        args: Sequence[str] = ("-vv",),
+        exe: str = "pytest",
+        report: str = "json",
+        track: bool = False,
+        reruns: int = 2,
+        memory: bool = False,
+        tracemalloc: int = 0,
+        limits: limits.Limits | None = None,
+        cgroup: bool = False,
+    ) -> None:
+        if report not in {"json", "data", "monitor"}:
+            raise ValueError(f"invalid coverage report {report!r}", report)
+        self.args = list(args)
+        self.exe = exe
+        self.report = report
+        self.track = track
+        self.reruns = reruns
+        self.memory = memory
+        self.tracemalloc = tracemalloc
+        self.limits = limits
+        self.cgroup = cgroup
+
+    def plan(self, unit: Unit) -> dict[str, Any]:
+        """the plan for the child plugin (see `pytest_tdd.plugin`), empty if not needed"""
+        plan: dict[str, Any] = {}
+        if self.track:
+            plan.update(
+                {
+                    "first": unit.first,
+                    "quarantine": unit.quarantine,
+                    "reruns": self.reruns,
+                    "outcomes": str(unit.workdir / "outcomes.json"),
+                    "collected": str(unit.workdir / "collected.json"),
+                }
+            )
+        if select := self.selection(unit):
+            plan["select"] = select
+        if self.tracemalloc:
+            include = [unit.source] if not is_test(unit.source) else [p / "*" for p in unit.pythonpath]
+            plan["tracemalloc"] = {
+                "top": self.tracemalloc,
+                "include": [str(path) for path in include],
+                "output": str(unit.workdir / "memory.json"),
+            }
+        if self.report == "monitor" and unit.modules:
+            plan["monitor"] = {
+                "files": [str(path) for path in self.sources(unit)],
+                "output": str(unit.workdir / "coverage.json"),
+            }
+        return plan
+
+    def selection(self, unit: Unit) -> dict[str, list[str]]:
+        """the node ids to collect from each test file (the files run as a whole aren't listed)"""
+        cwd = unit.cwd or Path.cwd()
+        nodeids: dict[str, list[str] | None] = {}
+        for candidate in unit.candidates:
+            filename, _, nodeid = str(candidate).partition(index.SEP)
+            path = str(cwd / filename)
+            if not nodeid:
+                nodeids[path] = None
+            elif (selected := nodeids.setdefault(path, [])) is not None:
+                selected.append(nodeid)
+        return {path: selected for path, selected in nodeids.items() if selected}
+
+    def sources(self, unit: Unit) -> list[Path]:
+        """the files of the unit modules (a package stands for all its files)"""
+        result = []
+        for mod in unit.modules:
+            if (path := module_path(mod, unit.pythonpath, unit.cwd)) is None:
+                continue
+            result.extend(sorted(path.rglob("*.py")) if path.is_dir() else [path])
+        return result
+
+    def command(self, unit: Unit, cgroup: Path | None = None) -> list[str]:
+        xmlout = unit.workdir / "xmlout.xml"
+        cmdline: list[str | Path] = [self.exe, *self.args, "--junit-xml", xmlout]
+        if self.plan(unit):
+            cmdline.extend(["-p", "pytest_tdd.plugin"])
+        if unit.markers:
+            cmdline.extend(["-m", unit.markers])
+        if unit.modules and self.report != "monitor":
+            cmdline.extend(["--cov-reset", *(arg for mod in unit.modules for arg in ["--cov", mod])])
+            if self.report == "json":
+                cmdline.extend(["--cov-report", f"json:{unit.workdir / 'coverage.json'}"])
+            else:
+                cmdline.append("--cov-report=")
+        cmd = [str(c) for c in [*cmdline, *unit.candidates]]
+        return self.limits.wrap(cmd, cgroup) if self.limits else cmd
+
+    def environ(self, unit: Unit) -> dict[str, str]:
+        env = os.environ.copy()
+        env["PYTHONPATH"] = os.pathsep.join(
+            [*(str(p) for p in unit.pythonpath), *env.get("PYTHONPATH", "").split(os.pathsep)]
+        )
+        if self.report == "data":
+            env["COVERAGE_FILE"] = str(unit.workdir / ".coverage")
+        plan = self.plan(unit)
+        if plan:
+            from pytest_tdd import plugin
+
+            path = unit.workdir / "plan.json"
+            path.write_text(json.dumps(plan), encoding="utf-8")
+            env[plugin.PLAN_ENV] = str(path)
+        if plan or self.limits:
+            # the child must be able to load the plugin (or the limits launcher)
+            env["PYTHONPATH"] = os.pathsep.join([env["PYTHONPATH"], str(Path(__file__).parent.parent)])
+        return env
+
+    def _load(self, path: Path) -> Any:
+        return json.loads(path.read_text(encoding="utf-8")) if path.exists() else None
+
+    def outcomes(self, unit: Unit) -> dict[str, str] | None:
+        result: dict[str, str] | None = self._load(unit.workdir / "outcomes.json") if self.track else None
+        return result
+
+    def collected(self, unit: Unit) -> dict[str, dict[str, Any]] | None:
+        result: dict[str, dict[str, Any]] | None = self._load(unit.workdir / "collected.json") if self.track else None
+        return result
+
+    def datafile(self, unit: Unit) -> Path | None:
+        path = unit.workdir / ".coverage"
+        return path if self.report == "data" and unit.modules and path.exists() else None
+
+    def memory_usage(self, unit: Unit, peak_rss: int | None) -> dict[str, Any] | None:
+        if not self.memory:
+            return None
+        result: dict[str, Any] = {"peak_rss": peak_rss}
+        if self.tracemalloc:
+            result.update(self._load(unit.workdir / "memory.json") or {})
+        return result
+
+    def limit(
+        self, returncode: int, output: str, cgroup: limits.Cgroup | None = None, cputime: float | None = None
+    ) -> str | None:
+        """returns the limit the run hit (if any)"""
+        if not self.limits:
+            return None
+        from pytest_tdd import limits
+
+        return limits.hit(self.limits, returncode, output, cgroup, cputime)
+
+    def wait(self, p: subprocess.Popen[bytes]) -> tuple[int | None, float | None]:
+        """waits for the child, returns its peak RSS (in bytes) and cpu time (in seconds), if available"""
+        if not ((self.memory or (self.limits and self.limits.cpu is not None)) and hasattr(os, "wait4")):
+            p.wait()
+            return None, None
+        _, status, usage = os.wait4(p.pid, 0)
+        p.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        # ru_maxrss is in KiB (in bytes on macOS)
+        return int(usage.ru_maxrss) * (1 if sys.platform == "darwin" else 1024), usage.ru_utime + usage.ru_stime
+
+    def execute(self, unit: Unit) -> Result:
+        stdout = unit.workdir / "stdout.txt"
+        stderr = unit.workdir / "stderr.txt"
+        xmlout = unit.workdir / "xmlout.xml"
+        coverage = unit.workdir / "coverage.json"
+
+        cgroup = None
+        if self.limits and self.cgroup:
+            from pytest_tdd import limits
+
+            cgroup = limits.Cgroup.create(f"pytest-tdd-{os.getpid()}-{id(unit):x}", self.limits)
+        cmd = self.command(unit, cgroup.path if cgroup else None)
+        try:
+            with stdout.open("w") as out, stderr.open("w") as err:
+                p = subprocess.Popen(
+                    cmd,
+                    cwd=None if unit.cwd is None else str(unit.cwd),
+                    stdout=out,
+                    stderr=err,
+                    env=self.environ(unit),
+                )
+                peak_rss, cputime = self.wait(p)
+            assert p.returncode is not None
+            limit = self.limit(p.returncode, stdout.read_text() + stderr.read_text(), cgroup, cputime)
+        finally:
+            if cgroup:
+                cgroup.remove()
+
+        return Result(
+            unit,
+            p.returncode,
+            cmd,
+            stdout.read_text(),
+            stderr.read_text(),
+            xmlout.read_text() if xmlout.exists() else None,
+            coverage.read_text() if coverage.exists() else None,
+            datafile=self.datafile(unit),
+            outcomes=self.outcomes(unit),
+            collected=self.collected(unit),
+            memory=self.memory_usage(unit, peak_rss),
+            limit=limit,
+        )
+
+
+def coverage_files(datafile: Path) -> dict[str, list[int]]:
+    """returns the executed lines for each measured file in a coverage data file"""
+    from coverage import CoverageData
+
+    data = CoverageData(str(datafile))
+    data.read()
+    return {name: sorted(data.lines(name) or []) for name in data.measured_files()}
+
+
+def coverage_totals(datafile: Path) -> dict[str, int]:
+    """
+    Computes the coverage totals from a coverage data file.
+
+    Args:
+        datafile: the .coverage file (as written by coverage/pytest-cov).
+
+    Returns:
+        The statements, covered and missing lines counts (the json report "totals").
+
+    """
+    from coverage import Coverage
+
+    cov = Coverage(data_file=str(datafile))
+    cov.load()
+    totals = {"covered_lines": 0, "num_statements": 0, "missing_lines": 0}
+    for name in cov.get_data().measured_files():
+        _, statements, _, missing, _ = cov.analysis2(name)
+        totals["num_statements"] += len(statements)
+        totals["missing_lines"] += len(missing)
+        totals["covered_lines"] += len(statements) - len(missing)
+    return totals
+
+
+def collect(result: Result) -> Summary:
+    """parses the run result into a Summary"""
+    return Summary.parse(result.tests, result.coverage, result.datafile, result.memory, result.limit)
+
+
+class PrintSink:
+    """prints the summary line"""
+
+    def __call__(self, result: Result, summary: Summary) -> None:
+        print(summary.line(result.unit.source.name))
+
+
+class JsonSink:
+    """appends a json line per result (the summary and the return code) to path"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def __call__(self, result: Result, summary: Summary) -> None:
+        data = {"source": str(result.unit.source), "returncode": result.returncode, **dc.asdict(summary)}
+        with self.path.open("a", encoding="utf-8") as fp:
+            fp.write(json.dumps(data) + "\n")
+
+
+class LogSink:
+    """logs the command and its output on failures"""
+
+    def __call__(self, result: Result, summary: Summary) -> None:
+        if not result.returncode:
+            return
+        msgs = []
+        msgs.append("cmd:")
+        msgs.append(f"|  {' '.join(result.cmd)}")
+        log.warning("failed to run tests")
+        log.warning("\n".join(msgs))
+        if result.stderr.strip():
+            log.warning("stderr:\n%s", misc.indent(result.stderr, "|  "))
+        if result.stdout.strip():
+            log.warning("stdout:\n%s", misc.indent(result.stdout, "|  "))
+
+
+Sink = Callable[[Result, Summary], None]
+
+
+class Runner:
+    def __init__(
+        self,
+        resolver: tdd.Resolver,
+        engine: Engine | None = None,
+        idx: index.Index | None = None,
+        store: cache.Cache | None = None,
+        sinks: Sequence[Sink] = (),
+        listing: tdd.Listing | None = None,
+        cwd: Path | None = None,
+        history: history.History | None = None,
+        quarantine: bool = False,
+        collection: collection.Collection | None = None,
+        markers: str | None = None,
+        release: int = 3,
+    ) -> None:
+        self.resolver = resolver
+        self.engine: Engine = engine or SubprocessEngine()
+        self.index = idx
+        self.store = store
+        self.sinks = list(sinks)
+        self.listing = listing or tdd.Listing()
+        self.cwd = cwd
+        self.recorded = False
+        self.history = history
+        self.quarantine = quarantine
+        self.collection = collection
+        self.markers = markers
+        self.release = release
+
+    def discover(self, source: Path) -> list[Path]:
+        """returns the existing test candidates for source"""
+        if is_test(source):
+            return [source]
+
+        hints = []
+        try:
+            meta = metadata.extract(source, self.store)
+            log.debug("source doc: %s", (meta.doc or "").partition("\n")[0] or "n/a")
+            log.debug("source hints: %s", ", ".join(meta.hints) or "n/a")
+            hints = meta.hints
+        except SyntaxError as exc:
+            log.warning("cannot parse %s: %s", source, exc)
+
+        if self.index is not None:
+            # the source own hints are always up to date (replacing the indexed ones)
+            key = index.relpath(source, self.index.rootdir)
+            pairs = [pair for pair in self.index.declared.get(key, []) if pair[0] != key]
+            for hint in hints:
+                pairs.extend([key, match] for match in index.expand(hint, self.index.rootdir))
+            self.index.declare(key, pairs)
+
+        # filter out candidates
+        to_be_run = []
+        for candidate in self.resolver.candidates(source, index=self.index):
+            exists = self.listing.exists(Path(str(candidate).partition(index.SEP)[0]))
+            if exists and candidate not in to_be_run:
+                to_be_run.append(candidate)
+            log.debug("file %s %s", "found" if exists else "not found", candidate)
+        return to_be_run
+
+    def plan(self, sources: Sequence[Path], workdir: Path) -> list[Unit]:
+        """returns the Units to run for sources (each one with its own workdir)"""
+        units = []
+        for number, source in enumerate(sources):
+            source = source.absolute()
+            if is_test(source):
+                # run the test, measuring the sources it exercises
+                covered = tdd.lookup_sources(source, self.resolver, self.index, self.listing)
+                modules = [self.resolver.module(path) for path in covered]
+                log.debug("test file: %s (covering %s)", source, ", ".join(modules) or "n/a")
+                pythonpath = self.resolver.sources_dirs
+            else:
+                modules = [self.resolver.module(source)]
+                log.debug("source file: %s (mod %s)", source, modules[0])
+                pythonpath = [self.resolver.root(source) or Path()]
+
+            unit = Unit(source, modules, self.discover(source), pythonpath, workdir / f"{number:05}", self.cwd)
+            if self.history is not None:
+                key = self.key(unit)
+                unit.first = self.history.failed(key)
+                unit.quarantine = self.history.quarantined(key) if self.quarantine else []
+            if self.markers:
+                self.select(unit, self.markers)
+            unit.workdir.mkdir(parents=True, exist_ok=True)
+            units.append(unit)
+        return units
+
+    def select(self, unit: Unit, markers: str) -> None:
+        """restricts unit to the tests matching markers (using the cached collection if possible)"""
+        selected = self.collection.select(unit.candidates, markers) if self.collection else None
+        if selected:
+            log.debug("selected %i tests from the cached collection", len(selected))
+            unit.candidates = selected
+        else:
+            # let pytest collect and deselect
+            unit.markers = markers
+
+    def key(self, unit: Unit) -> str:
+        """the unit key in the history"""
+        return index.relpath(unit.source, self.cwd or Path.cwd())
+
+    def digest(self, unit: Unit) -> str:
+        """
+        The digest of the code a unit runs.
+
+        This covers the source, the tests, their conftest.py files, the project
+        configuration and (with an index) the sources recorded for the tests.
+        """
+        from pytest_tdd import cache, collection
+
+        rootdir = self.index.rootdir if self.index is not None else (self.cwd or Path.cwd())
+        tests = {Path(str(candidate).partition(index.SEP)[0]).absolute() for candidate in unit.candidates}
+        paths = {unit.source, *tests}
+        for test in tests:
+            paths.update(collection.configs(test, rootdir))
+            if self.index is not None:
+                paths.update(self.index.sources(test))
+        parts: list[str | bytes] = []
+        for path in sorted(paths):
+            try:
+                parts.extend([str(path), path.read_bytes()])
+            except OSError:
+                continue
+        return cache.digest(*parts)
+
+    def execute(self, units: Sequence[Unit], jobs: int = 1) -> Iterator[Result]:
+        """runs the units (jobs at the time), yielding results in order"""
+        if jobs <= 1 or len(units) < 2:
+            yield from (self.engine.execute(unit) for unit in units)
+            return
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            yield from pool.map(self.engine.execute, units)
+
+    def collect(self, result: Result) -> Summary:
+        summary = collect(result)
+        if self.index is not None and (result.coverage or result.datafile):
+            self.recorded |= self.record(result)
+        if self.history is not None and result.outcomes is not None:
+            self.track(result)
+        if self.collection is not None and result.collected:
+            for path, data in result.collected.items():
+                self.collection.put(Path(path), data)
+        return summary
+
+    def track(self, result: Result) -> None:
+        """records the outcomes in the history, putting the flaky tests in quarantine"""
+        assert self.history is not None
+        assert result.outcomes is not None
+        key = self.key(result.unit)
+        digest = self.digest(result.unit)
+        self.history.record(key, digest, result.outcomes)
+        if self.release:
+            for nodeid in self.history.recover(key, self.release):
+                log.warning("test %s released from quarantine", nodeid)
+        # the quarantine applies to the runs with quarantine=True only
+        for nodeid in self.history.quarantine(key, self.history.flaky(key, digest)):
+            log.warning("flaky test %s put in quarantine", nodeid)
+
+    def record(self, result: Result) -> bool:
+        """records in the index the sources exercised by the candidates"""
+        assert self.index is not None
+        cwd = result.unit.cwd or Path.cwd()
+        if result.coverage:
+            report = json.loads(result.coverage).get("files", {})
+            files = {name: data.get("executed_lines") for name, data in report.items()}
+        else:
+            assert result.datafile
+            files = coverage_files(result.datafile)
+        covered = [cwd / name for name, lines in files.items() if lines and Path(name).suffix == ".py"]
+        if not is_test(result.unit.source):
+            covered = [path for path in covered if path == result.unit.source]
+        changed = False
+        for candidate in result.unit.candidates:
+            test = Path(str(candidate).partition(index.SEP)[0])
+            previous = [self.index.rootdir / path for path in self.index.covers.get(index.relpath(test, self.index.rootdir), [])]
+            changed |= self.index.record(test, list({*previous, *covered}))
+        return changed
+
+    def report(self, result: Result, summary: Summary) -> None:
+        for sink in self.sinks:
+            sink(result, summary)
+
+    def run(self, sources: Sequence[Path], workdir: Path, jobs: int = 1) -> int:
+        """runs the whole pipeline, returns the first non zero return code"""
+        retcode = 0
+        for result in self.execute(self.plan(sources, workdir), jobs):
+            self.report(result, self.collect(result))
+            retcode = retcode or result.returncode
+        return retcode
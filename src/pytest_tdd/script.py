@@ -3,7 +3,7 @@ given a python module execute related tests.
 
 Example:
     $> pytest-tdd \\
-         --src src --tests tests \\
+         --sources-dir src --tests-dir tests \\
          src/mylibrary/mysubdir/hello.py
     or (the default)
     $> pytest-tdd src/mylibrary/mysubdir/hello.py
@@ -12,127 +12,159 @@ Example:
     - tests/mylibrary/subdir/test_hello.py
     - tests/test_hello.py
 
+    Multiple sources (and multiple sources/tests dirs) can be passed
+    in a single invocation:
+    $> pytest-tdd \\
+         -s pkg1/src -t pkg1/tests -s pkg2/src -t pkg2/tests \\
+         pkg1/src/lib1/hello.py pkg2/src/lib2/world.py
+
 """
 from __future__ import annotations
 
-import dataclasses as dc
-import json
 import logging
-import os
-import subprocess
 import sys
-import xml.etree.ElementTree as ET
 from pathlib import Path
 from typing import Any
 
 import click
 from click.core import Context
 
-from pytest_tdd import misc, tdd
+# NOTE: this module is imported on every invocation (even for --help),
+# keep the imports here to a minimum: the heavy modules (runner, index ...)
+# are imported when the tests are actually run.
 
 log = logging.getLogger(__name__)
 
 
 def run(
     workdir: Path,
-    module: str,
+    module: str | list[str],
     candidates: list[Path],
-    sources_dir: Path,
+    sources_dir: Path | list[Path],
 ) -> tuple[int, dict[str, str | list[str] | None]]:
-    env = os.environ.copy()
+    from pytest_tdd import misc, runner
 
-    env["PYTHONPATH"] = os.pathsep.join(
-        [str(sources_dir), *env.get("PYTHONPATH", "").split(os.pathsep)]
-    )
-    stdout = workdir / "stdout.txt"
-    stderr = workdir / "stderr.txt"
-    xmlout = workdir / "xmlout.xml"
-
-    cmdline = [
-        "pytest",
-        "-vvs",
-        "--junit-xml",
-        xmlout,
-    ]
-
-    coverage = workdir / "coverage.json"
-    cmdline.extend(
-        [
-            "--cov-reset",
-            "--cov",
-            module,
-            "--cov-report",
-            f"json:{coverage}",
-        ]
-    )
-
-    cmd = [str(c) for c in [*cmdline, *candidates]]
-
-    p = subprocess.Popen(
-        cmd,
-        stdout=stdout.open("w"),
-        stderr=stderr.open("w"),
-        env=env,
-    )
-    p.communicate()
-
-    return p.returncode, {
-        "cmd": cmd,
-        "stdout": stdout.read_text(),
-        "stderr": stderr.read_text(),
-        "tests": xmlout.read_text() if xmlout.exists() else None,
-        "coverage": coverage.read_text() if coverage.exists() else None,
-    }
+    modules = [module] if isinstance(module, str) else module
+    pythonpath = misc.list_of_paths(sources_dir)
+    # the unit is keyed by its source (see runner.Runner.key)
+    unit = runner.Unit(runner.modules_source(modules, pythonpath), modules, candidates, pythonpath, workdir)
+    result = runner.SubprocessEngine(args=["-vvs"]).execute(unit)
+    return result.returncode, result.asdict()
 
 
 def compute(source: Path, result: dict[str, Any]) -> str:
-    coverage = "coverage n/a"
-    if result["coverage"]:
-        cov = json.loads(result["coverage"])
-        lines, total = cov["totals"]["covered_lines"], cov["totals"]["num_statements"]
-        missing = cov["totals"]["missing_lines"]
-        percent = round(
-            100.0 * cov["totals"]["covered_lines"] / cov["totals"]["num_statements"], 2
-        )
-        coverage = (
-            f"covered {lines} lines out of {total} ({percent}%, {missing=} lines)"
-        )
+    from pytest_tdd import runner
 
-    tests = "tests n/a"
-    if result["tests"]:
-        totals = {"errors": 0, "failures": 0, "skipped": 0, "tests": 0}
-        testsuites = ET.fromstring(result["tests"])
-        for testsuite in testsuites:
-            totals["errors"] += int(testsuite.attrib.get("errors", 0))
-            totals["failures"] += int(testsuite.attrib.get("failures", 0))
-            totals["skipped"] += int(testsuite.attrib.get("skipped", 0))
-            totals["tests"] += int(testsuite.attrib.get("tests", 0))
-        tests = (
-            f"run {totals['tests']} tests with {totals['failures']} "
-            f"failures and {totals['errors']} errors"
-        )
-    return f"{source.name} {tests}, {coverage}"
+    return runner.Summary.parse(result["tests"], result["coverage"]).line(source.name)
 
 
 @click.command()
-@click.argument("source", type=click.Path(path_type=Path))
+@click.argument("sources", nargs=-1, required=True, type=click.Path(path_type=Path))
 @click.option(
     "-t",
     "--tests-dir",
-    default="tests",
+    "tests_dirs",
+    multiple=True,
+    default=["tests"],
     type=click.Path(exists=True, file_okay=False, path_type=Path),
+    help="tests directory (can be repeated)",
 )
 @click.option(
     "-s",
     "--sources-dir",
-    default="src",
+    "sources_dirs",
+    multiple=True,
+    default=["src"],
     type=click.Path(exists=True, file_okay=False, path_type=Path),
+    help="sources directory (can be repeated)",
 )
 @click.option("-v", "--verbose", count=True)
 @click.option("-q", "--quiet", count=True)
 @click.option("-k", "--keep", is_flag=True, help="keep results on error")
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    help="cache directory (or $PYTEST_TDD_CACHE_DIR, default .pytest-tdd)",
+)
+@click.option("--index/--no-index", "use_index", default=True, help="use the declared tests index")
+@click.option("--rebuild-index", is_flag=True, help="rebuild the declared tests index")
+@click.option("-j", "--jobs", default=1, type=click.IntRange(min=1), help="run up to jobs sources at once")
+@click.option(
+    "--coverage-report",
+    default="json",
+    type=click.Choice(["json", "data", "monitor"]),
+    help="read the coverage from a json report or (faster) straight from the coverage data, "
+    "or collect it with sys.monitoring (fastest, python 3.12+)",
+)
+@click.option(
+    "--threshold",
+    type=click.FloatRange(min=0, max=100),
+    help="fail the modules with a coverage (percent) below threshold",
+)
+@click.option(
+    "--no-regression",
+    is_flag=True,
+    help="fail the modules with a coverage below their previous run (the baseline)",
+)
+@click.option("--history/--no-history", "use_history", default=True, help="run the last failed tests first")
+@click.option("--quarantine", is_flag=True, help="quarantine the flaky tests (rerun them, ignore their failures)")
+@click.option("--reruns", default=2, type=click.IntRange(min=0), help="reruns for the quarantined tests")
+@click.option(
+    "--release",
+    default=3,
+    type=click.IntRange(min=0),
+    help="release the quarantined tests passing this many runs in a row (0 never)",
+)
+@click.option("-m", "--markers", help="only run the tests matching the marker expression (as pytest -m)")
+@click.option("--memory", is_flag=True, help="report the peak memory (and check it against the baseline)")
+@click.option(
+    "--tracemalloc",
+    default=0,
+    type=click.IntRange(min=0),
+    help="with --memory, report the top allocation sites in the module",
+)
+@click.option("--max-memory", type=click.IntRange(min=1), help="limit each run memory (in MiB)")
+@click.option("--max-cpu", type=click.IntRange(min=1), help="limit each run cpu time (in seconds)")
+@click.option("--max-files", type=click.IntRange(min=1), help="limit each run open files")
+@click.option("--max-processes", type=click.IntRange(min=1), help="limit each run processes")
+@click.option("--cgroup", is_flag=True, help="run each test run in its own cgroup (cgroup v2 only)")
+@click.option("--mutate", is_flag=True, help="mutation test the sources (run their tests against mutants)")
+@click.option("--json", "json_path", type=click.Path(dir_okay=False, path_type=Path), help="append the results to file")
 @click.pass_context
-def main(ctx: Context, source: Path, sources_dir: Path, tests_dir: Path, verbose: int, quiet: int, keep: bool) -> int:
+def main(
+    ctx: Context,
+    sources: tuple[Path, ...],
+    sources_dirs: tuple[Path, ...],
+    tests_dirs: tuple[Path, ...],
+    verbose: int,
+    quiet: int,
+    keep: bool,
+    cache_dir: Path | None,
+    use_index: bool,
+    rebuild_index: bool,
+    jobs: int,
+    coverage_report: str,
+    threshold: float | None,
+    no_regression: bool,
+    use_history: bool,
+    quarantine: bool,
+    reruns: int,
+    release: int,
+    markers: str | None,
+    memory: bool,
+    tracemalloc: int,
+    json_path: Path | None,
+    max_memory: int | None,
+    max_cpu: int | None,
+    max_files: int | None,
+    max_processes: int | None,
+    cgroup: bool,
+    mutate: bool,
+) -> None:
+    import dataclasses as dc
+
+    from pytest_tdd import baseline, cache, collection, history, index, limits, misc, runner, tdd
+
     level = min(max(verbose - quiet, -1), 1)
     logging.basicConfig(
         level=logging.DEBUG
@@ -142,9 +174,15 @@ def main(ctx: Context, source: Path, sources_dir: Path, tests_dir: Path, verbose
         else logging.WARNING
     )
 
-    tests_dir = tests_dir.absolute()
-    sources_dir = sources_dir.absolute()
-    source = source.absolute()
+    resolver = tdd.Resolver(
+        [p.absolute() for p in sources_dirs], [p.absolute() for p in tests_dirs]
+    )
+    log.debug("sources from: %s", ", ".join(str(p) for p in resolver.sources_dirs))
+    log.debug("tests from: %s", ", ".join(str(p) for p in resolver.all_tests_dirs))
+
+    for source in sources:
+        if not runner.is_test(source) and resolver.root(source.absolute()) is None:
+            ctx.fail(f"{source} is not under any of the sources dirs")
 
     @dc.dataclass
     class C:
@@ -153,46 +191,90 @@ def main(ctx: Context, source: Path, sources_dir: Path, tests_dir: Path, verbose
     ctx.ensure_object(C)
     ctx.obj.tempdir = ctx.with_resource(misc.mkdir(keep=keep))
 
-    module = (
-        str(source.relative_to(sources_dir).with_suffix(""))
-        .replace("/", ".")
-        .replace("\\", ".")
+    store = cache.Cache("metadata", cache_dir)
+    idx = None
+    idxpath = cache.cachedir(cache_dir) / "index.json"
+    if use_index:
+        idx = index.open_index(
+            idxpath, Path.cwd(), resolver.sources_dirs, resolver.all_tests_dirs, store, rebuild_index
+        )
+
+    if mutate:
+        from pytest_tdd import mutate as mutation
+
+        if sys.version_info < (3, 9):
+            ctx.fail("--mutate needs python 3.9+")
+        for source in sources:
+            if runner.is_test(source):
+                ctx.fail(f"{source} is a test, --mutate takes sources only")
+        units = runner.Runner(resolver, idx=idx, store=store).plan(sources, ctx.obj.tempdir)
+        mutants = cache.Cache("mutants", cache_dir)
+        retcode = mutation.run(units, mutants, jobs)
+        store.evict()
+        mutants.evict()
+        if keep:
+            log.warning("preserving dir %s", ctx.obj.tempdir)
+        # standalone click discards the return value: exit with the code
+        ctx.exit(retcode)
+
+    baselines = None
+    baselines_path = cache.cachedir(cache_dir) / "baselines.sqlite"
+    if no_regression:
+        baselines = ctx.with_resource(baseline.Baselines(baselines_path))
+    gates = [baseline.Gate(threshold, baselines, no_regression)]
+    if memory:
+        # the memory baselines are always kept, to report the regressions
+        memory_baselines = ctx.with_resource(baseline.Baselines(baselines_path, "memory"))
+        gates.append(baseline.MemoryGate(None, memory_baselines, no_regression))
+
+    tracked = None
+    if use_history:
+        tracked = ctx.with_resource(history.History(cache.cachedir(cache_dir) / "history.sqlite"))
+
+    pipeline = runner.Runner(
+        resolver,
+        runner.SubprocessEngine(
+            args=["-vvs"],
+            report=coverage_report,
+            track=use_history,
+            reruns=reruns,
+            memory=memory,
+            tracemalloc=tracemalloc if memory else 0,
+            limits=limits.Limits(
+                max_memory * 2**20 if max_memory else None, max_cpu, max_files, max_processes
+            ),
+            cgroup=cgroup,
+        ),
+        idx,
+        store,
+        sinks=[
+            runner.LogSink(),
+            runner.PrintSink(),
+            *([runner.JsonSink(json_path)] if json_path else []),
+            *gates,
+        ],
+        history=tracked,
+        quarantine=quarantine,
+        # the collected node ids are reported by the same child plugin as the history
+        collection=collection.Collection(cache.Cache("collection", cache_dir), Path.cwd()) if use_history else None,
+        markers=markers,
+        release=release,
     )
-    log.debug("module: %s", module)
-    log.debug("sources from: %s", sources_dir)
-    log.debug("tests from: %s", tests_dir)
-    log.debug("source file: %s (mod %s)", source, module)
-
-    candidates = tdd.lookup_candidates(source, sources_dir, tests_dir)
-
-    # filter out candidates
-    to_be_run = []
-    for candidate in candidates:
-        found = "found" if candidate.exists() else "not found"
-        if candidate.exists():
-            to_be_run.append(candidate)
-        log.debug("file %s %s", found, candidate)
-    candidates = to_be_run
-
-    # manages a failure
-    retcode, result = run(ctx.obj.tempdir, module, candidates, sources_dir)
-    if retcode:
-        msgs = []
-        msgs.append("cmd:")
-        msgs.append(f"|  {' '.join(result['cmd'])}")  # type: ignore
-        log.warning("failed to run tests")
-        log.warning("\n".join(msgs))
-        if result["stderr"].strip():  # type: ignore
-            log.warning("stderr:\n%s", misc.indent(result["stderr"], "|  "))  # type: ignore
-        if result["stdout"].strip():  # type: ignore
-            log.warning("stdout:\n%s", misc.indent(result["stdout"], "|  "))  # type: ignore
+    retcode = pipeline.run(sources, ctx.obj.tempdir, jobs)
+    if [failure for gate in gates for failure in gate.check()]:
+        retcode = retcode or 1
+
+    if idx is not None and pipeline.recorded:
+        idx.save(idxpath)
+    store.evict()
+    if pipeline.collection:
+        pipeline.collection.store.evict()
 
     if keep:
         log.warning("preserving dir %s", ctx.obj.tempdir)
 
-    print(compute(source, result))
-    return retcode
+    ctx.exit(retcode)
 
 
 if __name__ == "__main__":
-    sys.exit(main() or 0)
+    main()
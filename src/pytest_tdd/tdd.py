@@ -1,34 +1,227 @@
-# TODO:
-#   def get_tests_from_doc():
-#   def test_from_comments():
-
 from __future__ import annotations
 
-import json
 import os
-import subprocess
-import xml.etree.ElementTree as ET
 from pathlib import Path
+from typing import TYPE_CHECKING, Iterable
+
+from pytest_tdd import misc, tree
+
+if TYPE_CHECKING:
+    from pytest_tdd.index import Index
+
+
+class Resolver:
+    """
+    Maps sources to their root, module name and tests directories.
+
+    The sources roots are indexed by their path components, so a source
+    root lookup is a longest prefix match costing one dictionary access
+    per path component (no matter how many roots are there).
+
+    Each sources root is paired with the tests directories sharing its
+    parent (eg. `pkg/src` with `pkg/tests`) or, if there are none, with all
+    the tests directories.
+
+    Example:
+        >>> resolver = Resolver([Path("a/src"), Path("b/src")], [Path("a/tests"), Path("b/tests")])
+        >>> resolver.module(Path("b/src/package/__init__.py"))
+        'package'
+        >>> resolver.tests_dirs(Path("b/src/package/__init__.py"))
+        [Path('b/tests')]
+    """
+
+    def __init__(self, sources_dirs: list[Path], tests_dirs: list[Path]) -> None:
+        self.sources_dirs = list(sources_dirs)
+        self.all_tests_dirs = list(tests_dirs)
+        self.prefixes = {path.parts: path for path in self.sources_dirs}
+        self.pairs = {
+            path: [t for t in tests_dirs if t.parent == path.parent] or self.all_tests_dirs
+            for path in self.sources_dirs
+        }
+
+    def root(self, source: Path) -> Path | None:
+        """returns the (longest) sources root containing source"""
+        parts = source.parts
+        for n in range(len(parts) - 1, 0, -1):
+            if (found := self.prefixes.get(parts[:n])) is not None:
+                return found
+        return None
+
+    def _root(self, source: Path) -> Path:
+        if (root := self.root(source)) is None:
+            raise ValueError(f"{source} is not under any of the sources dirs", source, self.sources_dirs)
+        return root
+
+    def module(self, source: Path) -> str:
+        """
+        Returns the module name for source (an __init__.py maps to its package).
+
+        :param source: the module path
+        """
+        parts = list(source.relative_to(self._root(source)).with_suffix("").parts)
+        if parts[-1] == "__init__" and len(parts) > 1:
+            parts.pop()
+        return ".".join(parts)
+
+    def tests_dirs(self, source: Path) -> list[Path]:
+        """returns the tests dirs paired with the source root"""
+        return self.pairs[self._root(source)]
+
+    def candidates(
+        self, source: Path, sibling_testdir: bool = True, index: Index | None = None
+    ) -> list[Path]:
+        """
+        Returna  list of test candidates for source
+
+        :param source: the module to look tests for
+        :param sibling_testdir: look up in the sibling tests directory too
+        :param index: the declared tests (see pytest_tdd.index), they come first
+        """
+        candidates = index.lookup(source) if index else []
+        root = self._root(source)
+        relpath = source.relative_to(root)
+        name = f"test_{source.name}"
+        if sibling_testdir:
+            candidates.append(source.parent / "tests" / name)
+        for tests_dir in self.pairs[root]:
+            candidates.append(tests_dir / relpath.parent / name)
+            candidates.append(tests_dir / name)
+        return candidates
+
+
+class Listing:
+    """
+    Answers file existence checks from cached directory listings.
+
+    Each directory is listed (and stat-ed) once: checking many candidates
+    living in the same few tests directories doesn't hit the filesystem
+    again. Call `refresh` at the beginning of a new run/watch cycle to drop
+    the directories modified since (by mtime), or `invalidate` from a file
+    system watcher (eg. inotify) events.
+
+    Example:
+        >>> listing = Listing()
+        >>> listing.exists(Path("tests/test_hello.py"))
+        True
+    """
+
+    def __init__(self) -> None:
+        self.dirs: dict[Path, tuple[int, frozenset[str]]] = {}
+
+    @staticmethod
+    def _mtime(path: Path) -> int:
+        try:
+            return path.stat().st_mtime_ns
+        except OSError:
+            return -1
+
+    def names(self, path: Path) -> frozenset[str]:
+        """returns the entries in the directory path (empty if missing)"""
+        if path not in self.dirs:
+            mtime = self._mtime(path)
+            try:
+                names = frozenset(entry.name for entry in os.scandir(path))
+            except OSError:
+                names = frozenset()
+            self.dirs[path] = (mtime, names)
+        return self.dirs[path][1]
+
+    def exists(self, path: Path) -> bool:
+        return path.name in self.names(path.parent)
+
+    def invalidate(self, path: Path | None = None) -> None:
+        """drops the directory path (or all of them) from the cache"""
+        if path is None:
+            self.dirs.clear()
+        else:
+            self.dirs.pop(path, None)
+
+    def refresh(self) -> int:
+        """drops the modified directories, returns how many"""
+        changed = [path for path, (mtime, _) in self.dirs.items() if self._mtime(path) != mtime]
+        for path in changed:
+            del self.dirs[path]
+        return len(changed)
 
 
 def lookup_candidates(
-    source: Path, sources_dir: Path, tests_dir: Path, sibling_testdir: bool = True
+    source: Path,
+    sources_dir: Path | list[Path],
+    tests_dir: Path | list[Path],
+    sibling_testdir: bool = True,
+    index: Index | None = None,
 ) -> list[Path]:
     """
     Returna  list of test candidates for source
 
     :param source: the module to look tests for
+    :param sources_dir: where the sources are rooted (one or more)
+    :param tests_dir: where the tests are rooted (one or more)
+    :param index: the declared tests (see pytest_tdd.index), they come first
+    """
+    resolver = Resolver(misc.list_of_paths(sources_dir), misc.list_of_paths(tests_dir))
+    return resolver.candidates(source, sibling_testdir, index)
+
+
+def lookup_sources(
+    test: Path,
+    resolver: Resolver,
+    index: Index | None = None,
+    listing: Listing | None = None,
+) -> list[Path]:
+    """
+    Return a list of (existing) sources exercised by a test (the reverse
+    of Resolver.candidates)
+
+    :param test: the test module
+    :param resolver: the sources/tests roots resolver
+    :param index: the declared tests and the recorded coverage (see pytest_tdd.index),
+                  it is used also to find the sources with a given name
+    :param listing: to check the sources existence
+    """
+    listing = listing or Listing()
+    sources = index.sources(test) if index else []
+
+    if test.name.startswith("test_"):
+        name = test.name[len("test_") :]
+        # sibling tests dir
+        if test.parent.name == "tests" and resolver.root(test.parent) is not None:
+            sources.append(test.parent.parent / name)
+        for root, tests_dirs in resolver.pairs.items():
+            for tests_dir in tests_dirs:
+                if tests_dir != test.parent and tests_dir not in test.parents:
+                    continue
+                # tests_dir/relpath/test_name -> root/relpath/name
+                sources.append(root / test.parent.relative_to(tests_dir) / name)
+                # tests_dir/test_name -> root/**/name
+                if index and tests_dir == test.parent:
+                    sources.extend(p for p in index.named(name) if root in p.parents)
+
+    result = []
+    for source in sources:
+        if source not in result and listing.exists(source):
+            result.append(source)
+    return result
+
+
+def changed_sources(
+    changes: Iterable[tree.Change], rootdir: Path, sources_dir: Path
+) -> list[Path]:
+    """
+    Return the python sources (added or changed) from a tree.diff output
+
+    :param changes: the tree.diff result between two snapshots of rootdir
+    :param rootdir: the directory the snapshots are taken from
     :param sources_dir: where the sources are rooted
-    :param tests_dir:
     """
-    candidates = []
-    relpath = source.relative_to(sources_dir)
-    name = f"test_{source.name}"
-    if sibling_testdir:
-        candidates.append(source.parent / "tests" / name)
-    candidates.append(tests_dir / relpath.parent / name)
-    candidates.append(tests_dir / name)
-    return candidates
+    result = []
+    for change in changes:
+        if change.status == tree.Status.REMOVED or change.kind != tree.Kind.FILE:
+            continue
+        path = rootdir / change.path
+        if path.suffix == ".py" and sources_dir in path.parents:
+            result.append(path)
+    return result
 
 
 def run(
@@ -37,77 +230,25 @@ def run(
     candidates: list[Path],
     sources_dir: Path,
 ) -> tuple[int, dict[str, str | list[str] | None]]:
-    env = os.environ.copy()
-
-    env["PYTHONPATH"] = os.pathsep.join(
-        [str(sources_dir), *env.get("PYTHONPATH", "").split(os.pathsep)]
-    )
-    stdout = workdir / "stdout.txt"
-    stderr = workdir / "stderr.txt"
-    xmlout = workdir / "xmlout.xml"
-
-    cmdline = [
-        "pytest",
-        "-vv",
-        "--junit-xml",
-        xmlout,
-    ]
-
-    coverage = workdir / "coverage.json"
-    cmdline.extend(
-        [
-            "--cov-reset",
-            "--cov",
-            module,
-            "--cov-report",
-            f"json:{coverage}",
-        ]
-    )
-
-    cmd = [str(c) for c in [*cmdline, *candidates]]
-
-    p = subprocess.Popen(
-        cmd,
-        cwd=str(workdir),
-        stdout=stdout.open("w"),
-        stderr=stderr.open("w"),
-        env=env,
-    )
-    p.communicate()
-
-    return p.returncode, {
-        "cmd": cmd,
-        "stdout": stdout.read_text(),
-        "stderr": stderr.read_text(),
-        "tests": xmlout.read_text() if xmlout.exists() else None,
-        "coverage": coverage.read_text() if coverage.exists() else None,
-    }
+    """
+    Run the candidates (from workdir) measuring module coverage
+
+    This is a shortcut for pytest_tdd.runner.SubprocessEngine.
+    """
+    from pytest_tdd import runner
+
+    source = runner.modules_source([module], [sources_dir], workdir)
+    unit = runner.Unit(source, [module], candidates, [sources_dir], workdir, cwd=workdir)
+    result = runner.SubprocessEngine().execute(unit)
+    return result.returncode, result.asdict()
 
 
 def process(source: Path, result: dict[str, str | None]) -> str:
-    coverage = "coverage n/a"
-    if result["coverage"]:
-        cov = json.loads(result["coverage"])
-        lines, total = cov["totals"]["covered_lines"], cov["totals"]["num_statements"]
-        missing = cov["totals"]["missing_lines"]
-        percent = round(
-            100.0 * cov["totals"]["covered_lines"] / cov["totals"]["num_statements"], 2
-        )
-        coverage = (
-            f"covered {lines} lines out of {total} ({percent}%, {missing=} lines)"
-        )
-
-    tests = "tests n/a"
-    if result["tests"]:
-        totals = {"errors": 0, "failures": 0, "skipped": 0, "tests": 0}
-        testsuites = ET.fromstring(result["tests"])
-        for testsuite in testsuites:
-            totals["errors"] += int(testsuite.attrib.get("errors", 0))
-            totals["failures"] += int(testsuite.attrib.get("failures", 0))
-            totals["skipped"] += int(testsuite.attrib.get("skipped", 0))
-            totals["tests"] += int(testsuite.attrib.get("tests", 0))
-        tests = (
-            f"run {totals['tests']} tests with {totals['failures']} "
-            f"failures and {totals['errors']} errors"
-        )
-    return f"{source.name} {tests}, {coverage}"
+    """
+    Return the summary line for a run result (see run)
+
+    This is a shortcut for pytest_tdd.runner.collect.
+    """
+    from pytest_tdd import runner
+
+    return runner.Summary.parse(result["tests"], result["coverage"]).line(source.name)
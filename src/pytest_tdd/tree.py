@@ -7,10 +7,15 @@ It allows you to:
 
     - create a tree instance out of a directory (`create`)
     - to find a node in the tree structure (`find`)
+    - to find the nodes matching a glob pattern (`select`)
     - to dump the tree structure to a string (`dumps`, similar ro the
       `tree -aF` command in Linux)
-    - to write the tree structure to a directory (`write`)
+    - to write the tree structure to a directory (`write`), or clone it
+      from a cached copy (`Templates`)
     - to plot the tree structure using graphviz
+    - to save/load the tree structure to/from a binary snapshot (`save`, `load`)
+    - to compare two tree structures (`diff`), skipping the unchanged
+      subtrees in O(1) using the directories Merkle digests (`merkle`)
 
 The TL;DR is::
 
@@ -56,11 +61,16 @@ import argparse
 import collections
 import dataclasses as dc
 import enum
+import hashlib
 import io
+import mmap
+import os
+import re
 import shutil
+import struct
 import sys
 from pathlib import Path
-from typing import TextIO
+from typing import Any, Callable, Iterable, TextIO
 
 
 class NodeError(Exception):
@@ -79,6 +89,10 @@ class LocationError(NodeError):
     pass
 
 
+class SnapshotError(NodeError):
+    pass
+
+
 class Kind(enum.IntEnum):
     DIR = 1
     FILE = 2
@@ -90,6 +104,12 @@ class Node:
     kind: Kind | None = None
     children: list[Node] = dc.field(default_factory=list)
     parent: Node | None = None
+    size: int | None = None
+    mtime: float | None = None
+    digest: str | None = None
+    data: str | bytes | None = dc.field(default=None, repr=False)
+    # the select indexes of the subtree (see `select`)
+    index: TreeIndex | None = dc.field(default=None, init=False, repr=False, compare=False)
 
     def __post_init__(self) -> None:
         if self.name.endswith("/"):
@@ -103,6 +123,14 @@ class Node:
     def append(self, node: Node) -> None:
         node.parent = self
         self.children.append(node)
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """drops the select indexes of node and its ancestors (call it after changing the tree by hand)"""
+        cur: Node | None = self
+        while cur is not None:
+            cur.index = None
+            cur = cur.parent
 
     def __repr__(self) -> str:
         return (
@@ -128,12 +156,97 @@ class Node:
         return Path(*self.xpath)
 
 
-def create(path: Path | str) -> Node:
+def file_digest(path: Path | str, algorithm: str = "sha256") -> str:
+    """
+    Returns the hex digest of a file content.
+
+    Args:
+        path: the file to hash.
+        algorithm: any hashlib supported algorithm.
+
+    Returns:
+        The hex digest as string.
+
+    """
+    hasher = hashlib.new(algorithm)
+    with Path(path).open("rb") as fp:
+        while chunk := fp.read(1 << 16):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def dir_digest(node: Node, algorithm: str = "sha256") -> str | None:
+    """
+    Returns the digest of a directory out of its children (a Merkle tree).
+
+    The digest covers the kind, name and digest of each child (in name
+    order), so two directories have the same digest only if their whole
+    subtrees are equal.
+
+    Args:
+        node: the directory node.
+        algorithm: any hashlib supported algorithm.
+
+    Returns:
+        The hex digest as string, None if any child has no digest.
+
+    """
+    hasher = hashlib.new(algorithm)
+    for child in sorted(node.children, key=lambda n: n.name):
+        if child.digest is None:
+            return None
+        hasher.update(f"{int(child.kind or 0)} {child.name}\0{child.digest}\n".encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def merkle(root: Node) -> str | None:
+    """
+    Sets the digest of the directories under root (root included) out of their children.
+
+    The file nodes must have their digest already (eg. from a snapshot or `create`).
+
+    Args:
+        root: the root node of the tree structure.
+
+    Returns:
+        The root digest (None if any file has no digest).
+
+    """
+    order = [root]
+    for node in order:
+        order.extend(child for child in node.children if child.kind == Kind.DIR)
+    # children before their parents
+    for node in reversed(order):
+        if node.kind == Kind.DIR:
+            node.digest = dir_digest(node)
+    return root.digest
+
+
+def create(
+    path: Path | str,
+    stat: bool = False,
+    digest: bool = False,
+    workers: int | None = None,
+    previous: Node | None = None,
+) -> Node:
     """
     Generates a tree out of path directory.
 
+    With digest=True the files are hashed using a thread pool (hashlib
+    releases the GIL on large buffers) and each directory gets the digest of
+    its children (see `merkle`), so `diff` can skip whole unchanged subtrees.
+
+    Passing the previous tree of the same directory (eg. from a snapshot)
+    makes the hashing incremental: a file with the same size and mtime as in
+    previous keeps its previous digest, without being read.
+
     Args:
         path: A Path object representing the directory to start the walk from.
+        stat: if True store size and mtime in the file nodes.
+        digest: if True store the content digest in the nodes (see `file_digest` and `dir_digest`).
+        workers: the number of threads hashing files (0 hashes them in the
+            calling thread, None uses the ThreadPoolExecutor default).
+        previous: a previous tree of path, with size, mtime and digest (implies stat).
 
     Returns:
         A Node object representing the root of the directory tree.
@@ -147,26 +260,63 @@ def create(path: Path | str) -> Node:
             >>> tree.create(Path("somedir"))
             Node(name='somedir', ...)
 
+        To rehash only the files changed since the last snapshot::
+
+            >>> with tree.load("layout.bin") as snap:
+            ...     root = tree.create(Path("somedir"), digest=True, previous=snap.node())
+            >>> tree.save("layout.bin", root)
+
     """
     src = Path(path)
     if not src.is_dir():
         raise InvalidNodeType("path is not a directory", src)
+    stat = stat or previous is not None
 
     root = Node("", Kind.DIR)
-    queue = collections.deque([root])
+    hashing: list[tuple[Node, Path]] = []
+    queue = collections.deque([(root, previous)])
     while queue:
         n = len(queue)
         for i in range(n):
-            cur = queue.popleft()
+            cur, old = queue.popleft()
             if not (sub := (src / cur.path)).is_dir():
                 continue
+            olds = {child.name: child for child in old.children} if old and old.kind == Kind.DIR else {}
             for child in sorted(sub.glob("*")):
+                is_dir = child.is_dir()
                 node = Node(
-                    child.name, Kind.DIR if child.is_dir() else Kind.FILE, parent=cur
+                    child.name, Kind.DIR if is_dir else Kind.FILE, parent=cur
                 )
                 cur.children.append(node)
-                if child.is_dir():
-                    queue.appendleft(node)
+                if is_dir:
+                    queue.appendleft((node, olds.get(child.name)))
+                    continue
+                if stat:
+                    info = child.stat()
+                    node.size, node.mtime = info.st_size, info.st_mtime
+                if digest:
+                    prev = olds.get(child.name)
+                    if (
+                        prev is not None
+                        and prev.kind == Kind.FILE
+                        and prev.digest is not None
+                        and (prev.size, prev.mtime) == (node.size, node.mtime)
+                    ):
+                        node.digest = prev.digest
+                    else:
+                        hashing.append((node, child))
+
+    if digest:
+        if workers == 0 or len(hashing) < 2:
+            for node, child in hashing:
+                node.digest = file_digest(child)
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for (node, _), value in zip(hashing, pool.map(file_digest, [child for _, child in hashing])):
+                    node.digest = value
+        merkle(root)
     return root
 
 
@@ -226,36 +376,344 @@ def find(root: Node, loc: str | list[str], create: bool = False) -> Node | None:
     return cur
 
 
-def write(path: Path | str, root: Node) -> None:
+def _translate(pattern: str) -> str:
+    """translates a glob pattern (relative to a root, using / as separator) into a regex"""
+
+    def segment(part: str) -> str:
+        out = []
+        i = 0
+        while i < len(part):
+            char = part[i]
+            i += 1
+            if char == "*":
+                out.append("[^/]*")
+            elif char == "?":
+                out.append("[^/]")
+            elif char == "[" and (end := part.find("]", i + 1 if part[i : i + 1] in {"!", "]"} else i)) >= 0:
+                body = part[i:end].replace("\\", "\\\\")
+                out.append(f"[^/{body[1:]}]" if body.startswith("!") else f"[{body}]")
+                i = end + 1
+            else:
+                out.append(re.escape(char))
+        return "".join(out)
+
+    parts = pattern.strip("/").split("/")
+    out = []
+    for number, part in enumerate(parts):
+        last = number == len(parts) - 1
+        if part == "**":
+            out.append("[^/]+(?:/[^/]+)*" if last else "(?:[^/]+/)*")
+        else:
+            out.append(segment(part) + ("" if last else "/"))
+    return "".join(out)
+
+
+class TreeIndex:
+    """
+    The (lazily built) lookup tables of a subtree, used by `select`.
+
+    All the nodes under the top node are listed once (in depth first order,
+    along with their path relative to top), the tables by name, by extension
+    and by depth are built on their first use.
+    """
+
+    def __init__(self, top: Node) -> None:
+        self.nodes: list[Node] = []
+        self.paths: list[str] = []
+        self.depths: list[int] = []
+        stack = [(child, child.name, 1) for child in reversed(top.children)]
+        while stack:
+            node, path, depth = stack.pop()
+            self.nodes.append(node)
+            self.paths.append(path)
+            self.depths.append(depth)
+            stack.extend((child, f"{path}/{child.name}", depth + 1) for child in reversed(node.children))
+        self._tables: dict[str, dict[Any, list[int]]] = {}
+        self._patterns: dict[str, re.Pattern[str]] = {}
+
+    def table(self, name: str) -> dict[Any, list[int]]:
+        """returns the "name", "suffix" or "depth" table (the node indexes by key)"""
+        if name not in self._tables:
+            keys: Iterable[Any]
+            if name == "name":
+                keys = (node.name for node in self.nodes)
+            elif name == "suffix":
+                keys = (node.name[node.name.rfind(".") :] if "." in node.name else "" for node in self.nodes)
+            else:
+                keys = self.depths
+            table: dict[Any, list[int]] = {}
+            for number, key in enumerate(keys):
+                table.setdefault(key, []).append(number)
+            self._tables[name] = table
+        return self._tables[name]
+
+    def pattern(self, pattern: str) -> re.Pattern[str]:
+        if pattern not in self._patterns:
+            self._patterns[pattern] = re.compile(_translate(pattern))
+        return self._patterns[pattern]
+
+    def candidates(self, pattern: str) -> Iterable[int]:
+        """the indexes of the nodes that might match pattern (a superset)"""
+        parts = pattern.strip("/").split("/")
+        last = parts[-1]
+        if not any(char in last for char in "*?["):
+            return self.table("name").get(last, [])
+        if last.startswith("*") and not any(char in last[1:] for char in "*?[") and "." in last:
+            return self.table("suffix").get(last[last.rfind(".") :], [])
+        if "**" not in parts:
+            return self.table("depth").get(len(parts), [])
+        return range(len(self.nodes))
+
+
+def select(root: Node, pattern: str, predicate: Callable[[Node], bool] | None = None) -> list[Node]:
+    """
+    Finds the nodes under root matching a glob pattern.
+
+    The pattern is relative to root and uses / as separator: `*`, `?` and
+    `[...]` match within a path segment, a `**` segment matches any number of
+    segments (at least one if it's the last one) and a trailing / matches the
+    directories only.
+
+    The lookups use indexes (by name, by extension and by depth) attached to
+    root: they are built on the first `select` and dropped when the tree
+    changes through `Node.append` (or `Node.invalidate`), so repeated
+    queries don't walk the tree.
+
+    Args:
+        root: the root node of the tree structure.
+        pattern: the glob pattern (eg. "**/tests/**/test_*.py").
+        predicate: an extra filter on the matching nodes.
+
+    Returns:
+        The matching nodes, in depth first order.
+
+    Examples:
+        To find the test files in any tests directory::
+
+            >>> [str(node.path) for node in tree.select(root, "**/tests/**/test_*.py")]
+            ['src/package1/subpackageB/tests/test_modD.py', 'tests/test_modG.py', ...]
+
+        To find the non empty directories::
+
+            >>> tree.select(root, "**/", lambda node: bool(node.children))
+
+    """
+    if root.index is None:
+        root.index = TreeIndex(root)
+    index = root.index
+    regex = index.pattern(pattern)
+    dirs = pattern.endswith("/")
+    result = []
+    for number in sorted(index.candidates(pattern)):
+        node = index.nodes[number]
+        if dirs and node.kind != Kind.DIR:
+            continue
+        if not regex.fullmatch(index.paths[number]):
+            continue
+        if predicate is None or predicate(node):
+            result.append(node)
+    return result
+
+
+def write(path: Path | str, root: Node, workers: int | None = None, batch: int = 256) -> None:
     """
     Writes a tree structure under path.
 
-    The function iteratively processes the given root node and its children
-    generating a filesystem dump of `root`.
+    The function processes the given root node and its children
+    generating a filesystem dump of `root`: the directories are created
+    first (once each, top down) and then the files are written in batches
+    using a thread pool. A file content is taken from the node `data`
+    (empty if not set).
 
     Args:
         path: The base directory where the tree structure will be created.
         root: The root node of the tree structure to be written, which determines the
             hierarchy of files and directories to be generated.
+        workers: the number of threads writing files (0 writes them in the
+            calling thread, None uses the ThreadPoolExecutor default).
+        batch: the number of files written by each thread task.
 
     """
-    dstdir = Path(path)
+    from concurrent.futures import ThreadPoolExecutor
 
-    if not dstdir.exists():
-        dstdir.mkdir(parents=True, exist_ok=True)
+    top = Path(path) / root.path
 
-    queue = collections.deque([root])
+    dirs = []
+    files = []
+    queue = collections.deque([(root, top)])
     while queue:
-        node = queue.popleft()
-        dst = dstdir / node.path
-        dst.relative_to(dst)
+        node, dst = queue.popleft()
         if node.kind == Kind.FILE:
-            dst.parent.mkdir(parents=True, exist_ok=True)
-            dst.write_text("")
-        else:
-            dst.mkdir(parents=True, exist_ok=True)
-            for child in node.children:
-                queue.appendleft(child)
+            files.append((dst, node.data))
+            continue
+        dirs.append(dst)
+        queue.extend((child, dst / child.name) for child in node.children)
+
+    # breadth first, so parents are always created before their children
+    (top if root.kind == Kind.DIR else top.parent).mkdir(parents=True, exist_ok=True)
+    for dst in dirs[1:]:
+        dst.mkdir(exist_ok=True)
+
+    def dump(group: list[tuple[Path, str | bytes | None]]) -> None:
+        for dst, data in group:
+            if isinstance(data, str):
+                dst.write_text(data, encoding="utf-8")
+            else:
+                dst.write_bytes(data or b"")
+
+    groups = [files[i : i + batch] for i in range(0, len(files), batch)]
+    if workers == 0 or len(groups) < 2:
+        for group in groups:
+            dump(group)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for _ in pool.map(dump, groups):
+            pass
+
+
+# the clone methods still worth trying (disabled on their first failure)
+_CLONE = {"reflink": sys.platform == "linux", "copy_file_range": hasattr(os, "copy_file_range")}
+_FICLONE = 0x40049409
+
+
+def _copyfile(src: Path, dst: Path, link: bool = False) -> None:
+    if link:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    with src.open("rb") as fsrc, dst.open("wb") as fdst:
+        if _CLONE["reflink"]:
+            import fcntl
+
+            try:
+                # a copy on write clone (btrfs, xfs ...)
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+                return
+            except OSError:
+                _CLONE["reflink"] = False
+        if _CLONE["copy_file_range"]:
+            try:
+                # an in kernel copy (possibly server side or reflinked)
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30):
+                    pass
+                return
+            except OSError:
+                _CLONE["copy_file_range"] = False
+                fdst.seek(0)
+                fdst.truncate()
+                fsrc.seek(0)
+        shutil.copyfileobj(fsrc, fdst)
+
+
+def clone(src: Path | str, dst: Path | str, link: bool = False) -> Path:
+    """
+    Copies the src directory under dst (merging with its content), the cheapest possible way.
+
+    Files are cloned with a reflink where supported (a copy on write clone
+    sharing the data blocks), or copied in kernel with copy_file_range,
+    falling back to a plain copy.
+
+    Args:
+        src: the directory to copy.
+        dst: the destination directory (created if missing).
+        link: hardlink the files instead: the fastest, but the copies share
+            the originals inodes, any change to a file shows up in both.
+
+    Returns:
+        The destination directory.
+
+    """
+    dst = Path(dst)
+    dst.mkdir(parents=True, exist_ok=True)
+    # plain strings and os calls: pathlib costs more than the copies here
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+    stack = [(str(src), str(dst))]
+    while stack:
+        cur, target = stack.pop()
+        with os.scandir(cur) as entries:
+            for entry in entries:
+                path = os.path.join(target, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    if not os.path.isdir(path):
+                        os.mkdir(path)
+                    stack.append((entry.path, path))
+                elif link:
+                    if os.path.lexists(path):
+                        os.unlink(path)
+                    _copyfile(Path(entry.path), Path(path), link)
+                elif not entry.stat().st_size:
+                    # nothing to clone
+                    os.close(os.open(path, flags, 0o666))
+                else:
+                    _copyfile(Path(entry.path), Path(path))
+    return dst
+
+
+def layout_digest(root: Node) -> str:
+    """returns the digest of a tree structure (the layout and the files data)"""
+    hasher = hashlib.sha256(dumps(root).encode("utf-8"))
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node.kind == Kind.FILE and node.data:
+            data = node.data.encode("utf-8") if isinstance(node.data, str) else node.data
+            hasher.update(f"{'/'.join(node.xpath)}\0{len(data)}\0".encode("utf-8"))
+            hasher.update(data)
+        stack.extend(reversed(node.children))
+    return hasher.hexdigest()
+
+
+class Templates:
+    """
+    A cache of written tree structures, cloned on demand.
+
+    Each distinct tree structure (see `layout_digest`) is written once
+    under path, every later `create` clones it (see `clone`): setting up
+    the same layout over and over (eg. in test fixtures) costs a clone, not
+    a full `write`. A template can be stored under an explicit key (eg. the
+    digest of the text it's parsed from) to skip building the tree too.
+
+    Args:
+        path: where the templates are written.
+        link: clone the files as hardlinks (see `clone`).
+
+    Examples:
+        To set up the same layout in many directories::
+
+            >>> templates = tree.Templates(Path("/tmp/templates"))
+            >>> for dst in dirs:
+            ...     templates.create(dst, tree.parse(layout))
+
+    """
+
+    def __init__(self, path: Path | str, link: bool = False) -> None:
+        self.path = Path(path)
+        self.link = link
+
+    def lookup(self, key: str) -> Path | None:
+        """returns the template directory stored under key (if any)"""
+        dst = self.path / key
+        return dst if dst.is_dir() else None
+
+    def template(self, root: Node, key: str | None = None) -> Path:
+        """returns the template directory of root, stored under key (default the `layout_digest`)"""
+        dst = self.path / (key or layout_digest(root))
+        if not dst.exists():
+            # written aside and renamed, as the templates might be shared
+            tmp = self.path / f"{dst.name}.{os.getpid()}.{id(root):x}.tmp"
+            tmp.mkdir(parents=True)
+            write(tmp, root)
+            try:
+                tmp.rename(dst)
+            except OSError:
+                shutil.rmtree(tmp, ignore_errors=True)
+        return dst
+
+    def create(self, path: Path | str, root: Node) -> Path:
+        """writes root under path (as `write` does)"""
+        return clone(self.template(root), path, self.link)
 
 
 def dumps(root: Node, nbs: str = " ") -> str:
@@ -306,69 +764,539 @@ def dumps(root: Node, nbs: str = " ") -> str:
     return buffer.getvalue()
 
 
-def parse(txt: str) -> Node | None:
-    plevel = 0
+def parse(src: str | Iterable[str]) -> Node | None:
+    """
+    Parse a `tree -aF` like text into a tree structure.
+
+    The lines are consumed one at a time (`src` can be a string, an open
+    file or any iterable of lines) and the nodes are attached directly
+    using a stack of the current ancestors, so the working memory is
+    bound by the tree depth and not by the number of lines.
+
+    Args:
+        src: the text to parse, either as a string or an iterable of lines.
+
+    Returns:
+        The root node of the parsed tree structure.
+
+    Raises:
+        LocationError: if a line is indented deeper than its parent.
+        InvalidNodeType: if a node is nested under a file.
+
+    Examples:
+        To load a (potentially huge) dump from disk::
+
+            >>> with open("layout.txt") as fp:
+            ...     root = tree.parse(fp)
+
+    """
     sep = "─ "
-    result = []
-    context: collections.deque[str] = collections.deque()
-    for line in txt.split("\n"):
-        if sep not in line:
+    lines = io.StringIO(src) if isinstance(src, str) else src
+
+    root = Node("/")
+    stack = [root]
+    offset: int | None = None
+    for line in lines:
+        if (index := line.find(sep)) < 0:
             continue
-        index = line.find(sep) + len(sep)
-        level = index // 4
+        index += len(sep)
         key = line[index:].rstrip()
-        if level > plevel:
-            context.append(key)
-            plevel = level
-        elif level == plevel:
-            result.append(list(context))
-            context[-1] = key
-        else:
-            result.append(list(context))
-            for _ in range(plevel - level + 1):
-                context.pop()
-            context.append(key)
-            plevel = level
-    if context:
-        result.append(list(context))
 
-    root = Node("/")
-    for path in result:
-        find(root, path, create=True)
+        # the first entry sets the base indentation level
+        if offset is None:
+            offset = index // 4 - 1
+        level = index // 4 - offset
+        if not (0 < level <= len(stack)):
+            raise LocationError(f"invalid indentation for {key=}", line)
+
+        del stack[level:]
+        parent = stack[-1]
+        if parent.kind == Kind.FILE:
+            raise InvalidNodeType(f"cannot insert {key=} under {parent=}", parent, key)
+        node = Node(key, Kind.DIR if key.endswith("/") else Kind.FILE, parent=parent)
+        parent.children.append(node)
+        stack.append(node)
     return root
 
 
-def plot(root: Node, buffer: TextIO = sys.stdout) -> TextIO:
-    print("digraph {", file=buffer)
+# binary snapshot layout (all little endian):
+#   header   magic, version, nr. of sections, nr. of nodes, nr. of strings
+#   sections table of (tag, offset, size) entries
+#   STRO     nr. of strings + 1 offsets into STRS
+#   STRS     the interned node names (utf-8)
+#   NODE     one record per node in breadth first order, so the children
+#            of a node are contiguous: name index, parent index,
+#            first child index, nr. of children, kind, flags
+# and the optional (per node) sections, written only if any node has them:
+#   SIZE     file sizes
+#   MTIM     file modification times
+#   HASH     string index (into STRS) of the content digests
+SNAPSHOT_MAGIC = b"PTDTREE\x00"
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct("<8sHHII")
+_SECTION = struct.Struct("<4sQQ")
+_OFFSET = struct.Struct("<Q")
+_RECORD = struct.Struct("<IIIIBB2x")
+_SIZE = struct.Struct("<Q")
+_MTIME = struct.Struct("<d")
+_INDEX = struct.Struct("<I")
+_NULL = 0xFFFFFFFF
+_NULL_SIZE = 0xFFFFFFFFFFFFFFFF
+_SORTED = 0x01
+
+
+def save(path: Path | str, root: Node) -> Path:
+    """
+    Saves the tree structure into a binary snapshot file.
+
+    The snapshot stores the node names once (interned) and a fixed size
+    record per node, so it can be reopened with `load` without parsing.
+
+    Args:
+        path: the destination file.
+        root: the root node of the tree structure to save.
+
+    Returns:
+        The path to the snapshot file.
+
+    """
+    dst = Path(path)
+
+    strings: dict[str, int] = {}
+    order = [root]
+    parents = [_NULL]
+    records = bytearray()
+    sizes, mtimes, digests = bytearray(), bytearray(), bytearray()
+    has_size = has_mtime = has_digest = False
+    index = 0
+    while index < len(order):
+        node = order[index]
+        names = [child.name for child in node.children]
+        flags = _SORTED if names == sorted(names) else 0
+        records += _RECORD.pack(
+            strings.setdefault(node.name, len(strings)),
+            parents[index],
+            len(order),
+            len(node.children),
+            node.kind or 0,
+            flags,
+        )
+        has_size |= node.size is not None
+        has_mtime |= node.mtime is not None
+        has_digest |= node.digest is not None
+        sizes += _SIZE.pack(_NULL_SIZE if node.size is None else node.size)
+        mtimes += _MTIME.pack(float("nan") if node.mtime is None else node.mtime)
+        digests += _INDEX.pack(_NULL if node.digest is None else strings.setdefault(node.digest, len(strings)))
+        order.extend(node.children)
+        parents.extend([index] * len(node.children))
+        index += 1
+
+    offsets = bytearray()
+    blob = bytearray()
+    for name in strings:
+        offsets += _OFFSET.pack(len(blob))
+        blob += name.encode("utf-8")
+    offsets += _OFFSET.pack(len(blob))
+
+    sections = [(b"STRO", offsets), (b"STRS", blob), (b"NODE", records)]
+    if has_size:
+        sections.append((b"SIZE", sizes))
+    if has_mtime:
+        sections.append((b"MTIM", mtimes))
+    if has_digest:
+        sections.append((b"HASH", digests))
+    start = _HEADER.size + _SECTION.size * len(sections)
+    with dst.open("wb") as fp:
+        fp.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(sections), len(order), len(strings)))
+        for tag, data in sections:
+            fp.write(_SECTION.pack(tag, start, len(data)))
+            start += len(data)
+        for _, data in sections:
+            fp.write(data)
+    return dst
+
+
+class Snapshot:
+    """
+    A read only, memory mapped view over a binary snapshot file.
+
+    Nodes are referred by their index (the root is 0) and they are
+    decoded only when accessed, so a lookup doesn't need to load the
+    whole file.
+
+    Examples:
+        To lookup a node::
+
+            >>> with tree.load("layout.bin") as snap:
+            ...     index = snap.find("src/package/module.py")
+            ...     node = snap.node(index)
+
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        with self.path.open("rb") as fp:
+            try:
+                self._mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as exc:  # empty file
+                raise SnapshotError(f"invalid snapshot file {self.path}") from exc
+        try:
+            magic, version, nsections, nnodes, nstrings = _HEADER.unpack_from(self._mm)
+        except struct.error as exc:
+            self.close()
+            raise SnapshotError(f"invalid snapshot file {self.path}") from exc
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            self.close()
+            raise SnapshotError(f"invalid snapshot file {self.path}", magic, version)
+        self.nnodes: int = nnodes
+        self.nstrings: int = nstrings
+
+        self._sections: dict[bytes, tuple[int, int]] = {}
+        for i in range(nsections):
+            tag, offset, size = _SECTION.unpack_from(self._mm, _HEADER.size + i * _SECTION.size)
+            self._sections[tag] = (offset, size)
+        self._strings: dict[int, str] = {}
+
+    def __enter__(self) -> Snapshot:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.nnodes
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def _record(self, index: int) -> tuple[int, int, int, int, int, int]:
+        if not (0 <= index < self.nnodes):
+            raise IndexError(f"node index out of range, {index}")
+        offset = self._sections[b"NODE"][0] + index * _RECORD.size
+        return _RECORD.unpack_from(self._mm, offset)
+
+    def _string(self, index: int) -> str:
+        if index not in self._strings:
+            offsets = self._sections[b"STRO"][0] + index * _OFFSET.size
+            start, end = (
+                _OFFSET.unpack_from(self._mm, offsets)[0],
+                _OFFSET.unpack_from(self._mm, offsets + _OFFSET.size)[0],
+            )
+            blob = self._sections[b"STRS"][0]
+            self._strings[index] = self._mm[blob + start : blob + end].decode("utf-8")
+        return self._strings[index]
+
+    def name(self, index: int) -> str:
+        return self._string(self._record(index)[0])
+
+    def kind(self, index: int) -> Kind:
+        return Kind(self._record(index)[4])
+
+    def parent(self, index: int) -> int | None:
+        parent = self._record(index)[1]
+        return None if parent == _NULL else parent
+
+    def size(self, index: int) -> int | None:
+        if b"SIZE" not in self._sections:
+            return None
+        self._record(index)
+        size: int = _SIZE.unpack_from(self._mm, self._sections[b"SIZE"][0] + index * _SIZE.size)[0]
+        return None if size == _NULL_SIZE else size
+
+    def mtime(self, index: int) -> float | None:
+        if b"MTIM" not in self._sections:
+            return None
+        self._record(index)
+        mtime: float = _MTIME.unpack_from(self._mm, self._sections[b"MTIM"][0] + index * _MTIME.size)[0]
+        return None if mtime != mtime else mtime  # NaN
+
+    def digest(self, index: int) -> str | None:
+        if b"HASH" not in self._sections:
+            return None
+        self._record(index)
+        string: int = _INDEX.unpack_from(self._mm, self._sections[b"HASH"][0] + index * _INDEX.size)[0]
+        return None if string == _NULL else self._string(string)
+
+    def children(self, index: int) -> range:
+        _, _, first, count, _, _ = self._record(index)
+        return range(first, first + count)
+
+    def xpath(self, index: int) -> list[str]:
+        result = []
+        cur: int | None = index
+        while cur is not None:
+            result.append(self.name(cur))
+            cur = self.parent(cur)
+        return list(reversed(result))
+
+    def find(self, loc: str | list[str]) -> int | None:
+        """
+        Find the index of a node (see `tree.find`).
+
+        Args:
+            loc: the node location, a string or a list of strings.
+
+        Returns:
+            The node index if found, otherwise None.
+
+        """
+        parts = loc.strip("/").split("/") if isinstance(loc, str) else [p.rstrip("/") for p in loc]
+        cur = 0
+        for part in parts:
+            _, _, first, count, _, flags = self._record(cur)
+            found = None
+            if flags & _SORTED:
+                lo, hi = first, first + count
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if self.name(mid) < part:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                if lo < first + count and self.name(lo) == part:
+                    found = lo
+            else:
+                found = next((i for i in range(first, first + count) if self.name(i) == part), None)
+            if found is None:
+                return None
+            cur = found
+        return cur
+
+    def node(self, index: int = 0) -> Node:
+        """
+        Materialise the subtree starting at index into a Node tree.
+
+        Args:
+            index: the subtree root node index (defaults to the whole tree).
+
+        Returns:
+            The root node of the subtree.
+
+        """
+        def make(cur: int, parent: Node | None) -> Node:
+            return Node(
+                self.name(cur),
+                self.kind(cur),
+                parent=parent,
+                size=self.size(cur),
+                mtime=self.mtime(cur),
+                digest=self.digest(cur),
+            )
+
+        top = make(index, None)
+        queue = collections.deque([(index, top)])
+        while queue:
+            cur, node = queue.popleft()
+            for child in self.children(cur):
+                sub = make(child, node)
+                node.children.append(sub)
+                queue.append((child, sub))
+        return top
+
+
+def load(path: Path | str) -> Snapshot:
+    """
+    Opens a binary snapshot file written by `save`.
+
+    Args:
+        path: the snapshot file.
+
+    Returns:
+        A Snapshot instance (use `Snapshot.node` to get a full Node tree).
+
+    Raises:
+        SnapshotError: if path is not a valid snapshot.
+
+    """
+    return Snapshot(path)
 
-    mapper = {}
-    counter = 0
-    queue = collections.deque([root])
-    while queue:
-        node = queue.popleft()
-        key, val = f"n-{counter:05}", node.name
-        mapper[hex(id(node))] = (key, val)
-        print(f'  "{key}" [label="{val}"]', file=buffer)
 
-        for n in reversed(node.children or []):
-            queue.appendleft(n)
+class Status(enum.Enum):
+    ADDED = "added"
+    REMOVED = "removed"
+    CHANGED = "changed"
+
+
+@dc.dataclass
+class Change:
+    status: Status
+    xpath: list[str]
+    old: Node | None = None
+    new: Node | None = None
+
+    @property
+    def path(self) -> Path:
+        return Path(*self.xpath)
+
+    @property
+    def kind(self) -> Kind | None:
+        node = self.new or self.old
+        return node.kind if node else None
+
+
+def _changed(old: Node, new: Node) -> bool:
+    if old.digest is not None and new.digest is not None:
+        return old.digest != new.digest
+    if old.size is not None and new.size is not None and old.size != new.size:
+        return True
+    if old.mtime is not None and new.mtime is not None:
+        return old.mtime != new.mtime
+    return False
+
+
+def diff(old: Node, new: Node) -> list[Change]:
+    """
+    Compares two tree structures.
+
+    The children of both trees are merged in name order, so every node is
+    visited once. Files are reported as changed using (in order of
+    preference) the content digest or the size/mtime, when both nodes
+    carry them (see `create`): without them only the structure is compared.
+    Directories with the same digest (see `merkle`) are skipped as a whole.
+
+    Args:
+        old: the root node of the old tree structure.
+        new: the root node of the new tree structure.
+
+    Returns:
+        A list of Change, in depth first order: added and removed
+        directories are followed by all their added/removed descendants.
+
+    Examples:
+        To find the modules changed since the last snapshot::
+
+            >>> changes = tree.diff(tree.load("layout.bin").node(), tree.create(".", digest=True))
+            >>> [c.path for c in changes if c.status != tree.Status.REMOVED]
+            [PosixPath('src/package/module.py')]
+
+    """
+    result: list[Change] = []
+
+    # the (old, new) pairs with the same xpath: unmatched nodes
+    # (and their descendants) are either added or removed
+    stack: list[tuple[Node | None, Node | None, list[str]]] = [(old, new, [new.name])]
+    while stack:
+        left, right, xpath = stack.pop()
+        if left is None or right is None:
+            node = left or right
+            assert node
+            result.append(Change(Status.ADDED if left is None else Status.REMOVED, xpath, left, right))
+            for child in reversed(node.children):
+                pair = (None, child) if left is None else (child, None)
+                stack.append((*pair, [*xpath, child.name]))
+            continue
+
+        if left.kind != right.kind:
+            stack.append((None, right, xpath))
+            stack.append((left, None, xpath))
+            continue
+
+        if left.kind != Kind.DIR:
+            if _changed(left, right):
+                result.append(Change(Status.CHANGED, xpath, left, right))
+            continue
+
+        if left.digest is not None and left.digest == right.digest:
+            # the same Merkle digest: the whole subtree is unchanged
+            continue
+
+        lchildren = sorted(left.children, key=lambda n: n.name)
+        rchildren = sorted(right.children, key=lambda n: n.name)
+        pairs: list[tuple[Node | None, Node | None, list[str]]] = []
+        i = j = 0
+        while i < len(lchildren) or j < len(rchildren):
+            lnode = lchildren[i] if i < len(lchildren) else None
+            rnode = rchildren[j] if j < len(rchildren) else None
+            if rnode is None or (lnode is not None and lnode.name < rnode.name):
+                rnode = None
+                i += 1
+            elif lnode is None or rnode.name < lnode.name:
+                lnode = None
+                j += 1
+            else:
+                i += 1
+                j += 1
+            name = (lnode or rnode).name  # type: ignore[union-attr]
+            pairs.append((lnode, rnode, [*xpath, name]))
+        stack.extend(reversed(pairs))
+    return result
+
+
+def plot(
+    root: Node,
+    buffer: TextIO = sys.stdout,
+    depth: int | None = None,
+    max_children: int | None = None,
+    subpath: str | list[str] | None = None,
+) -> TextIO:
+    """
+    Writes the tree structure as graphviz dot.
+
+    Nodes and edges are streamed to buffer while walking the tree once.
+    To keep large trees readable, the content of directories deeper than
+    `depth` or with more than `max_children` entries is collapsed into a
+    single summary node (eg. "…1234 files").
+
+    Args:
+        root: the root node of the tree structure.
+        buffer: where to write the dot output.
+        depth: collapse directories at this depth (the plotted root is at 0).
+        max_children: collapse directories with more children than this.
+        subpath: plot only the subtree found by `find(root, subpath)`.
+
+    Returns:
+        The buffer.
+
+    Raises:
+        LocationError: if subpath is not in the tree structure.
+
+    """
+    if subpath is not None:
+        if (top := find(root, subpath)) is None:
+            raise LocationError(f"cannot find {subpath=}", subpath)
+        root = top
+
+    def label(txt: str) -> str:
+        return txt.replace("\\", "\\\\").replace('"', '\\"')
+
+    def nfiles(node: Node) -> int:
+        count = 0
+        stack = list(node.children)
+        while stack:
+            cur = stack.pop()
+            count += cur.kind == Kind.FILE
+            stack.extend(cur.children)
+        return count
+
+    print("digraph {", file=buffer)
+    counter = 0
+    stack: list[tuple[Node, str | None, int]] = [(root, None, 0)]
+    while stack:
+        node, parent, level = stack.pop()
+        key = f"n-{counter:05}"
         counter += 1
+        print(f'  "{key}" [label="{label(node.name)}"]', file=buffer)
+        if parent is not None:
+            print(f'  "{parent}" -> "{key}"', file=buffer)
+        if not node.children:
+            continue
 
-    queue = collections.deque([root])
-    while queue:
-        node = queue.popleft()
-        start = mapper[hex(id(node))]
+        if (depth is not None and level >= depth) or (
+            max_children is not None and len(node.children) > max_children
+        ):
+            summary = f"n-{counter:05}"
+            counter += 1
+            print(f'  "{summary}" [label="…{nfiles(node)} files", shape=box, style=dashed]', file=buffer)
+            print(f'  "{key}" -> "{summary}"', file=buffer)
+            continue
 
-        for n in reversed(node.children or []):
-            end = mapper[hex(id(n))]
-            print(f'  "{start[0]}" -> "{end[0]}"', file=buffer)
-            queue.appendleft(n)
+        stack.extend((child, key, level + 1) for child in reversed(node.children))
 
     print("}", file=buffer)
     return buffer
 
 
-def showtree(root: Node) -> None:  # pragma: no cover
+def showtree(root: Node, **kwargs: Any) -> None:  # pragma: no cover
     from contextlib import ExitStack
     from subprocess import call, check_call
     from tempfile import NamedTemporaryFile
@@ -377,7 +1305,7 @@ def showtree(root: Node) -> None:  # pragma: no cover
     if sys.platform not in {"linux", "darwin"}:
         raise NotImplementedError(f"cannot use this on {sys.platform}")
 
-    buffer = plot(root, io.StringIO())
+    buffer = plot(root, io.StringIO(), **kwargs)
     if not hasattr(buffer, "getvalue"):
         return
     txt = buffer.getvalue()
@@ -417,6 +1345,7 @@ walks the srcdir and creates a tree structure applying some operations:
   --into dumps the tree structure into a new directory
   --display dumps the tree structure into png file using graphviz
   --graphviz dumps the tree structure into a dot file
+  --snapshot saves the tree structure into a binary snapshot file
   
  """)
     parser.add_argument("srcdir", type=Path, help="source directory")
@@ -424,6 +1353,10 @@ walks the srcdir and creates a tree structure applying some operations:
     group.add_argument("-i", "--into", type=Path, help="destination directory")
     group.add_argument("--graphviz", action="store_true", help="write the structure to a png file")
     group.add_argument("--display", action="store_true", help="write the structure to a png file")
+    group.add_argument("--snapshot", type=Path, help="write the structure to a binary snapshot file")
+    parser.add_argument("--depth", type=int, help="(graphviz) collapse directories deeper than this")
+    parser.add_argument("--max-children", type=int, help="(graphviz) collapse directories with more entries")
+    parser.add_argument("--subpath", help="(graphviz) plot only this subpath")
     args = parser.parse_args()
 
     if not args.srcdir.exists():
@@ -436,9 +1369,11 @@ walks the srcdir and creates a tree structure applying some operations:
     if args.into:
         write(args.into, root)
     elif args.graphviz:
-        print(plot(root))
+        plot(root, depth=args.depth, max_children=args.max_children, subpath=args.subpath)
     elif args.display:
-        showtree(root)
+        showtree(root, depth=args.depth, max_children=args.max_children, subpath=args.subpath)
+    elif args.snapshot:
+        save(args.snapshot, root)
     else:
         root.name = args.srcdir
         print(dumps(root))
@@ -12,26 +12,21 @@ if TYPE_CHECKING:
 
     from pytest_print import PrettyPrinterFactory
 
+# the mktree fixture
+pytest_plugins = ["pytest_tdd.fixtures"]
+
 
 @pytest.fixture(scope="function")
-def mktree(tmp_path: Path) -> Callable[[str, str | None, str], Path]:
-    def create(txt: str, mode: str | None = None, subpath: str = "") -> Path:
-        mode = mode or ("tree" if "─ " in txt else "txt")
-        if mode == "tree":
-            from pytest_tdd import tree
-            if root := tree.parse(txt):
-                tree.write(tmp_path / subpath, root)
-        else:
-            for path in [f for f in txt.split("\n") if f.strip()]:
-                dst = Path(tmp_path) / subpath / path.strip()
-                if path.strip().startswith("#"):
-                    continue
-                if path.strip().endswith("/"):
-                    dst.mkdir(exist_ok=True, parents=True)
-                else:
-                    dst.parent.mkdir(exist_ok=True, parents=True)
-                    dst.write_text("")
-        return tmp_path / subpath
+def project(mktree: Callable[..., Path]) -> Callable[[dict[str, str]], Path]:
+    """makes a project with src/package/mod.py (f(x) = x + 1) and the tests (path -> text)"""
+
+    def create(tests: dict[str, str]) -> Path:
+        rootdir = mktree("\n".join(["src/package/__init__.py", "src/package/mod.py", *tests]))
+        (rootdir / "src/package/mod.py").write_text("def f(x):\n    return x + 1\n")
+        for path, text in tests.items():
+            (rootdir / path).write_text(text)
+        return rootdir
+
     return create
 
 
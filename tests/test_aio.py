@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import asyncio
+import tempfile
+import time
+
+import pytest
+
+import pytest_tdd
+from pytest_tdd import aio
+
+
+TESTS = {
+    "tests/package/test_mod.py": (
+        "from package import mod\n"
+        "def test_one():\n    assert mod.f(1) == 2\n"
+        "def test_two():\n    assert mod.f(1) == 3\n"
+    ),
+}
+
+
+def test_outcome_regex():
+    match = aio.OUTCOME.search("tests/test_mod.py::test_one[a b] PASSED      [ 50%]")
+    assert match and match.group("nodeid", "outcome") == ("tests/test_mod.py::test_one[a b]", "PASSED")
+    assert not aio.OUTCOME.search("collected 2 items")
+
+
+def test_run_module(project, monkeypatch):
+    rootdir = project(TESTS)
+    monkeypatch.chdir(rootdir)
+
+    result = asyncio.run(pytest_tdd.run_module(rootdir / "src/package/mod.py", workdir=rootdir / "work"))
+    assert result.returncode == 1
+    assert result.unit.modules == ["package.mod"]
+    assert result.tests and result.coverage
+    assert (result.unit.workdir / "stdout.txt").read_text() == result.stdout
+
+
+def test_iter_module(project, monkeypatch):
+    rootdir = project(TESTS)
+    monkeypatch.chdir(rootdir)
+
+    async def events():
+        return [event async for event in aio.iter_module(rootdir / "src/package/mod.py")]
+
+    found = asyncio.run(events())
+    assert [(e.kind, e.nodeid.rpartition("::")[2], e.outcome) for e in found[:-1]] == [
+        ("test", "test_one", "PASSED"),
+        ("test", "test_two", "FAILED"),
+    ]
+    assert found[-1].kind == "done"
+    assert found[-1].result and found[-1].result.returncode == 1
+
+
+def test_cancel(project, monkeypatch):
+    rootdir = project(TESTS)
+    (rootdir / "tests/package/test_mod.py").write_text("import time\ndef test_slow():\n    time.sleep(30)\n")
+    monkeypatch.chdir(rootdir)
+    (rootdir / "tmp").mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(rootdir / "tmp"))
+
+    async def cancel():
+        task = asyncio.ensure_future(aio.run_module(rootdir / "src/package/mod.py"))
+        await asyncio.sleep(1.0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    start = time.monotonic()
+    asyncio.run(cancel())
+    assert time.monotonic() - start < 10
+    # the temporary run directory is gone
+    assert list((rootdir / "tmp").iterdir()) == []
+
+
+def test_run_module_error(project, monkeypatch):
+    rootdir = project(TESTS)
+    monkeypatch.chdir(rootdir)
+    (rootdir / "tmp").mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(rootdir / "tmp"))
+
+    class Broken(aio.AsyncEngine):
+        async def aexecute(self, unit, on_event=None):
+            raise ValueError("broken")
+
+    # the error keeps its type, and the temporary directory is removed
+    with pytest.raises(ValueError, match="broken"):
+        asyncio.run(aio.run_module(rootdir / "src/package/mod.py", engine=Broken()))
+    assert list((rootdir / "tmp").iterdir()) == []
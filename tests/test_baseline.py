@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from pytest_tdd import baseline, runner
+
+
+def _report(gate, rootdir, values):
+    for name, percent in values.items():
+        result = runner.Result(runner.Unit(rootdir / name, [], []), 0)
+        gate(result, runner.Summary(coverage={"percent": percent}))
+
+
+def test_baselines(tmp_path):
+    with baseline.Baselines(tmp_path / "db" / "baselines.sqlite") as baselines:
+        assert baselines.get(["a"]) == {}
+        baselines.update({f"m{n}": float(n) for n in range(2500)})
+        baselines.update({"m1": 50.0})
+        found = baselines.get([f"m{n}" for n in range(0, 3000, 2)] + ["m1"])
+        assert len(found) == 1251
+        assert found["m1"] == 50.0
+        assert found["m2498"] == 2498.0
+
+    with baseline.Baselines(tmp_path / "db" / "baselines.sqlite") as baselines:
+        assert baselines.get(["m1"]) == {"m1": 50.0}
+
+
+def test_gate_threshold(tmp_path):
+    gate = baseline.Gate(threshold=60.0, rootdir=tmp_path)
+    _report(gate, tmp_path, {"src/a.py": 50.0, "src/b.py": 60.0})
+    assert gate.check() == [baseline.Failure("src/a.py", 50.0, 60.0, "threshold")]
+
+
+def test_gate_no_regression(tmp_path):
+    with pytest.raises(ValueError, match="needs the baselines"):
+        baseline.Gate(no_regression=True)
+
+    with baseline.Baselines(tmp_path / "baselines.sqlite") as baselines:
+        gate = baseline.Gate(baselines=baselines, no_regression=True, rootdir=tmp_path)
+        _report(gate, tmp_path, {"src/a.py": 50.0, "src/b.py": 60.0})
+        assert gate.check() == []  # first run, no baselines yet
+
+        gate = baseline.Gate(baselines=baselines, no_regression=True, rootdir=tmp_path)
+        _report(gate, tmp_path, {"src/a.py": 40.0, "src/b.py": 70.0})
+        assert gate.check() == [baseline.Failure("src/a.py", 40.0, 50.0, "regression")]
+        assert baselines.get(["src/a.py", "src/b.py"]) == {"src/a.py": 50.0, "src/b.py": 70.0}
+
+
+def test_main_no_regression(mktree, monkeypatch):
+    from click.testing import CliRunner
+
+    from pytest_tdd import script
+
+    rootdir = mktree(
+        """
+    src/liba/__init__.py
+    src/liba/core.py
+    tests/test_core.py
+    """
+    )
+    (rootdir / "src/liba/core.py").write_text("def f():\n    return 1\n\ndef g():\n    return 2\n")
+    (rootdir / "tests/test_core.py").write_text("from liba import core\ndef test_f():\n    assert core.f() == 1\n")
+    monkeypatch.chdir(rootdir)
+    args = ["--cache-dir", "cache", "--no-regression", "src/liba/core.py"]
+
+    result = CliRunner().invoke(script.main, args)
+    assert result.exception is None, result.output
+    assert result.exit_code == 0
+
+    result = CliRunner().invoke(script.main, ["--threshold", "80", *args])
+    assert result.exit_code == 1
+
+    (rootdir / "src/liba/core.py").write_text("def f():\n    return 1\n\ndef g():\n    return 2\n\ndef h():\n    return 3\n")
+    result = CliRunner().invoke(script.main, args)
+    assert result.exit_code == 1
+    with baseline.Baselines(Path("cache/baselines.sqlite")) as baselines:
+        assert baselines.get(["src/liba/core.py"]) == {"src/liba/core.py": 75.0}
+
+
+def test_memory_gate(tmp_path):
+    with baseline.Baselines(tmp_path / "baselines.sqlite", "memory") as baselines:
+        gate = baseline.MemoryGate(baselines=baselines, rootdir=tmp_path)
+        result = runner.Result(runner.Unit(tmp_path / "src/a.py", [], []), 0)
+        gate(result, runner.Summary(memory={"peak_rss": 100}))
+        gate(runner.Result(runner.Unit(tmp_path / "src/b.py", [], []), 0), runner.Summary())
+        assert gate.check() == []
+        assert baselines.get(["src/a.py", "src/b.py"]) == {"src/a.py": 100.0}
+
+        # within the tolerance, the baseline doesn't creep up
+        for peak in [105, 109]:
+            gate = baseline.MemoryGate(baselines=baselines, no_regression=True, rootdir=tmp_path)
+            gate(result, runner.Summary(memory={"peak_rss": peak}))
+            assert gate.check() == []
+        assert baselines.get(["src/a.py"]) == {"src/a.py": 100.0}
+
+        gate = baseline.MemoryGate(baselines=baselines, no_regression=True, rootdir=tmp_path)
+        gate(result, runner.Summary(memory={"peak_rss": 115}))
+        assert gate.check() == [baseline.Failure("src/a.py", 115.0, 100.0, "regression")]
+
+        # a lower peak is the new baseline
+        gate = baseline.MemoryGate(baselines=baselines, no_regression=True, rootdir=tmp_path)
+        gate(result, runner.Summary(memory={"peak_rss": 90}))
+        assert gate.check() == []
+        assert baselines.get(["src/a.py"]) == {"src/a.py": 90.0}
+
+    # the metrics don't mix
+    with baseline.Baselines(tmp_path / "baselines.sqlite") as baselines:
+        assert baselines.get(["src/a.py"]) == {}
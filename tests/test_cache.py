@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from unittest import mock
+
+from pytest_tdd import cache
+
+
+def test_cachedir(tmp_path):
+    assert cache.cachedir(tmp_path) == tmp_path
+    with mock.patch.dict(os.environ, {cache.CACHE_DIR_ENV: str(tmp_path / "x")}):
+        assert cache.cachedir() == tmp_path / "x"
+    with mock.patch.dict(os.environ, {cache.CACHE_DIR_ENV: ""}):
+        assert cache.cachedir() == Path(cache.CACHE_DIR)
+
+
+def test_digest():
+    assert cache.digest("a", b"b") == cache.digest(b"a", "b")
+    assert cache.digest("ab") != cache.digest("a", "b")
+
+
+def test_cache(tmp_path):
+    store = cache.Cache("test", tmp_path, max_entries=2)
+    assert store.get(cache.digest("a")) is None
+
+    for key in "abc":
+        store.put(cache.digest(key), {"key": key})
+        os.utime(store._entry(cache.digest(key)), (0, ord(key)))
+    assert store.get(cache.digest("a")) == {"key": "a"}
+
+    # "a" was just used, "b" is the least recently used
+    assert store.evict() == 1
+    assert store.get(cache.digest("b")) is None
+    assert store.get(cache.digest("a")) == {"key": "a"}
+    assert store.get(cache.digest("c")) == {"key": "c"}
+    assert store.evict(0) == 2
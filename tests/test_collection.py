@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import sys
+import types
+from pathlib import Path
+
+from pytest_tdd import cache, collection, plugin, runner, tdd
+
+
+def test_matches():
+    assert collection.matches("slow", ["slow", "db"])
+    assert not collection.matches("slow and not db", ["slow", "db"])
+    assert collection.matches("not db", [])
+
+
+def test_compile_markers(monkeypatch):
+    evaluate = collection.compile_markers("slow or db")
+    assert evaluate and evaluate(["db"]) and not evaluate([])
+
+    # without pytest (private) evaluator the selection is left to pytest -m
+    monkeypatch.setitem(sys.modules, "_pytest.mark.expression", None)
+    assert collection.compile_markers("slow") is None
+
+
+def test_selector():
+    selector = plugin.Selector({})
+    # the selected node ids in the tests/test_a.py module
+    selector.modules["tests/test_a.py"] = ["test_x[1]", "C::test_z", "D"]
+    module = types.SimpleNamespace(nodeid="tests/test_a.py")
+
+    def makeitem(nodeid, name):
+        collector = types.SimpleNamespace(nodeid=nodeid, getparent=lambda cls: module)
+        return selector.pytest_pycollect_makeitem(collector, name, None)
+
+    # None lets pytest make the items, [] skips them
+    assert makeitem("tests/test_a.py", "test_x") is None
+    assert makeitem("tests/test_a.py", "test_y") == []
+    assert makeitem("tests/test_a.py", "C") is None
+    assert makeitem("tests/test_a.py::C", "test_z") is None
+    assert makeitem("tests/test_a.py::C", "test_w") == []
+    assert makeitem("tests/test_a.py::D", "test_v") is None
+
+
+def test_key(mktree):
+    rootdir = mktree(
+        """
+    conftest.py
+    tests/conftest.py
+    tests/unit/test_a.py
+    tests/unit/test_b.py
+    """
+    )
+    col = collection.Collection(cache.Cache("collection", rootdir / "cache"), rootdir)
+    test_a = rootdir / "tests/unit/test_a.py"
+    key = col.key(test_a)
+    assert key and key != col.key(rootdir / "tests/unit/test_b.py")
+    assert col.key(rootdir / "tests/unit/test_missing.py") is None
+
+    # any file in the chain invalidates the key
+    for path in [test_a, rootdir / "tests/conftest.py", rootdir / "pytest.ini", rootdir / "tests/unit/conftest.py"]:
+        path.write_text("# changed\n")
+        assert col.key(test_a) != key
+        key = col.key(test_a)
+
+    # but not the unrelated ones
+    (rootdir / "tests/unit/test_b.py").write_text("# changed\n")
+    (rootdir / "other").mkdir()
+    (rootdir / "other/conftest.py").write_text("# changed\n")
+    assert col.key(test_a) == key
+
+
+def test_select(tmp_path):
+    col = collection.Collection(cache.Cache("collection", tmp_path / "cache"), tmp_path)
+    test_a = tmp_path / "test_a.py"
+    test_a.write_text("")
+    assert col.select([test_a], "slow") is None
+
+    col.put(
+        test_a,
+        {
+            "nodeids": ["test_x[1]", "test_x[2]", "test_y", "C::test_z"],
+            "markers": {"test_x[2]": ["slow"], "C::test_z": ["slow"]},
+        },
+    )
+    assert col.select([test_a], "slow") == [Path(f"{test_a}::test_x[2]"), Path(f"{test_a}::C::test_z")]
+    assert col.select([Path(f"{test_a}::test_x")], "not slow") == [Path(f"{test_a}::test_x[1]")]
+    assert col.select([Path(f"{test_a}::C")], "slow") == [Path(f"{test_a}::C::test_z")]
+
+    test_a.write_text("# changed\n")
+    assert col.select([test_a], "slow") is None
+
+
+def test_runner_selection(mktree):
+    rootdir = mktree(
+        """
+    src/package/__init__.py
+    src/package/mod.py
+    tests/test_mod.py
+    """
+    )
+    (rootdir / "src/package/mod.py").write_text("def f(x):\n    return x + 1\n")
+    (rootdir / "tests/test_mod.py").write_text(
+        "import pytest\n"
+        "from package import mod\n"
+        "def pytest_generate_tests(metafunc):\n"
+        f"    with open({str(rootdir / 'generated.txt')!r}, 'a') as fp:\n"
+        "        fp.write(metafunc.function.__name__ + '\\n')\n"
+        "@pytest.mark.parametrize('x', range(50))\n"
+        "def test_many(x):\n    assert mod.f(x) == x + 1\n"
+        "@pytest.mark.slow\n"
+        "@pytest.mark.parametrize('x', range(3))\n"
+        "def test_slow(x):\n    assert mod.f(x) == x + 1\n"
+    )
+    (rootdir / "pytest.ini").write_text("[pytest]\nmarkers =\n    slow: slow tests\n")
+    col = collection.Collection(cache.Cache("collection", rootdir / "cache"), rootdir)
+
+    def run(name):
+        pipeline = runner.Runner(
+            tdd.Resolver([rootdir / "src"], [rootdir / "tests"]),
+            runner.SubprocessEngine(track=True),
+            cwd=rootdir,
+            collection=col,
+            markers="slow",
+        )
+        (unit,) = pipeline.plan([rootdir / "src/package/mod.py"], rootdir / name)
+        (result,) = pipeline.execute([unit])
+        return unit, result, pipeline.collect(result)
+
+    # cache miss: pytest collects everything and deselects
+    unit, result, summary = run("first")
+    assert unit.markers == "slow"
+    assert unit.candidates == [rootdir / "tests/test_mod.py"]
+    assert summary.tests["tests"] == 3
+    assert "53 items / 50 deselected / 3 selected" in result.stdout
+    assert len(result.collected[str(rootdir / "tests/test_mod.py")]["nodeids"]) == 53
+    assert (rootdir / "generated.txt").read_text().split() == ["test_many", "test_slow"]
+
+    # cache hit: straight to the selected node ids
+    (rootdir / "generated.txt").unlink()
+    unit, result, summary = run("second")
+    assert unit.markers is None
+    assert [str(c).partition("::")[2] for c in unit.candidates] == ["test_slow[0]", "test_slow[1]", "test_slow[2]"]
+    assert summary.tests["tests"] == 3
+    assert "collected 3 items" in result.stdout
+    # test_many is never even parametrized
+    assert (rootdir / "generated.txt").read_text().split() == ["test_slow"]
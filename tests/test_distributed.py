@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+import pytest_tdd
+from pytest_tdd import distributed, runner, tdd
+
+
+class FakeEngine:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.units = []
+
+    def execute(self, unit):
+        time.sleep(self.delay)
+        self.units.append(unit.source.name)
+        return runner.Result(unit, 0 if unit.candidates else 5, ["fake"], stdout=f"{self.delay}")
+
+
+def test_unit_roundtrip(tmp_path):
+    unit = runner.Unit(Path("/a/b.py"), ["b"], [Path("/t/test_b.py::test_x")], [Path("/a")], Path("x"), Path("/c"))
+    assert distributed.unit_from_dict(distributed.unit_to_dict(unit), tmp_path) == runner.Unit(
+        Path("/a/b.py"), ["b"], [Path("/t/test_b.py::test_x")], [Path("/a")], tmp_path, Path("/c")
+    )
+
+
+def test_work_stealing(tmp_path):
+    units = [runner.Unit(Path(f"mod{n}.py"), [], [Path(f"test_mod{n}.py")]) for n in range(6)]
+    coordinator = distributed.Coordinator(units, tmp_path / "results", wait=0.01)
+
+    engines = {"slow": FakeEngine(2.0), "fast": FakeEngine(0.01)}
+    threads = [
+        threading.Thread(target=distributed.work, args=(coordinator.address, engine, tmp_path / name, name))
+        for name, engine in engines.items()
+    ]
+    for thread in threads:
+        thread.start()
+    start = time.monotonic()
+    results = coordinator.run(timeout=30)
+    elapsed = time.monotonic() - start
+    for thread in threads:
+        thread.join()
+
+    assert [r.unit.source.name for r in results] == [f"mod{n}.py" for n in range(6)]
+    # the fast worker did all the work, stealing the unit the slow one was running
+    assert len(engines["slow"].units) <= 1
+    assert sorted(engines["fast"].units) == [f"mod{n}.py" for n in range(6)]
+    assert all(r.stdout == "0.01" for r in results)
+    assert elapsed < 2.0
+
+
+def test_lost_worker(tmp_path):
+    units = [runner.Unit(Path("mod.py"), [], [])]
+    coordinator = distributed.Coordinator(units, tmp_path)
+    assert coordinator.next("a")["id"] == 0
+    assert coordinator.next("a")["op"] == "wait"  # cannot steal from itself
+    coordinator.lost("a")
+    assert coordinator.next("b")["id"] == 0
+    coordinator.server.server_close()
+
+
+def test_workers(mktree, monkeypatch):
+    rootdir = mktree(
+        """
+    src/package/__init__.py
+    src/package/modA.py
+    src/package/modB.py
+    src/package/modC.py
+    tests/test_modA.py
+    tests/test_modB.py
+    tests/test_modC.py
+    """
+    )
+    for name in "ABC":
+        (rootdir / f"src/package/mod{name}.py").write_text(f"def f{name}(x):\n    if x:\n        return 1\n    return 2\n")
+        (rootdir / f"tests/test_mod{name}.py").write_text(
+            f"from package import mod{name}\ndef test_f():\n    assert mod{name}.f{name}(1) == {1 if name != 'C' else 3}\n"
+        )
+    monkeypatch.chdir(rootdir)
+
+    resolver = tdd.Resolver([rootdir / "src"], [rootdir / "tests"])
+    pipeline = runner.Runner(resolver, cwd=rootdir)
+    units = pipeline.plan([rootdir / f"src/package/mod{name}.py" for name in "ABC"], rootdir / "plan")
+    coordinator = distributed.Coordinator(units, rootdir / "results", wait=0.05)
+
+    env = {**os.environ, "PYTHONPATH": str(Path(pytest_tdd.__file__).parent.parent)}
+    host, port = coordinator.address
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-m", "pytest_tdd.distributed", "worker", "--host", host, "--port", str(port)], env=env
+        )
+        for _ in range(3)
+    ]
+    try:
+        results = coordinator.run(timeout=60)
+    finally:
+        for worker in workers:
+            worker.wait(timeout=30)
+
+    assert [r.returncode for r in results] == [0, 0, 1]
+    summaries = [pipeline.collect(r) for r in results]
+    assert [s.tests["failures"] for s in summaries] == [0, 0, 1]
+    assert [s.coverage["percent"] for s in summaries] == [75.0, 75.0, 75.0]
+
+    merged = distributed.merge([r.datafile for r in results], rootdir / "merged.coverage")
+    files = runner.coverage_files(merged)
+    assert sorted(Path(f).name for f in files) == ["modA.py", "modB.py", "modC.py"]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_unreachable(tmp_path):
+    port = free_port()
+    start = time.monotonic()
+    with pytest.raises(ConnectionError, match=f"cannot reach the coordinator at 127.0.0.1:{port}"):
+        distributed.work(("127.0.0.1", port), FakeEngine(), tmp_path, wait=0.5)
+    assert time.monotonic() - start >= 0.3
+
+    result = CliRunner().invoke(distributed.main, ["worker", "--port", str(port), "--wait", "0"])
+    assert result.exit_code == 1
+    assert "Error: cannot reach the coordinator" in result.output
+
+
+def test_main(mktree, monkeypatch):
+    rootdir = mktree(
+        """
+    src/package/__init__.py
+    src/package/modA.py
+    src/package/modB.py
+    tests/test_modA.py
+    tests/test_modB.py
+    """
+    )
+    for name, value in [("A", 1), ("B", 2)]:
+        (rootdir / f"src/package/mod{name}.py").write_text("def f():\n    return 1\n")
+        (rootdir / f"tests/test_mod{name}.py").write_text(
+            f"from package import mod{name}\ndef test_f():\n    assert mod{name}.f() == {value}\n"
+        )
+    monkeypatch.chdir(rootdir)
+
+    # the worker starts first, and waits for the coordinator
+    port = free_port()
+    env = {**os.environ, "PYTHONPATH": str(Path(pytest_tdd.__file__).parent.parent)}
+    worker = subprocess.Popen([sys.executable, "-m", "pytest_tdd.distributed", "worker", "--port", str(port)], env=env)
+    try:
+        result = CliRunner().invoke(
+            distributed.main,
+            ["coordinator", "--port", str(port), "--timeout", "60", "src/package/modA.py", "src/package/modB.py"],
+        )
+    finally:
+        assert worker.wait(timeout=30) == 0
+    # modB tests fail
+    assert result.exit_code == 1, result.output
+
+
+def test_protocol(tmp_path):
+    units = [runner.Unit(Path("mod.py"), [], [])]
+    coordinator = distributed.Coordinator(units, tmp_path, token="secret")
+    thread = threading.Thread(target=coordinator.server.serve_forever, daemon=True)
+    thread.start()
+
+    def session(*msgs):
+        with socket.create_connection(coordinator.address) as sock, sock.makefile("rwb") as stream:
+            replies = []
+            for msg in msgs:
+                stream.write((msg if isinstance(msg, bytes) else json.dumps(msg).encode("utf-8")) + b"\n")
+                stream.flush()
+                replies.append(json.loads(line) if (line := stream.readline()) else None)
+            return replies
+
+    hello = {"op": "hello", "worker": "w", "token": "secret"}
+    result = {"op": "result", "id": 0, "returncode": 0, "cmd": [], "stdout": "", "stderr": "",
+              "tests": None, "coverage": None, "datafile": None, "memory": None, "limit": None}  # fmt: skip
+    try:
+        # hello first, with the token
+        assert session({"op": "get"}, hello) == [{"op": "error", "message": "say hello first"}, None]
+        assert session({**hello, "token": "wrong"}) == [{"op": "error", "message": "invalid token"}]
+
+        # the invalid messages get an error, the session goes on
+        replies = session(
+            hello,
+            b"garbage",
+            {"op": "result", "id": "0"},
+            {**result, "id": 7},
+            {**result, "stdout": 1},
+            {**result, "datafile": "not base64!"},
+            result,  # not handed out yet
+            {"op": "get"},
+            result,
+        )
+        assert replies[0] == {"op": "ok"}
+        assert [reply["op"] for reply in replies[1:7]] == ["error"] * 6
+        assert replies[2]["message"] == "invalid unit id '0'"
+        assert replies[3]["message"] == "invalid unit id 7"
+        assert replies[4]["message"] == "invalid stdout in unit 0 result"
+        assert replies[6]["message"] == "unit 0 was not handed out to w"
+        assert replies[7]["op"] == "unit"
+        assert replies[8] == {"op": "ok"}
+        assert coordinator.results[0].returncode == 0
+    finally:
+        coordinator.server.shutdown()
+        coordinator.server.server_close()
+
+
+def test_token(tmp_path):
+    units = [runner.Unit(Path(f"mod{n}.py"), [], [Path(f"test_mod{n}.py")]) for n in range(2)]
+    coordinator = distributed.Coordinator(units, tmp_path / "results", wait=0.01, token="secret")
+    results = []
+    thread = threading.Thread(target=lambda: results.extend(coordinator.run(timeout=30)))
+    thread.start()
+
+    with pytest.raises(ConnectionError, match="the coordinator turned w down: invalid token"):
+        distributed.work(coordinator.address, FakeEngine(), tmp_path / "bad", "w")
+    assert distributed.work(coordinator.address, FakeEngine(), tmp_path / "w", "w", token="secret") == 2
+    thread.join()
+    assert [r.unit.source.name for r in results] == ["mod0.py", "mod1.py"]
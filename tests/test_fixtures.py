@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from pytest_tdd import cache, fixtures, tree
+
+LAYOUT = """
+    # a comment
+    src/package/__init__.py
+    src/package/module.py
+    tests/
+"""
+
+
+def test_parse():
+    root = fixtures.parse(LAYOUT)
+    assert tree.dumps(root) == tree.dumps(fixtures.parse(tree.dumps(root)))
+    assert [str(node.path) for node in tree.select(root, "**/*.py")] == [
+        "src/package/__init__.py",
+        "src/package/module.py",
+    ]
+    assert tree.find(root, "tests/").kind == tree.Kind.DIR
+
+
+def test_mktree(mktree, mktree_templates, tmp_path):
+    rootdir = mktree(LAYOUT)
+    assert rootdir == tmp_path
+    assert (rootdir / "src/package/module.py").read_text() == ""
+    assert (rootdir / "tests").is_dir()
+
+    mktree(LAYOUT, subpath="other")
+    assert (tmp_path / "other/src/package/module.py").exists()
+    # written once, cloned twice
+    assert mktree_templates.lookup(cache.digest("", LAYOUT))
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from pytest_tdd import history
+
+
+def test_history(tmp_path):
+    with history.History(tmp_path / "db" / "history.sqlite", keep=3) as store:
+        store.record("src/a.py", "d1", {"t::one": "passed", "t::two": "failed"})
+        assert store.last("src/a.py") == {"t::one": "passed", "t::two": "failed"}
+        assert store.failed("src/a.py") == ["t::two"]
+        assert store.failed("src/b.py") == []
+        assert store.flaky("src/a.py", "d1") == []
+
+        store.record("src/a.py", "d2", {"t::one": "failed", "t::two": "passed"})
+        assert store.failed("src/a.py") == ["t::one"]
+        assert store.flaky("src/a.py", "d2") == []  # the code changed
+
+        store.record("src/a.py", "d2", {"t::one": "passed", "t::two": "flaky"})
+        assert store.flaky("src/a.py", "d2") == ["t::one", "t::two"]
+
+        store.record("src/a.py", "d3", {"t::one": "passed"})
+        rows = store.db.execute("SELECT COUNT(*) FROM runs WHERE nodeid = 't::one'").fetchone()
+        assert rows == (3,)
+
+
+def test_quarantine(tmp_path):
+    with history.History(tmp_path / "history.sqlite") as store:
+        assert store.quarantine("src/a.py", ["t::one", "t::two"]) == ["t::one", "t::two"]
+        assert store.quarantine("src/a.py", ["t::two", "t::three"]) == ["t::three"]
+        assert store.quarantined("src/a.py") == ["t::one", "t::three", "t::two"]
+        assert store.quarantined("src/b.py") == []
+
+        store.release("src/a.py", ["t::one"])
+        assert store.quarantined("src/a.py") == ["t::three", "t::two"]
+        store.release("src/a.py")
+        assert store.quarantined("src/a.py") == []
+
+
+def test_recover(tmp_path):
+    with history.History(tmp_path / "history.sqlite") as store:
+        store.record("src/a.py", "d1", {"t::one": "failed", "t::two": "failed"})
+        store.record("src/a.py", "d1", {"t::one": "passed", "t::two": "passed"})
+        store.quarantine("src/a.py", store.flaky("src/a.py", "d1"))
+        assert store.recover("src/a.py", 2) == []
+
+        store.record("src/a.py", "d1", {"t::one": "passed", "t::two": "flaky"})
+        assert store.recover("src/a.py", 2) == ["t::one"]
+        assert store.quarantined("src/a.py") == ["t::two"]
+        # its failures are gone, it's not flaky anymore
+        assert store.flaky("src/a.py", "d1") == ["t::two"]
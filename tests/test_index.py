@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import os
+
+from pytest_tdd import cache, index, runner, tdd
+
+LAYOUT = """
+├── src/
+│   └── package/
+│       ├── __init__.py
+│       ├── modA.py
+│       └── modB.py
+└── tests/
+    ├── unit/
+    │   ├── test_alpha.py
+    │   └── test_beta.py
+    ├── test_modA.py
+    └── test_special.py
+"""
+
+
+def test_expand(mktree):
+    rootdir = mktree(LAYOUT)
+    assert index.expand("tests/unit/test_*.py", rootdir) == [
+        "tests/unit/test_alpha.py",
+        "tests/unit/test_beta.py",
+    ]
+    assert index.expand("tests/**/test_beta.py::test_a[1]", rootdir) == [
+        "tests/unit/test_beta.py::test_a[1]",
+    ]
+    assert index.expand("tests/missing.py", rootdir) == []
+
+
+def test_build(mktree, tmp_path):
+    rootdir = mktree(LAYOUT)
+    (rootdir / "src/package/modA.py").write_text("""\
+'''module A
+
+tdd: tests/unit/test_*.py
+'''
+# tdd: tests/test_modA.py::test_one
+""")
+    (rootdir / "tests/test_special.py").write_text("# tdd: src/package/mod*.py\n")
+
+    store = cache.Cache("metadata", tmp_path / "cache")
+    idx = index.build(rootdir, [rootdir / "src"], [rootdir / "tests"], store)
+    assert idx.mapping == {
+        "src/package/modA.py": [
+            "tests/unit/test_alpha.py",
+            "tests/unit/test_beta.py",
+            "tests/test_modA.py::test_one",
+            "tests/test_special.py",
+        ],
+        "src/package/modB.py": ["tests/test_special.py"],
+    }
+    assert not idx.stale()
+
+    path = idx.save(tmp_path / "index.json")
+    loaded = index.load(path)
+    assert loaded == idx
+    assert loaded.lookup(rootdir / "src/package/modB.py") == [rootdir / "tests/test_special.py"]
+    assert loaded.lookup(rootdir / "src/package/__init__.py") == []
+
+    candidates = tdd.lookup_candidates(
+        rootdir / "src/package/modB.py", rootdir / "src", rootdir / "tests", index=loaded
+    )
+    assert candidates[0] == rootdir / "tests/test_special.py"
+
+    # adding a file makes the index stale
+    (rootdir / "tests/unit/test_gamma.py").write_text("")
+    assert loaded.stale()
+
+    path.write_text("garbage")
+    assert index.load(path) is None
+    assert index.load(tmp_path / "missing.json") is None
+
+
+def touch(path, text):
+    # an in place edit (a distinct mtime even on coarse timestamps filesystems)
+    mtime = path.stat().st_mtime_ns
+    path.write_text(text)
+    os.utime(path, ns=(mtime + 10**9, mtime + 10**9))
+
+
+def test_open_index(mktree, tmp_path):
+    rootdir = mktree(LAYOUT)
+    (rootdir / "src/package/modA.py").write_text("# tdd: tests/unit/test_alpha.py\n")
+    (rootdir / "tests/test_special.py").write_text("# tdd: src/package/modA.py\n")
+    args = [tmp_path / "index.json", rootdir, [rootdir / "src"], [rootdir / "tests"]]
+
+    idx = index.open_index(*args)
+    assert idx.mapping == {"src/package/modA.py": ["tests/unit/test_alpha.py", "tests/test_special.py"]}
+
+    # editing the hints in place (no file added or removed) replaces them
+    touch(rootdir / "src/package/modA.py", "# tdd: tests/unit/test_beta.py\n")
+    touch(rootdir / "tests/test_special.py", "")
+    assert not idx.stale()
+    assert sorted(idx.changed()) == ["src/package/modA.py", "tests/test_special.py"]
+    idx = index.open_index(*args)
+    assert idx.mapping == {"src/package/modA.py": ["tests/unit/test_beta.py"]}
+    assert idx.sources(rootdir / "tests/test_special.py") == []
+    assert index.load(tmp_path / "index.json") == idx
+
+    # a source hint removed is gone from its discovered candidates too
+    (rootdir / "src/package/modA.py").write_text("'''no hints'''\n")
+    pipeline = runner.Runner(tdd.Resolver([rootdir / "src"], [rootdir / "tests"]), idx=idx)
+    assert rootdir / "tests/unit/test_beta.py" not in pipeline.discover(rootdir / "src/package/modA.py")
+    assert idx.mapping == {}
+
+
+def test_open_index_roots(mktree, tmp_path):
+    rootdir = mktree(LAYOUT)
+    (rootdir / "tests/unit/test_alpha.py").write_text("# tdd: src/package/modA.py\n")
+    (rootdir / "tests/test_special.py").write_text("# tdd: src/package/modB.py\n")
+    path = tmp_path / "index.json"
+
+    idx = index.open_index(path, rootdir, [rootdir / "src"], [rootdir / "tests/unit"])
+    assert idx.roots == [["src"], ["tests/unit"]]
+    assert idx.mapping == {"src/package/modA.py": ["tests/unit/test_alpha.py"]}
+
+    # another tests directory (-t) rebuilds the index, reading its hints
+    idx = index.open_index(path, rootdir, [rootdir / "src"], [rootdir / "tests"])
+    assert idx.mapping == {
+        "src/package/modA.py": ["tests/unit/test_alpha.py"],
+        "src/package/modB.py": ["tests/test_special.py"],
+    }
+
+    # an edit refreshes the hints against the indexed directories
+    idx = index.open_index(path, rootdir, [rootdir / "src"], [rootdir / "tests/unit"])
+    touch(rootdir / "tests/test_special.py", "# tdd: src/package/modA.py\n")
+    idx = index.open_index(path, rootdir, [rootdir / "src"], [rootdir / "tests/unit"])
+    assert idx.mapping == {"src/package/modA.py": ["tests/unit/test_alpha.py"]}
+    idx = index.open_index(path, rootdir, [rootdir / "src"], [rootdir / "tests"])
+    assert idx.mapping == {"src/package/modA.py": ["tests/test_special.py", "tests/unit/test_alpha.py"]}
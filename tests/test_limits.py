@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import signal
+import sys
+
+import pytest
+
+from pytest_tdd import limits, runner, tdd
+
+LAYOUT = """
+    src/package/__init__.py
+    src/package/mod.py
+    tests/test_mod.py
+"""
+
+
+def test_wrap():
+    assert not limits.Limits()
+    assert limits.Limits(cpu=3, files=10).wrap(["pytest", "x"]) == [
+        sys.executable, "-m", "pytest_tdd.limits", "--cpu", "3", "--files", "10", "--", "pytest", "x",
+    ]
+
+
+def test_hit():
+    none = limits.Limits()
+    assert limits.hit(none, -signal.SIGXCPU, "") is None
+    assert limits.hit(limits.Limits(cpu=1), -signal.SIGXCPU, "") == "cpu"
+    assert limits.hit(limits.Limits(cpu=1), 1, "MemoryError") is None
+    # the output matters only on failure
+    assert limits.hit(limits.Limits(memory=1), 0, "MemoryError") is None
+    # a SIGKILL is a cpu limit hit only with the cpu time used up (the OOM killer sends it too)
+    assert limits.hit(limits.Limits(cpu=1), -signal.SIGKILL, "") is None
+    assert limits.hit(limits.Limits(cpu=1), -signal.SIGKILL, "", cputime=0.2) is None
+    assert limits.hit(limits.Limits(cpu=1), -signal.SIGKILL, "", cputime=1.01) == "cpu"
+    assert limits.hit(limits.Limits(cpu=1, memory=1), -signal.SIGKILL, "MemoryError") is None
+    assert limits.hit(limits.Limits(memory=1), 1, "E   MemoryError") == "memory"
+    assert limits.hit(limits.Limits(files=1), 1, "E       OSError: [Errno 24] Too many open files") == "files"
+    output = "FAILED tests/test_mod.py::test_fork[a - b] - BlockingIOError: [Errno 11] Resource temporarily unavailable"
+    assert limits.hit(limits.Limits(processes=1), 1, output) == "processes"
+    # only the exception lines count, for their type or errno
+    output = """\
+tests/test_mod.py::test_handles_MemoryError FAILED
+E       AssertionError: MemoryError not raised
+E       assert 'Too many open files' == ''
+FAILED tests/test_mod.py::test_handles_MemoryError - AssertionError: MemoryError not raised
+"""
+    assert limits.hit(limits.Limits(memory=1, files=1, processes=1), 1, output) is None
+    assert limits.hit(limits.Limits(memory=1), 1, "print('MemoryError')\nMemoryError") is None
+    assert limits.hit(limits.Limits(files=1), 1, "E   OSError: [Errno 2] No such file or directory") is None
+
+
+def test_cgroup(tmp_path):
+    root = tmp_path / "cgroup"
+    assert limits.Cgroup.create("run", limits.Limits(memory=10), root) is None
+
+    cgroup = limits.Cgroup(tmp_path)
+    (tmp_path / "memory.events").write_text("low 0\nhigh 0\nmax 3\noom 1\noom_kill 1\n")
+    assert cgroup.events("memory")["oom_kill"] == 1
+    assert cgroup.events("pids") == {}
+    assert limits.hit(limits.Limits(memory=10), -signal.SIGKILL, "", cgroup) == "memory"
+
+
+@pytest.mark.parametrize(
+    "code, kwargs, expected",
+    [
+        ("while True:\n        pass", {"cpu": 1}, "cpu"),
+        ("data = bytearray(4 * 2**30)", {"memory": 2**30}, "memory"),
+        ("files = [open(__file__) for _ in range(200)]", {"files": 100}, "files"),
+        ("pass", {"cpu": 5, "files": 100}, None),
+    ],
+)
+def test_run(mktree, code, kwargs, expected):
+    rootdir = mktree(LAYOUT)
+    (rootdir / "tests/test_mod.py").write_text(f"def test_limit():\n    {code}\n")
+    pipeline = runner.Runner(
+        tdd.Resolver([rootdir / "src"], [rootdir / "tests"]),
+        runner.SubprocessEngine(limits=limits.Limits(**kwargs)),
+        cwd=rootdir,
+    )
+    (unit,) = pipeline.plan([rootdir / "src/package/mod.py"], rootdir / "work")
+    (result,) = pipeline.execute([unit])
+    assert result.cmd[:3] == [sys.executable, "-m", "pytest_tdd.limits"]
+    assert result.limit == expected, result.stdout + result.stderr
+    assert (result.returncode == 0) == (expected is None)
+    line = runner.collect(result).line("mod.py")
+    assert line.startswith(f"mod.py hit the {expected} limit, ") == (expected is not None)
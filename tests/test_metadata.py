@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from unittest import mock
+
+from pytest_tdd import cache, metadata
+
+SOURCE = '''\
+"""my module
+
+tdd: tests/unit/test_special.py
+"""
+import os
+import os.path as osp
+from . import sibling
+from ..parent import something  # tdd: tests/test_*.py::test_a, tests/test_b.py
+
+
+def func():
+    # not a hint: tdd
+    return "# tdd: not a comment"
+
+
+class Klass:
+    pass
+'''
+
+
+def test_hints():
+    assert metadata.hints("tdd: a b,c") == ["a", "b", "c"]
+    assert metadata.hints("hello\n  tdd:  a\nworld") == ["a"]
+    assert metadata.hints("no tdd: here") == []
+
+
+def test_extract(tmp_path):
+    path = tmp_path / "module.py"
+    path.write_text(SOURCE)
+
+    meta = metadata.extract(path)
+    assert meta.path == path
+    assert meta.digest == cache.digest(SOURCE.encode("utf-8"))
+    assert meta.doc == "my module\n\ntdd: tests/unit/test_special.py"
+    assert meta.imports == ["os", "os.path", ".", "..parent"]
+    assert meta.defs == ["func", "Klass"]
+    assert meta.hints == ["tests/unit/test_special.py", "tests/test_*.py::test_a", "tests/test_b.py"]
+
+
+def test_extract_cached(tmp_path):
+    path = tmp_path / "module.py"
+    path.write_text(SOURCE)
+    store = cache.Cache("metadata", tmp_path / "cache")
+
+    meta = metadata.extract(path, store)
+    with mock.patch.object(metadata, "parse") as parse:
+        assert metadata.extract(path, store) == meta
+        parse.assert_not_called()
+
+    path.write_text("'''changed'''")
+    assert metadata.extract(path, store).doc == "changed"
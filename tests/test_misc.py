@@ -95,3 +95,10 @@ def test_mkdir_failure(tmp_path):
         assert tdir.exists()
         tdir.rmdir()
     assert not tdir.exists()
+
+
+def test_get_doc_module():
+    import ast
+
+    assert misc.get_doc(ast.parse("'''hello'''\nx = 1")) == "hello"
+    assert misc.get_doc(ast.parse("x = 1")) is None
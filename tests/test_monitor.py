@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import json
+import sys
+
+import pytest
+
+from pytest_tdd import monitor, runner, tdd
+
+SOURCE = '''\
+"""the module docstring"""
+import os
+
+
+@staticmethod
+@property
+def one(x):
+    """a docstring"""
+    if x:
+        return 1
+    elif x is None: return 2
+    else:
+        return (
+            3
+        )
+
+
+def two():  # pragma: no cover
+    return 4
+
+
+class Three:
+    """a docstring"""
+    value = {
+        "a": 1,
+    }
+
+    def method(self):
+        try:
+            return 1
+        except ValueError:
+            pass
+        finally:
+            os.getcwd()
+        while True:
+            break
+        with open(__file__) as fp:
+            fp.read()
+'''
+
+LAYOUT = """
+    src/package/__init__.py
+    src/package/mod.py
+    tests/test_mod.py
+"""
+
+
+def test_statements(tmp_path):
+    from coverage import Coverage
+
+    path = tmp_path / "mod.py"
+    path.write_text(SOURCE)
+    cov = Coverage(data_file=None)
+    _, expected, *_ = cov.analysis2(str(path))
+    assert sorted(set(monitor.statements(SOURCE).values())) == expected
+
+    mapping = monitor.statements(SOURCE)
+    # the continuation lines belong to their statement
+    assert mapping[14] == mapping[13] == 13
+    assert 18 not in mapping
+
+
+def test_summary():
+    mapping = monitor.statements(SOURCE)
+    data = monitor.summary([2, 14], mapping)
+    assert data["executed_lines"] == [2, 13]
+    assert data["summary"]["covered_lines"] == 2
+    assert data["summary"]["num_statements"] == len(set(mapping.values()))
+
+
+def test_start_old_python():
+    if sys.version_info >= (3, 12):
+        pytest.skip("python 3.12+ has sys.monitoring")
+    with pytest.raises(RuntimeError):
+        monitor.Monitor([]).start()
+
+
+@pytest.mark.skipif(sys.version_info < (3, 12), reason="needs sys.monitoring (python 3.12+)")
+def test_run(mktree):
+    rootdir = mktree(LAYOUT)
+    (rootdir / "src/package/mod.py").write_text("def one(x):\n    if x:\n        return 1\n    return 2\n")
+    (rootdir / "tests/test_mod.py").write_text("from package import mod\n\ndef test_one():\n    assert mod.one(1)\n")
+    pipeline = runner.Runner(
+        tdd.Resolver([rootdir / "src"], [rootdir / "tests"]),
+        runner.SubprocessEngine(report="monitor"),
+        cwd=rootdir,
+    )
+    (unit,) = pipeline.plan([rootdir / "src/package/mod.py"], rootdir / "work")
+    (result,) = pipeline.execute([unit])
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert not any(arg.startswith("--cov") for arg in result.cmd)
+    assert result.coverage
+    report = json.loads(result.coverage)
+    assert report["files"]["src/package/mod.py"]["missing_lines"] == [4]
+    assert runner.collect(result).coverage["percent"] == pytest.approx(75.0)
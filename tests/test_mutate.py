@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+from click.testing import CliRunner
+
+from pytest_tdd import cache, mutate, runner, script, tdd
+
+SOURCE = '''\
+"""the module docstring"""
+
+
+def clamp(x: int, low: int = 0) -> int:
+    # keep me
+    if x < low and True:
+        return low
+    return x
+
+
+def unused():  # pragma: no mutate
+    return 1 + 2
+
+
+if __name__ == "__main__":
+    print(clamp(-1))
+'''
+
+LAYOUT = """
+    src/package/__init__.py
+    src/package/mod.py
+    tests/test_mod.py
+"""
+
+
+def test_mutants():
+    found = list(mutate.mutants(SOURCE))
+    assert [mutant.description for mutant in found] == [
+        "line 4: replace 0 with 1",
+        "line 6: replace and with or",
+        "line 6: replace < with >=",
+        "line 6: replace True with False",
+        "line 7: return None",
+        "line 8: return None",
+    ]
+    # a single change, the rest of the source (comments included) is kept
+    assert found[2].source == SOURCE.replace("x < low", "x >= low")
+    assert "# keep me" in found[2].source
+    assert len({mutant.key for mutant in found}) == len(found)
+
+
+def test_mutants_parenthesized():
+    (first, second, *_) = mutate.mutants("y = (a + b) * c\n")
+    assert first.source == "y = (a + b) / c\n"
+    assert second.source == "y = (a - b) * c\n"
+
+
+def test_mutate(mktree):
+    rootdir = mktree(LAYOUT)
+    (rootdir / "src/package/mod.py").write_text(
+        "def clamp(x, low=0):\n    if x < low:\n        return low\n    return x\n"
+    )
+    (rootdir / "tests/test_mod.py").write_text(
+        "from package import mod\n\ndef test_clamp():\n    assert mod.clamp(-1) == 0\n"
+    )
+    pipeline = runner.Runner(tdd.Resolver([rootdir / "src"], [rootdir / "tests"]), cwd=rootdir)
+    (unit,) = pipeline.plan([rootdir / "src/package/mod.py"], rootdir / "work")
+    store = cache.Cache("mutants", rootdir / ".cache")
+
+    report = mutate.mutate(unit, store, jobs=2)
+    assert report.error is None
+    assert [mutant.description for mutant in report.survived] == ["line 4: return None"]
+    assert len(report.killed) == 3
+    assert report.cached == 0
+    assert report.line("mod.py") == "mod.py killed 3 mutants out of 4 (75.0%, survived=1)"
+    # the original module is untouched
+    assert "x < low" in (rootdir / "src/package/mod.py").read_text()
+
+    report = mutate.mutate(unit, store, jobs=2)
+    assert report.cached == 4
+    assert len(report.survived) == 1
+
+    # a new test invalidates the cached outcomes
+    with (rootdir / "tests/test_mod.py").open("a") as fp:
+        fp.write("\ndef test_value():\n    assert mod.clamp(3, 1) == 3\n")
+    (unit,) = pipeline.plan([rootdir / "src/package/mod.py"], rootdir / "work2")
+    report = mutate.mutate(unit, store)
+    assert report.cached == 0
+    assert not report.survived
+
+
+def test_mutate_local_keys(mktree):
+    rootdir = mktree(LAYOUT)
+    (rootdir / "src/package/mod.py").write_text("def f(x):\n    return x + 1\n\n\ndef g(x):\n    return x * 2\n")
+    (rootdir / "tests/test_mod.py").write_text(
+        "from package import mod\n\ndef test_mod():\n    assert mod.f(1) == 2\n    assert mod.g(3) == 6\n"
+    )
+    pipeline = runner.Runner(tdd.Resolver([rootdir / "src"], [rootdir / "tests"]), cwd=rootdir)
+    (unit,) = pipeline.plan([rootdir / "src/package/mod.py"], rootdir / "work")
+    store = cache.Cache("mutants", rootdir / ".cache")
+    report = mutate.mutate(unit, store)
+    assert (report.total, report.cached) == (6, 0)
+
+    # editing f (and moving g down) re-runs the new f mutants only
+    (rootdir / "src/package/mod.py").write_text(
+        "def f(x):\n    # one more\n    return x - -1\n\n\ndef g(x):\n    return x * 2\n"
+    )
+    report = mutate.mutate(unit, store)
+    assert (report.total, report.cached) == (6, 4)
+    # the cached outcomes come first (f returning None is the same mutant as before)
+    assert [mutant.description for mutant in report.killed[:4]] == [
+        "line 3: return None",
+        "line 7: return None",
+        "line 7: replace * with /",
+        "line 7: replace 2 with 3",
+    ]
+    assert not report.survived
+
+
+def test_mutate_failing(mktree):
+    rootdir = mktree(LAYOUT)
+    (rootdir / "tests/test_mod.py").write_text("def test_fail():\n    assert False\n")
+    pipeline = runner.Runner(tdd.Resolver([rootdir / "src"], [rootdir / "tests"]), cwd=rootdir)
+    (unit,) = pipeline.plan([rootdir / "src/package/mod.py"], rootdir / "work")
+    assert mutate.mutate(unit).error == "the tests fail without mutations"
+
+
+def test_main_mutate(mktree, monkeypatch):
+    rootdir = mktree(LAYOUT)
+    (rootdir / "src/package/mod.py").write_text("def clamp(x, low=0):\n    return max(x, low)\n")
+    (rootdir / "tests/test_mod.py").write_text("from package import mod\n\ndef test_clamp():\n    mod.clamp(-1)\n")
+    monkeypatch.chdir(rootdir)
+
+    # a surviving mutant fails the run
+    result = CliRunner().invoke(script.main, ["--cache-dir", "cache", "--mutate", "src/package/mod.py"])
+    assert result.exit_code == 1, result.output
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import os
+
+from pytest_tdd import history, index, runner, tdd
+
+KEY = "src/package/mod.py"
+
+PASSING = "from package import mod\ndef test_one():\n    assert mod.f(1) == 2\n"
+
+# fails, passes, fails ... (one outcome per run)
+FLAKY = (
+    "import pathlib\n"
+    "def test_flaky():\n"
+    "    counter = pathlib.Path(__file__).parent / 'counter'\n"
+    "    count = int(counter.read_text()) if counter.exists() else 0\n"
+    "    counter.write_text(str(count + 1))\n"
+    "    assert count % 2\n"
+)
+
+
+CONFTEST = """\
+import pytest, warnings
+@pytest.fixture
+def value():
+    warnings.warn("deprecated value")
+    return {value}
+"""
+
+
+def _runner(rootdir, store=None, **kwargs):
+    return runner.Runner(
+        tdd.Resolver([rootdir / "src"], [rootdir / "tests"]),
+        runner.SubprocessEngine(track=True, reruns=1),
+        cwd=rootdir,
+        history=store,
+        **kwargs,
+    )
+
+
+def _run(rootdir, store, **kwargs):
+    pipeline = _runner(rootdir, store, **kwargs)
+    (unit,) = pipeline.plan([rootdir / KEY], rootdir / f"work{os.urandom(4).hex()}")
+    (result,) = pipeline.execute([unit])
+    pipeline.collect(result)
+    return unit, result
+
+
+def test_failed_first(project):
+    rootdir = project({"tests/test_mod.py": PASSING + "def test_two():\n    assert mod.f(1) == 3\n"})
+    with history.History(rootdir / "history.sqlite") as store:
+        unit, result = _run(rootdir, store)
+        assert unit.first == []
+        assert result.returncode == 1
+        assert result.outcomes == {"tests/test_mod.py::test_one": "passed", "tests/test_mod.py::test_two": "failed"}
+
+        unit, result = _run(rootdir, store)
+        assert unit.first == ["tests/test_mod.py::test_two"]
+        assert list(result.outcomes) == ["tests/test_mod.py::test_two", "tests/test_mod.py::test_one"]
+        # failing every time isn't flaky
+        assert store.quarantined(KEY) == []
+
+
+def test_flaky(project):
+    rootdir = project({"tests/test_mod.py": FLAKY})
+    with history.History(rootdir / "history.sqlite") as store:
+        _, result = _run(rootdir, store)
+        assert result.outcomes == {"tests/test_mod.py::test_flaky": "failed"}
+
+        # passing on changed tests isn't flaky
+        with (rootdir / "tests/test_mod.py").open("a") as fp:
+            fp.write("# changed\n")
+        _, result = _run(rootdir, store)
+        assert result.outcomes == {"tests/test_mod.py::test_flaky": "passed"}
+        assert store.quarantined(KEY) == []
+
+        # failing on the same code is
+        unit, result = _run(rootdir, store)
+        assert result.outcomes == {"tests/test_mod.py::test_flaky": "failed"}
+        assert store.flaky(KEY, _runner(rootdir).digest(unit)) == ["tests/test_mod.py::test_flaky"]
+        assert store.quarantined(KEY) == ["tests/test_mod.py::test_flaky"]
+
+
+def test_flaky_dependencies(project):
+    rootdir = project(
+        {
+            "tests/conftest.py": CONFTEST.format(value=2),
+            "tests/test_mod.py": "from package import mod\ndef test_one(value):\n    assert mod.f(1) == value\n",
+        }
+    )
+    (rootdir / "src/package/mod.py").write_text("from package import helper\ndef f(x):\n    return x + helper.ONE\n")
+    (rootdir / "src/package/helper.py").write_text("# tdd: tests/test_mod.py\nONE = 1\n")
+    idx = index.build(rootdir, [rootdir / "src"], [rootdir / "tests"])
+    assert idx.sources(rootdir / "tests/test_mod.py") == [rootdir / "src/package/helper.py"]
+
+    with history.History(rootdir / "history.sqlite") as store:
+        _, result = _run(rootdir, store, idx=idx)
+        assert result.returncode == 0
+
+        # a failure caused by a conftest.py ...
+        (rootdir / "tests/conftest.py").write_text(CONFTEST.format(value=3))
+        _, result = _run(rootdir, store, idx=idx)
+        assert result.returncode == 1
+
+        # ... a configuration file ...
+        (rootdir / "tests/conftest.py").write_text(CONFTEST.format(value=2))
+        (rootdir / "pytest.ini").write_text("[pytest]\nfilterwarnings = error\n")
+        _, result = _run(rootdir, store, idx=idx)
+        assert result.returncode != 0
+
+        # ... or a source the tests exercise (recorded in the index) isn't flaky
+        (rootdir / "pytest.ini").unlink()
+        (rootdir / "src/package/helper.py").write_text("# tdd: tests/test_mod.py\nONE = 2\n")
+        _, result = _run(rootdir, store, idx=idx)
+        assert result.returncode == 1
+
+        assert store.quarantined(KEY) == []
+
+
+def test_quarantine(project):
+    rootdir = project({"tests/test_mod.py": FLAKY})
+    with history.History(rootdir / "history.sqlite") as store:
+        store.quarantine(KEY, ["tests/test_mod.py::test_flaky"])
+
+        # without quarantine=True the quarantined tests fail the run
+        unit, result = _run(rootdir, store)
+        assert unit.quarantine == []
+        assert result.returncode == 1
+        assert result.outcomes == {"tests/test_mod.py::test_flaky": "failed"}
+
+        # with quarantine=True they're rerun on failure
+        (rootdir / "tests/counter").write_text("2")
+        unit, result = _run(rootdir, store, quarantine=True)
+        assert unit.quarantine == ["tests/test_mod.py::test_flaky"]
+        assert result.returncode == 0
+        assert result.outcomes == {"tests/test_mod.py::test_flaky": "flaky"}
+
+        # and with no reruns left reported as xfail
+        (rootdir / "tests/test_mod.py").write_text(FLAKY.replace("assert count % 2", "assert False"))
+        _, result = _run(rootdir, store, quarantine=True)
+        assert result.returncode == 0
+        assert result.outcomes == {"tests/test_mod.py::test_flaky": "quarantined"}
+        assert "XFAIL" in result.stdout
+
+
+def test_release(project):
+    rootdir = project({"tests/test_mod.py": PASSING})
+    with history.History(rootdir / "history.sqlite") as store:
+        pipeline = _runner(rootdir)
+        (unit,) = pipeline.plan([rootdir / KEY], rootdir / "work")
+        # it was flaky on this very code
+        store.record(KEY, pipeline.digest(unit), {"tests/test_mod.py::test_one": "failed"})
+        store.quarantine(KEY, ["tests/test_mod.py::test_one"])
+
+        unit, result = _run(rootdir, store, quarantine=True, release=2)
+        assert unit.quarantine == ["tests/test_mod.py::test_one"]
+        assert result.outcomes == {"tests/test_mod.py::test_one": "passed"}
+        assert store.quarantined(KEY) == ["tests/test_mod.py::test_one"]
+
+        # released after passing 2 runs in a row (and not put back in quarantine)
+        _run(rootdir, store, quarantine=True, release=2)
+        assert store.quarantined(KEY) == []
+        unit, _ = _run(rootdir, store, quarantine=True, release=2)
+        assert unit.quarantine == []
+        assert store.quarantined(KEY) == []
+
+        # release=0 keeps them in quarantine
+        store.quarantine(KEY, ["tests/test_mod.py::test_one"])
+        for _ in range(3):
+            _run(rootdir, store, release=0)
+        assert store.quarantined(KEY) == ["tests/test_mod.py::test_one"]
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+from pytest_tdd import runner, tdd
+
+LAYOUT = """
+├── src/
+│   └── package/
+│       ├── __init__.py
+│       ├── modA.py
+│       └── modB.py
+└── tests/
+    ├── package/
+    │   └── test_modA.py
+    └── test_modB.py
+"""
+
+
+class FakeEngine:
+    def __init__(self):
+        self.units = []
+
+    def execute(self, unit):
+        self.units.append(unit)
+        return runner.Result(unit, 0 if unit.candidates else 5, ["fake"])
+
+
+def test_plan(mktree):
+    rootdir = mktree(LAYOUT)
+    pipeline = runner.Runner(tdd.Resolver([rootdir / "src"], [rootdir / "tests"]))
+
+    units = pipeline.plan(
+        [rootdir / "src/package/modA.py", rootdir / "tests/test_modB.py"], rootdir / "work"
+    )
+    assert [(u.modules, u.candidates, u.workdir.name) for u in units] == [
+        (["package.modA"], [rootdir / "tests/package/test_modA.py"], "00000"),
+        ([], [rootdir / "tests/test_modB.py"], "00001"),  # no index to find modB
+    ]
+    assert all(u.workdir.is_dir() for u in units)
+
+
+def test_run(mktree):
+    rootdir = mktree(LAYOUT)
+    engine = FakeEngine()
+    reported = []
+
+    pipeline = runner.Runner(
+        tdd.Resolver([rootdir / "src"], [rootdir / "tests"]),
+        engine,
+        sinks=[lambda result, summary: reported.append((result.unit.source.name, summary.line("x")))],
+    )
+    sources = [rootdir / "src/package/modA.py", rootdir / "src/package/__init__.py", rootdir / "src/package/modB.py"]
+    assert pipeline.run(sources, rootdir / "work", jobs=3) == 5
+    assert [u.source.name for u in engine.units] == ["modA.py", "__init__.py", "modB.py"]
+    assert reported == [
+        ("modA.py", "x tests n/a, coverage n/a"),
+        ("__init__.py", "x tests n/a, coverage n/a"),
+        ("modB.py", "x tests n/a, coverage n/a"),
+    ]
+
+
+def test_collect(resolver):
+    result = runner.Result(
+        runner.Unit(Path("a/b/file-name"), [], []),
+        1,
+        tests=resolver.resolve("test_tdd/junit.xml").read_text(),
+        coverage=resolver.resolve("test_tdd/coverage.json").read_text(),
+    )
+    summary = runner.collect(result)
+    assert summary.tests == {"errors": 0, "failures": 1, "skipped": 0, "tests": 4}
+    assert summary.coverage == {"covered_lines": 3, "num_statements": 4, "missing_lines": 1, "percent": 75.0}
+    assert summary.line("file-name") == (
+        "file-name run 4 tests with 1 failures and 0 errors, covered 3 lines out of 4 "
+        "(75.0%, missing=1 lines)"
+    )
+
+
+def test_summary_parse(resolver):
+    tests = resolver.resolve("test_tdd/junit.xml").read_text()
+    coverage = resolver.resolve("test_tdd/coverage.json").read_text()
+    summary = runner.Summary.parse(tests, coverage)
+    assert summary.tests == {"errors": 0, "failures": 1, "skipped": 0, "tests": 4}
+    assert summary.coverage == {"covered_lines": 3, "num_statements": 4, "missing_lines": 1, "percent": 75.0}
+    assert runner.Summary.parse().line("x") == "x tests n/a, coverage n/a"
+
+
+def test_modules_source(mktree):
+    rootdir = mktree(LAYOUT)
+    (rootdir / "src/other.py").write_text("")
+    src = rootdir / "src"
+    assert runner.modules_source(["package.modA"], [src]) == src / "package/modA.py"
+    assert runner.modules_source(["package"], [rootdir / "tests", src]) == src / "package"
+    # many modules: the directory holding them
+    assert runner.modules_source(["package.modA", "package.modB"], [src]) == src / "package"
+    assert runner.modules_source(["package.modA", "other"], [src]) == src
+    with pytest.raises(ValueError, match="cannot find module package.missing"):
+        runner.modules_source(["package.missing"], [src])
+
+
+def test_coverage_report_data(mktree):
+    rootdir = mktree(LAYOUT)
+    (rootdir / "src/package/modA.py").write_text("def f(x):\n    if x:\n        return 1\n    return 2\n")
+    (rootdir / "tests/package/test_modA.py").write_text("from package import modA\ndef test_f():\n    assert modA.f(1) == 1\n")
+    resolver = tdd.Resolver([rootdir / "src"], [rootdir / "tests"])
+
+    summaries = {}
+    for report in ["json", "data"]:
+        pipeline = runner.Runner(resolver, runner.SubprocessEngine(report=report), cwd=rootdir)
+        (unit,) = pipeline.plan([rootdir / "src/package/modA.py"], rootdir / report)
+        (result,) = pipeline.execute([unit])
+        assert (result.coverage is None) == (report == "data")
+        assert (result.datafile is None) == (report == "json")
+        summaries[report] = runner.collect(result)
+
+    assert summaries["data"] == summaries["json"]
+    assert summaries["data"].coverage == {"covered_lines": 3, "num_statements": 4, "missing_lines": 1, "percent": 75.0}
+    assert not (rootdir / "data/00000/coverage.json").exists()
+    files = runner.coverage_files(rootdir / "data/00000/.coverage")
+    assert files == {str(rootdir / "src/package/modA.py"): [1, 2, 3]}
+
+
+def test_memory(mktree):
+    rootdir = mktree(LAYOUT)
+    (rootdir / "src/package/modA.py").write_text("DATA = []\n\ndef grow(n):\n    DATA.extend(bytes(1024) for _ in range(n))\n")
+    (rootdir / "tests/package/test_modA.py").write_text(
+        "from package import modA\ndef test_grow():\n    modA.grow(2000)\n"
+    )
+    pipeline = runner.Runner(
+        tdd.Resolver([rootdir / "src"], [rootdir / "tests"]),
+        runner.SubprocessEngine(memory=True, tracemalloc=3),
+        cwd=rootdir,
+        sinks=[runner.JsonSink(rootdir / "results.json")],
+    )
+    assert pipeline.run([rootdir / "src/package/modA.py"], rootdir / "work") == 0
+
+    (unit,) = pipeline.plan([rootdir / "src/package/modA.py"], rootdir / "work2")
+    (result,) = pipeline.execute([unit])
+    assert result.memory["peak_rss"] > 2 * 2**20
+    assert result.memory["traced_peak"] >= 2000 * 1024
+    top = result.memory["top"][0]
+    assert (top["file"], top["line"]) == (str(rootdir / "src/package/modA.py"), 4)
+    assert top["size"] >= 2000 * 1024
+
+    line = runner.collect(result).line("modA.py")
+    assert ", peak memory " in line
+    assert f"top allocation {rootdir / 'src/package/modA.py'}:4 (" in line
+
+    (data,) = [json.loads(line) for line in (rootdir / "results.json").read_text().splitlines()]
+    assert data["source"] == str(rootdir / "src/package/modA.py")
+    assert data["tests"]["tests"] == 1
+    assert data["memory"]["peak_rss"] > 0
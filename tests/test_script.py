@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest_tdd
+
+# modules that must not be imported at startup (only when running tests)
+HEAVY = {"json", "subprocess", "xml.etree.ElementTree", "sqlite3", "pytest_tdd.runner", "pytest_tdd.tree"}
+
+# the pytest_tdd.script cumulative import time budget (in us), a loose
+# bound: it catches a heavy import sneaking in, not a slow machine
+BUDGET = 500_000
+
+
+def importtime(*args: str) -> dict[str, int]:
+    """returns the modules imported running python *args (with their cumulative import time)"""
+    env = {**os.environ, "PYTHONPATH": str(Path(pytest_tdd.__file__).parent.parent)}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args], capture_output=True, text=True, env=env, check=False
+    )
+    result = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        result[name.strip()] = int(cumulative)
+    return result
+
+
+def test_startup_budget():
+    found = importtime("-c", "import pytest_tdd.script")
+    assert not HEAVY & set(found)
+    assert found["pytest_tdd.script"] < BUDGET
+
+    found = importtime("-m", "pytest_tdd.script", "--help")
+    assert not HEAVY & set(found)
+
+
+def test_help():
+    from click.testing import CliRunner
+
+    from pytest_tdd import cache, script
+
+    result = CliRunner().invoke(script.main, ["--help"])
+    assert result.exit_code == 0
+    assert f"${cache.CACHE_DIR_ENV}" in result.output
+    assert f"default {cache.CACHE_DIR}" in result.output
@@ -7,6 +7,8 @@ import textwrap
 import xml.etree.ElementTree as ET
 from pathlib import Path
 
+import pytest
+
 from pytest_tdd import tdd
 
 
@@ -158,3 +160,239 @@ def test_process(resolver):
         == "file-name run 4 tests with 1 failures and 0 errors, covered 3 lines out "
         "of 4 (75.0%, missing=1 lines)"
     )
+
+
+def test_resolver(mktree):
+    rootdir = mktree(
+        """
+├── pkgA/
+│   ├── src/
+│   │   └── liba/
+│   │       ├── __init__.py
+│   │       └── core.py
+│   └── tests/
+│       └── test_core.py
+├── pkgB/
+│   ├── src/
+│   │   ├── libb/
+│   │   │   └── core.py
+│   │   └── vendored/
+│   │       └── src/
+│   │           └── core.py
+│   └── tests/
+│       └── test_core.py
+└── tests/
+    └── test_core.py
+"""
+    )
+    resolver = tdd.Resolver(
+        [rootdir / "pkgA/src", rootdir / "pkgB/src", rootdir / "pkgB/src/vendored/src"],
+        [rootdir / "pkgA/tests", rootdir / "pkgB/tests", rootdir / "tests"],
+    )
+
+    assert resolver.root(rootdir / "pkgA/src/liba/core.py") == rootdir / "pkgA/src"
+    assert resolver.root(rootdir / "pkgB/src/vendored/src/core.py") == rootdir / "pkgB/src/vendored/src"
+    assert resolver.root(rootdir / "tests/test_core.py") is None
+
+    assert resolver.module(rootdir / "pkgA/src/liba/core.py") == "liba.core"
+    assert resolver.module(rootdir / "pkgA/src/liba/__init__.py") == "liba"
+    assert resolver.module(rootdir / "pkgB/src/libb/core.py") == "libb.core"  # namespace package
+    assert resolver.module(rootdir / "pkgB/src/vendored/src/core.py") == "core"
+    pytest.raises(ValueError, resolver.module, rootdir / "tests/test_core.py")
+
+    # paired tests dirs, or all of them
+    assert resolver.tests_dirs(rootdir / "pkgB/src/libb/core.py") == [rootdir / "pkgB/tests"]
+    assert len(resolver.tests_dirs(rootdir / "pkgB/src/vendored/src/core.py")) == 3
+
+    found = set(
+        str(p.relative_to(rootdir)).replace(os.sep, "/")
+        for p in resolver.candidates(rootdir / "pkgA/src/liba/core.py", sibling_testdir=False)
+    )
+    assert found == {"pkgA/tests/liba/test_core.py", "pkgA/tests/test_core.py"}
+
+
+def test_main_batch(mktree, monkeypatch):
+    from click.testing import CliRunner
+
+    from pytest_tdd import script
+
+    rootdir = mktree(
+        """
+├── pkgA/
+│   ├── src/
+│   │   └── liba/
+│   │       ├── __init__.py
+│   │       └── core.py
+│   └── tests/
+│       └── test_core.py
+└── pkgB/
+    ├── src/
+    │   └── libb/
+    │       ├── __init__.py
+    │       └── util.py
+    └── tests/
+        └── test_util.py
+"""
+    )
+    (rootdir / "pkgA/src/liba/core.py").write_text("def f():\n    return 1\n")
+    (rootdir / "pkgA/tests/test_core.py").write_text("from liba import core\ndef test_f():\n    assert core.f() == 1\n")
+    (rootdir / "pkgB/src/libb/util.py").write_text("def g():\n    return 2\n")
+    (rootdir / "pkgB/tests/test_util.py").write_text("from libb import util\ndef test_g():\n    assert util.g() == 3\n")
+    monkeypatch.chdir(rootdir)
+
+    result = CliRunner().invoke(script.main, [
+        "-s", "pkgA/src", "-t", "pkgA/tests", "-s", "pkgB/src", "-t", "pkgB/tests",
+        "--cache-dir", str(rootdir / "cache"),
+        "pkgA/src/liba/core.py", "pkgB/src/libb/util.py",
+    ])
+    assert result.exit_code == 1, result.output
+    assert result.output.split("\n")[-3:] == [
+        "core.py run 1 tests with 0 failures and 0 errors, covered 2 lines out of 2 (100.0%, missing=0 lines)",
+        "util.py run 1 tests with 1 failures and 0 errors, covered 2 lines out of 2 (100.0%, missing=0 lines)",
+        "",
+    ]
+
+    result = CliRunner().invoke(script.main, ["-s", "pkgA/src", "-t", "pkgA/tests", "pkgB/src/libb/util.py"])
+    assert result.exit_code == 2
+    assert "is not under any of the sources dirs" in result.output
+
+
+def test_main_roots_index(mktree, monkeypatch):
+    from click.testing import CliRunner
+
+    from pytest_tdd import script
+
+    rootdir = mktree(
+        """
+    pkgA/src/liba/__init__.py
+    pkgA/src/liba/core.py
+    pkgA/tests/test_core.py
+    pkgB/src/libb/__init__.py
+    pkgB/src/libb/util.py
+    pkgB/tests/test_special.py
+    """
+    )
+    (rootdir / "pkgA/src/liba/core.py").write_text("def f():\n    return 1\n")
+    (rootdir / "pkgA/tests/test_core.py").write_text("from liba import core\ndef test_f():\n    assert core.f() == 1\n")
+    (rootdir / "pkgB/src/libb/util.py").write_text("def g():\n    return 2\n")
+    # found through its hint only
+    (rootdir / "pkgB/tests/test_special.py").write_text(
+        "# tdd: pkgB/src/libb/util.py\nfrom libb import util\ndef test_g():\n    assert util.g() == 2\n"
+    )
+    monkeypatch.chdir(rootdir)
+
+    # the index (shared by the runs) is first built from pkgA only
+    result = CliRunner().invoke(script.main, ["-s", "pkgA/src", "-t", "pkgA/tests", "pkgA/src/liba/core.py"])
+    assert result.exit_code == 0, result.output
+
+    result = CliRunner().invoke(script.main, [
+        "-s", "pkgA/src", "-t", "pkgA/tests", "-s", "pkgB/src", "-t", "pkgB/tests", "pkgB/src/libb/util.py",
+    ])
+    assert result.exit_code == 0, result.output
+    assert result.output.strip().split("\n")[-1].startswith("util.py run 1 tests with 0 failures")
+
+
+def test_listing(tmp_path):
+    from unittest import mock
+
+    (tmp_path / "tests").mkdir()
+    (tmp_path / "tests" / "test_a.py").write_text("")
+
+    listing = tdd.Listing()
+    with mock.patch.object(tdd.os, "scandir", wraps=os.scandir) as scandir:
+        assert listing.exists(tmp_path / "tests" / "test_a.py")
+        assert not listing.exists(tmp_path / "tests" / "test_b.py")
+        assert not listing.exists(tmp_path / "missing" / "test_a.py")
+        assert scandir.call_count == 2
+
+    # unchanged
+    assert listing.refresh() == 0
+
+    (tmp_path / "tests" / "test_b.py").write_text("")
+    os.utime(tmp_path / "tests", ns=(0, 1))
+    assert not listing.exists(tmp_path / "tests" / "test_b.py")
+    assert listing.refresh() == 1
+    assert listing.exists(tmp_path / "tests" / "test_b.py")
+
+    (tmp_path / "missing").mkdir()
+    (tmp_path / "missing" / "test_a.py").write_text("")
+    listing.invalidate(tmp_path / "missing")
+    assert listing.exists(tmp_path / "missing" / "test_a.py")
+
+    listing.invalidate()
+    assert not listing.dirs
+
+
+def test_lookup_sources(mktree):
+    from pytest_tdd import index
+
+    rootdir = mktree(
+        """
+├── src/
+│   └── package/
+│       ├── __init__.py
+│       ├── modA.py
+│       ├── special.py
+│       └── sub/
+│           ├── modB.py
+│           ├── modC.py
+│           └── tests/
+│               └── test_modC.py
+└── tests/
+    ├── package/
+    │   └── test_modA.py
+    ├── test_modB.py
+    └── test_odd.py
+"""
+    )
+    (rootdir / "src/package/special.py").write_text("# tdd: tests/test_odd.py\n")
+    resolver = tdd.Resolver([rootdir / "src"], [rootdir / "tests"])
+
+    def lookup(path, idx=None):
+        found = tdd.lookup_sources(rootdir / path, resolver, idx)
+        return [str(p.relative_to(rootdir)).replace(os.sep, "/") for p in found]
+
+    # naming rules only
+    assert lookup("tests/package/test_modA.py") == ["src/package/modA.py"]
+    assert lookup("src/package/sub/tests/test_modC.py") == ["src/package/sub/modC.py"]
+    assert lookup("tests/test_modB.py") == []
+    assert lookup("tests/test_odd.py") == []
+
+    # using the index
+    idx = index.build(rootdir, [rootdir / "src"], [rootdir / "tests"])
+    assert lookup("tests/test_modB.py", idx) == ["src/package/sub/modB.py"]
+    assert lookup("tests/test_odd.py", idx) == ["src/package/special.py"]
+
+    # recorded coverage
+    assert idx.record(rootdir / "tests/test_odd.py", [rootdir / "src/package/__init__.py"])
+    assert not idx.record(rootdir / "tests/test_odd.py", [rootdir / "src/package/__init__.py"])
+    assert lookup("tests/test_odd.py", idx) == ["src/package/special.py", "src/package/__init__.py"]
+
+
+def test_main_test_file(mktree, monkeypatch):
+    from click.testing import CliRunner
+
+    from pytest_tdd import index, script
+
+    rootdir = mktree(
+        """
+├── src/
+│   └── liba/
+│       ├── __init__.py
+│       └── core.py
+└── tests/
+    └── test_core.py
+"""
+    )
+    (rootdir / "src/liba/core.py").write_text("def f():\n    return 1\n\ndef g():\n    return 2\n")
+    (rootdir / "tests/test_core.py").write_text("from liba import core\ndef test_f():\n    assert core.f() == 1\n")
+    monkeypatch.chdir(rootdir)
+
+    result = CliRunner().invoke(script.main, ["--cache-dir", "cache", "tests/test_core.py"])
+    assert result.exit_code == 0, result.output
+    assert result.output.strip().split("\n")[-1] == (
+        "test_core.py run 1 tests with 0 failures and 0 errors, covered 3 lines out of 4 (75.0%, missing=1 lines)"
+    )
+
+    idx = index.load(rootdir / "cache" / "index.json")
+    assert idx.covers == {"tests/test_core.py": ["src/liba/core.py"]}
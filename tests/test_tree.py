@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import collections
+import hashlib
 import os
 import sys
 from pathlib import Path
@@ -74,6 +75,15 @@ EXPECTED = """\
         └── xxx
 """
 
+TREE_TXT = """
+└── my-project/
+    ├── src/
+    │   └── my_package/
+    │       └── module1.py
+    └── tests/
+        └── test_module1.py
+"""
+
 
 def counting(root: ptree.Node) -> dict[ptree.Kind, int]:
     counters = {ptree.Kind.DIR: 0,
@@ -316,3 +326,342 @@ def test_conftest(mktree):
         ptree.Kind.FILE: 2,
         ptree.Kind.DIR: 4 + 1,
     }
+
+
+def test_parse_stream(tmp_path):
+    txt = ptree.dumps(ptree.parse(TREE_TXT))
+
+    # from an open file
+    (tmp_path / "layout.txt").write_text(txt, encoding="utf-8")
+    with (tmp_path / "layout.txt").open(encoding="utf-8") as fp:
+        root = ptree.parse(fp)
+    assert ptree.dumps(root) == txt
+
+    # from a generator of lines
+    root = ptree.parse(line for line in txt.split("\n"))
+    assert ptree.dumps(root) == txt
+    assert counting(root) == {
+        ptree.Kind.DIR: 5,  # it includes the root node
+        ptree.Kind.FILE: 2
+    }
+
+
+def test_parse_invalid():
+    pytest.raises(ptree.LocationError, ptree.parse, """\
+└── src/
+        └── toodeep.py
+""")
+    pytest.raises(ptree.InvalidNodeType, ptree.parse, """\
+└── src
+    └── module1.py
+""")
+
+
+def test_snapshot(mktree, tmp_path):
+    srcdir = mktree(TREE, subpath="src")
+    root = ptree.create(srcdir)
+
+    path = ptree.save(tmp_path / "layout.bin", root)
+    with ptree.load(path) as snap:
+        assert len(snap) == 35
+
+        index = snap.find("package2/subpackageD/tests/test_modD.py")
+        assert snap.xpath(index) == ["", "package2", "subpackageD", "tests", "test_modD.py"]
+        assert snap.kind(index) == ptree.Kind.FILE
+        assert snap.find("package2/subpackageD/tests/") == snap.parent(index)
+        assert snap.find(["package2", "subpackageD", "nope.py"]) is None
+
+        node = snap.node(snap.find("src/package1/"))
+        assert ptree.dumps(node) == ptree.dumps(ptree.find(root, "src/package1/"))
+        assert ptree.dumps(snap.node()) == ptree.dumps(root)
+
+
+def test_snapshot_unsorted(tmp_path):
+    root = ptree.Node("", ptree.Kind.DIR)
+    ptree.find(root, "zzz/b.py", create=True)
+    ptree.find(root, "zzz/a.py", create=True)
+    ptree.find(root, "aaa/", create=True)
+
+    with ptree.load(ptree.save(tmp_path / "layout.bin", root)) as snap:
+        assert snap.xpath(snap.find("zzz/a.py")) == ["", "zzz", "a.py"]
+        assert snap.find("aaa") == 2
+        assert ptree.dumps(snap.node()) == ptree.dumps(root)
+
+    (tmp_path / "garbage.bin").write_bytes(b"garbage")
+    pytest.raises(ptree.SnapshotError, ptree.load, tmp_path / "garbage.bin")
+    (tmp_path / "empty.bin").write_bytes(b"")
+    pytest.raises(ptree.SnapshotError, ptree.load, tmp_path / "empty.bin")
+
+
+def test_diff(mktree):
+    srcdir = mktree(TREE, subpath="src")
+    old = ptree.create(srcdir, stat=True, digest=True)
+    assert not ptree.diff(old, ptree.create(srcdir, digest=True))
+
+    (srcdir / "src/package1/modA.py").write_text("print('hello')")
+    (srcdir / "package2/subpackageD/modH.py").unlink()
+    (srcdir / "tests/package1/test_modA.py").unlink()
+    (srcdir / "tests/package1/test_modA.py").mkdir()
+    (srcdir / "zoo/bar").mkdir(parents=True)
+    (srcdir / "zoo/bar/xxx.py").write_text("")
+
+    changes = ptree.diff(old, ptree.create(srcdir, digest=True))
+    found = [(c.status.value, str(c.path).replace(os.sep, "/"), c.kind) for c in changes]
+    assert found == [
+        ("removed", "package2/subpackageD/modH.py", ptree.Kind.FILE),
+        ("changed", "src/package1/modA.py", ptree.Kind.FILE),
+        ("removed", "tests/package1/test_modA.py", ptree.Kind.FILE),
+        ("added", "tests/package1/test_modA.py", ptree.Kind.DIR),
+        ("added", "zoo", ptree.Kind.DIR),
+        ("added", "zoo/bar", ptree.Kind.DIR),
+        ("added", "zoo/bar/xxx.py", ptree.Kind.FILE),
+    ]
+
+    # structure only
+    changes = ptree.diff(ptree.create(srcdir), ptree.create(srcdir))
+    assert not changes
+
+
+def test_diff_snapshot(mktree, tmp_path):
+    from pytest_tdd import tdd
+
+    srcdir = mktree(TREE, subpath="src")
+    ptree.save(tmp_path / "layout.bin", ptree.create(srcdir, stat=True, digest=True))
+
+    (srcdir / "src/package1/modB.py").write_text("print('hello')")
+    (srcdir / "src/package1/modZ.py").write_text("")
+    with ptree.load(tmp_path / "layout.bin") as snap:
+        index = snap.find("src/package1/modB.py")
+        assert snap.digest(index) == hashlib.sha256(b"").hexdigest()
+        assert snap.size(index) == 0
+        assert snap.mtime(index) is not None
+        # the directories have a digest too (package2 is unchanged)
+        assert snap.digest(snap.find("package2/")) == ptree.create(srcdir / "package2", digest=True).digest
+        changes = ptree.diff(snap.node(), ptree.create(srcdir, digest=True))
+
+    assert tdd.changed_sources(changes, srcdir, srcdir / "src") == [
+        srcdir / "src/package1/modB.py",
+        srcdir / "src/package1/modZ.py",
+    ]
+
+
+@pytest.mark.parametrize("workers", [0, None])
+def test_merkle(mktree, workers):
+    srcdir = mktree(TREE, subpath="src")
+    root = ptree.create(srcdir, digest=True, workers=workers)
+    assert root.digest
+    # the same content, the same digest (wherever it is)
+    subtree = ptree.create(srcdir / "src/package1/subpackageA", digest=True)
+    assert ptree.find(root, "src/package1/subpackageA/").digest == subtree.digest
+
+    (srcdir / "src/package1/subpackageA/modC.py").write_text("print('hello')")
+    new = ptree.create(srcdir, digest=True, workers=workers)
+    for loc in ["src/package1/subpackageA/", "src/package1/", "src/"]:
+        assert ptree.find(new, loc).digest != ptree.find(root, loc).digest
+    assert ptree.find(new, "package2/").digest == ptree.find(root, "package2/").digest
+    assert new.digest != root.digest
+
+    # recomputed from the file digests only
+    digests = {str(node.path): node.digest for node in [new, *ptree.find(new, "src/").children]}
+    for node in ptree.find(new, "src/").children:
+        node.digest = None if node.kind == ptree.Kind.DIR else node.digest
+    new.digest = None
+    assert ptree.merkle(new) == digests["."]
+    assert {str(node.path): node.digest for node in [new, *ptree.find(new, "src/").children]} == digests
+
+    # a file without digest leaves its parents without digest
+    ptree.find(new, "src/package1/modA.py").digest = None
+    assert ptree.merkle(new) is None
+    assert ptree.find(new, "package2/").digest is not None
+
+
+def test_diff_merkle(mktree):
+    srcdir = mktree(TREE, subpath="src")
+    old = ptree.create(srcdir, digest=True)
+    new = ptree.create(srcdir, digest=True)
+    # an equal subtree digest is trusted, its content isn't compared
+    ptree.find(new, "package2/modF.py").digest = "garbage"
+    assert not ptree.diff(old, new)
+    new.digest = ptree.find(new, "package2/").digest = None
+    assert [str(c.path) for c in ptree.diff(old, new)] == [str(Path("package2/modF.py"))]
+
+
+def test_create_incremental(mktree, tmp_path):
+    srcdir = mktree(TREE, subpath="src")
+    ptree.save(tmp_path / "layout.bin", ptree.create(srcdir, stat=True, digest=True))
+    (srcdir / "src/package1/modB.py").write_text("print('hello')")
+    os.utime(srcdir / "src/package1/modB.py", (1, 1))
+    with ptree.load(tmp_path / "layout.bin") as snap:
+        previous = snap.node()
+
+    with mock.patch.object(ptree, "file_digest", wraps=ptree.file_digest) as hashed:
+        root = ptree.create(srcdir, digest=True, previous=previous)
+    assert [call.args[0] for call in hashed.call_args_list] == [srcdir / "src/package1/modB.py"]
+    assert root.digest == ptree.create(srcdir, digest=True).digest
+    changes = ptree.diff(previous, root)
+    assert [(c.status.value, str(c.path)) for c in changes] == [("changed", str(Path("src/package1/modB.py")))]
+
+
+@pytest.mark.parametrize("workers", [0, None])
+def test_write_data(tmp_path, workers):
+    root = ptree.parse(TREE_TXT)
+    ptree.find(root, "my-project/src/my_package/module1.py").data = "print('hello')\n"
+    ptree.find(root, "my-project/tests/test_module1.py").data = b"\x00\x01"
+    for i in range(10):
+        ptree.find(root, f"my-project/data/file{i:02}.txt", create=True).data = f"{i}"
+
+    ptree.write(tmp_path, root, workers=workers, batch=3)
+    assert (tmp_path / "my-project/src/my_package/module1.py").read_text() == "print('hello')\n"
+    assert (tmp_path / "my-project/tests/test_module1.py").read_bytes() == b"\x00\x01"
+    assert (tmp_path / "my-project/data/file07.txt").read_text() == "7"
+    assert len(getfiles(tmp_path)) == 17
+
+    # writing a sub tree keeps its location
+    ptree.write(tmp_path / "sub", ptree.find(root, "my-project/tests/"))
+    assert getfiles(tmp_path / "sub") == [
+        Path("my-project"), Path("my-project/tests"), Path("my-project/tests/test_module1.py")
+    ]
+
+
+def test_plot():
+    import io
+
+    root = ptree.parse(TREE_TXT)
+    txt = ptree.plot(root, io.StringIO()).getvalue()
+    assert txt.count("[label=") == 7
+    assert txt.count(" -> ") == 6
+    assert '  "n-00000" -> "n-00001"' in txt
+
+    # collapse by depth
+    txt = ptree.plot(root, io.StringIO(), depth=2).getvalue()
+    assert txt.count("[label=") == 6
+    assert '[label="…1 files", shape=box, style=dashed]' in txt
+
+    # collapse by number of children
+    txt = ptree.plot(root, io.StringIO(), max_children=1).getvalue()
+    assert txt.count("[label=") == 3
+    assert '[label="…2 files", shape=box, style=dashed]' in txt
+
+    # subtree only
+    txt = ptree.plot(root, io.StringIO(), subpath="my-project/src/").getvalue()
+    assert txt.split("\n")[1:-2] == [
+        '  "n-00000" [label="src"]',
+        '  "n-00001" [label="my_package"]',
+        '  "n-00000" -> "n-00001"',
+        '  "n-00002" [label="module1.py"]',
+        '  "n-00001" -> "n-00002"',
+    ]
+    pytest.raises(ptree.LocationError, ptree.plot, root, io.StringIO(), subpath="nope/")
+
+
+@pytest.mark.parametrize(
+    "pattern, expected",
+    [
+        ("tests/test_modG.py", ["tests/test_modG.py"]),
+        ("tests/*.py", ["tests/test_modD.py", "tests/test_modG.py"]),
+        ("*/package1/", ["src/package1", "tests/package1"]),
+        ("**/tests/**/test_*.py", [
+            "package2/subpackageD/tests/test_modD.py", "src/package1/subpackageB/tests/test_modD.py",
+            "tests/package1/subpackageB/test_modC.py", "tests/package1/test_modA.py",
+            "tests/subpackageC/test_modG.py", "tests/test_modD.py", "tests/test_modG.py",
+        ]),
+        ("**/test_mod[!D].py", [
+            "tests/package1/subpackageB/test_modC.py", "tests/package1/test_modA.py",
+            "tests/subpackageC/test_modG.py", "tests/test_modG.py",
+        ]),
+        ("**/mod?.py", [
+            "package2/modF.py", "package2/subpackageC/modG.py", "package2/subpackageD/modH.py",
+            "src/package1/modA.py", "src/package1/modB.py", "src/package1/subpackageA/modC.py",
+            "src/package1/subpackageB/modD.py", "src/package1/subpackageB/modE.py",
+        ]),
+        ("src/**", [
+            "src/package1", "src/package1/__init__.py", "src/package1/modA.py", "src/package1/modB.py",
+            "src/package1/subpackageA", "src/package1/subpackageA/__init__.py", "src/package1/subpackageA/modC.py",
+            "src/package1/subpackageB", "src/package1/subpackageB/__init__.py", "src/package1/subpackageB/modD.py",
+            "src/package1/subpackageB/modE.py", "src/package1/subpackageB/tests",
+            "src/package1/subpackageB/tests/test_modD.py",
+        ]),
+        ("**/subpackage?/", ["package2/subpackageC", "package2/subpackageD", "src/package1/subpackageA",
+                             "src/package1/subpackageB", "tests/package1/subpackageB", "tests/subpackageC"]),
+        ("missing/**", []),
+    ],
+)
+def test_select(mktree, pattern, expected):
+    root = ptree.create(mktree(TREE, subpath="src"))
+    assert sorted("/".join(node.xpath[1:]) for node in ptree.select(root, pattern)) == expected
+
+
+def test_select_index():
+    root = ptree.parse(TREE_TXT)
+    assert root.index is None
+    found = ptree.select(root, "**/*.py")
+    assert [node.name for node in found] == ["module1.py", "test_module1.py"]
+    index = root.index
+    assert index is not None
+    assert ptree.select(root, "**/*.py", lambda node: node.name.startswith("test_")) == found[1:]
+    assert ptree.select(root, "**/")[-1].name == "tests"
+    assert root.index is index
+
+    # changing the tree drops the index
+    ptree.find(root, "my-project/tests/test_module2.py", create=True)
+    assert root.index is None
+    assert [node.name for node in ptree.select(root, "**/tests/*.py")] == ["test_module1.py", "test_module2.py"]
+    tests = ptree.find(root, "my-project/tests/")
+    assert [node.name for node in ptree.select(tests, "*")] == ["test_module1.py", "test_module2.py"]
+    tests.append(ptree.Node("test_module3.py", ptree.Kind.FILE))
+    assert tests.index is None
+    assert root.index is None
+    assert len(ptree.select(root, "**/tests/*.py")) == 3
+
+
+@pytest.mark.parametrize("link", [False, True])
+def test_clone(tmp_path, link):
+    src = tmp_path / "src"
+    ptree.write(src, ptree.parse(TREE_TXT))
+    (src / "my-project/src/my_package/module1.py").write_text("print('hello')\n")
+    (src / "my-project/empty").mkdir()
+
+    dst = ptree.clone(src, tmp_path / "dst", link=link)
+    assert getfiles(dst) == getfiles(src)
+    assert (dst / "my-project/src/my_package/module1.py").read_text() == "print('hello')\n"
+    shared = (dst / "my-project/src/my_package/module1.py").stat().st_ino == (
+        src / "my-project/src/my_package/module1.py"
+    ).stat().st_ino
+    assert shared == link
+
+    # merging over an existing clone
+    ptree.clone(src, dst, link=link)
+    assert getfiles(dst) == getfiles(src)
+
+
+def test_clone_fallback(tmp_path):
+    src = tmp_path / "src"
+    ptree.write(src, ptree.parse(TREE_TXT))
+    (src / "my-project/tests/test_module1.py").write_bytes(b"x" * 100_000)
+    with mock.patch.dict(ptree._CLONE, {"reflink": False, "copy_file_range": False}):
+        dst = ptree.clone(src, tmp_path / "dst")
+    assert (dst / "my-project/tests/test_module1.py").read_bytes() == b"x" * 100_000
+
+
+def test_templates(tmp_path):
+    templates = ptree.Templates(tmp_path / "templates")
+    root = ptree.parse(TREE_TXT)
+    ptree.find(root, "my-project/src/my_package/module1.py").data = "print('hello')\n"
+
+    with mock.patch.object(ptree, "write", wraps=ptree.write) as written:
+        first = templates.create(tmp_path / "first", root)
+        second = templates.create(tmp_path / "second", ptree.parse(ptree.dumps(root)))
+        third = templates.create(tmp_path / "third", root)
+    # the same layout with different data is a different template
+    assert written.call_count == 2
+    assert len(list((tmp_path / "templates").iterdir())) == 2
+
+    assert getfiles(first) == getfiles(second) == getfiles(third)
+    assert (third / "my-project/src/my_package/module1.py").read_text() == "print('hello')\n"
+    assert (second / "my-project/src/my_package/module1.py").read_text() == ""
+
+    # the clones are independent from the template
+    (third / "my-project/src/my_package/module1.py").write_text("changed")
+    assert (templates.create(tmp_path / "fourth", root) / "my-project/src/my_package/module1.py").read_text() == (
+        "print('hello')\n"
+    )